@@ -0,0 +1,36 @@
+"""store job exception as json object
+
+Revision ID: 5a9f3c0d7e21
+Revises: e41b6c2a9d07
+Create Date: 2020-02-03 09:41:17.661842
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9f3c0d7e21'
+down_revision = 'e41b6c2a9d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Exceptions used to be saved as JSON encoded strings inside the JSONB
+    # column and decoded again every time a job was serialized
+    op.execute("UPDATE job SET exception = (exception #>> '{}')::jsonb "
+               "WHERE jsonb_typeof(exception) = 'string'")
+    # Results of jobs that didn't return a JobResult were also saved as JSON
+    # encoded strings. Results of StrJobResult are plain strings that are
+    # not JSON, so only decode strings that contain a JSON object or array
+    op.execute("UPDATE job_result SET result = (result #>> '{}')::jsonb "
+               "WHERE jsonb_typeof(result) = 'string' "
+               "AND (result #>> '{}') ~ '^\\s*[\\[{]'")
+
+
+def downgrade():
+    op.execute("UPDATE job SET exception = to_jsonb(exception::text) "
+               "WHERE jsonb_typeof(exception) = 'object'")
+    # Decoded job results are not encoded again. Results that were already
+    # stored as objects can't be told apart from the decoded ones, and the
+    # previous revision returns results as stored so objects are read fine
@@ -4,14 +4,16 @@ from typing import Optional
 from flask import request, make_response
 from flask_restplus import Resource, Namespace, fields
 from sqlalchemy import func
-from nornir.core.filter import F
 
-import cnaas_nms.confpush.nornir_helper
 import cnaas_nms.confpush.init_device
 import cnaas_nms.confpush.sync_devices
 import cnaas_nms.confpush.underlay
-from cnaas_nms.api.generic import build_filter, empty_result
-from cnaas_nms.db.device import Device, DeviceState, DeviceType
+import cnaas_nms.confpush.get
+from cnaas_nms.api.generic import build_filter, build_keyset_filter, empty_result, \
+    json_response, next_cursor, stream_ndjson
+from cnaas_nms.confpush.nornir_plugins.cnaas_inventory import inventory_cache
+from cnaas_nms.confpush.config_snapshot import get_snapshot, save_snapshot, SnapshotPhase
+from cnaas_nms.db.device import Device, DeviceState, DeviceType, device_serializer
 from cnaas_nms.db.session import sqla_session
 from cnaas_nms.db.settings import get_groups
 from cnaas_nms.scheduler.scheduler import Scheduler
@@ -57,10 +59,24 @@ device_init_model = device_init_api.model('device_init', {
     'hostname': fields.String(required=False),
     'device_type': fields.String(required=False)})
 
+device_init_bulk_model = device_init_api.model('device_init_bulk', {
+    'devices': fields.List(fields.Nested(device_init_api.model('device_init_bulk_device', {
+        'device_id': fields.Integer(required=True),
+        'hostname': fields.String(required=True)})), required=True),
+    'device_type': fields.String(required=True)})
+
 device_discover_model = device_discover_api.model('device_discover', {
     'ztp_mac': fields.String(required=True),
     'dhcp_ip': fields.String(required=True)})
 
+devices_generate_config_model = devices_api.model('devices_generate_config', {
+    'hostname': fields.String(required=False),
+    'device_type': fields.String(required=False),
+    'group': fields.String(required=False),
+    'all': fields.Boolean(required=False),
+    'use_cache': fields.Boolean(required=False)
+})
+
 device_syncto_model = device_syncto_api.model('device_sync', {
     'hostname': fields.String(required=False),
     'device_type': fields.String(required=False),
@@ -153,19 +169,40 @@ class DeviceApi(Resource):
 class DevicesApi(Resource):
     @jwt_required
     def get(self):
-        """ Get all devices """
+        """ Get all devices. Use fields to only return some columns, cursor
+        for keyset pagination or format=ndjson to stream all matching devices """
         data = {'devices': []}
-        total_count = 0
-        with sqla_session() as session:
-            query = session.query(Device, func.count(Device.id).over().label('total'))
-            query = build_filter(Device, query)
-            for instance in query:
-                data['devices'].append(instance.Device.as_dict())
-                total_count = instance.total
-
-        resp = make_response(json.dumps(empty_result(status='success', data=data)), 200)
-        resp.headers['X-Total-Count'] = total_count
-        resp.headers['Content-Type'] = 'application/json'
+        total_count = None
+        cursor = None
+        try:
+            fields = device_serializer.parse_fields(request.args.get('fields'))
+            columns = device_serializer.query_columns(fields)
+            convert = device_serializer.row_converter(fields)
+            if request.args.get('format') == 'ndjson':
+                return stream_ndjson(Device, columns, convert)
+            with sqla_session() as session:
+                if 'cursor' in request.args:
+                    query = build_keyset_filter(Device, session.query(*columns))
+                    last_id = None
+                    for row in query:
+                        data['devices'].append(convert(row))
+                        last_id = row[0]
+                    cursor = next_cursor(len(data['devices']), last_id)
+                else:
+                    total_count = 0
+                    query = session.query(*columns, func.count(Device.id).over().label('total'))
+                    query = build_filter(Device, query)
+                    for row in query:
+                        data['devices'].append(convert(row[:-1]))
+                        total_count = row.total
+        except ValueError as e:
+            return empty_result(status='error', data=str(e)), 400
+
+        resp = json_response(empty_result(status='success', data=data))
+        if total_count is not None:
+            resp.headers['X-Total-Count'] = total_count
+        if cursor is not None:
+            resp.headers['X-Next-Cursor'] = cursor
         return resp
 
 
@@ -215,6 +252,55 @@ class DeviceInitApi(Resource):
         return res
 
 
+class DeviceInitBulkApi(Resource):
+    @jwt_required
+    @device_init_api.expect(device_init_bulk_model)
+    def post(self):
+        """ Init several devices in one job """
+        json_data = request.get_json()
+
+        if 'devices' not in json_data or not isinstance(json_data['devices'], list) \
+                or not json_data['devices']:
+            return empty_result(status='error', data="POST data must include a list of 'devices'"), 400
+        device_ids = []
+        new_hostnames = []
+        for device in json_data['devices']:
+            if not isinstance(device, dict) or 'device_id' not in device or 'hostname' not in device:
+                return empty_result(
+                    status='error',
+                    data="Each item in 'devices' must include 'device_id' and 'hostname'"), 400
+            if not isinstance(device['device_id'], int):
+                return empty_result(status='error', data="'device_id' must be an integer"), 400
+            if not Device.valid_hostname(device['hostname']):
+                return empty_result(
+                    status='error',
+                    data=f"Provided hostname '{device['hostname']}' is not valid"), 400
+            device_ids.append(device['device_id'])
+            new_hostnames.append(device['hostname'])
+        if len(set(device_ids)) != len(device_ids) or len(set(new_hostnames)) != len(new_hostnames):
+            return empty_result(status='error', data="Device IDs and hostnames must be unique"), 400
+
+        if 'device_type' not in json_data:
+            return empty_result(status='error', data="POST data must include 'device_type'"), 400
+        device_type = str(json_data['device_type']).upper()
+        if device_type != DeviceType.ACCESS.name:
+            return empty_result(status='error',
+                                data="Only device_type ACCESS can be initialized in bulk"), 400
+
+        scheduler = Scheduler()
+        job_id = scheduler.add_onetime_job(
+            'cnaas_nms.confpush.init_device:init_access_devices_step1',
+            when=1,
+            scheduled_by=get_jwt_identity(),
+            kwargs={'device_ids': device_ids,
+                    'new_hostnames': new_hostnames})
+
+        res = empty_result(data=f"Scheduled job to initialize device_ids { device_ids }")
+        res['job_id'] = job_id
+
+        return res
+
+
 class DeviceDiscoverApi(Resource):
     @jwt_required
     @device_discover_api.expect(device_discover_model)
@@ -229,8 +315,8 @@ class DeviceDiscoverApi(Resource):
         ztp_mac = json_data['ztp_mac']
         dhcp_ip = json_data['dhcp_ip']
 
-        job_id = cnaas_nms.confpush.init_device.schedule_discover_device(
-            ztp_mac=ztp_mac, dhcp_ip=dhcp_ip, iteration=1,
+        job_id = cnaas_nms.confpush.init_device.queue_discover_device(
+            ztp_mac=ztp_mac, dhcp_ip=dhcp_ip,
             scheduled_by=get_jwt_identity())
 
         logger.debug(f"Discover device for ztp_mac {ztp_mac} scheduled as ID {job_id}")
@@ -288,9 +374,7 @@ class DeviceSyncApi(Resource):
                 return empty_result(status='error', data='Could not find a group with name {}'.format(group_name))
             kwargs['group'] = group_name
             what = 'group {}'.format(group_name)
-            nr = cnaas_nms.confpush.nornir_helper.cnaas_init()
-            nr_filtered = nr.filter(F(groups__contains=group_name))
-            total_count = len(nr_filtered.inventory.hosts)
+            total_count = len(inventory_cache.get_group_hostnames(group_name))
         elif 'all' in json_data and isinstance(json_data['all'], bool) and json_data['all']:
             what = "all devices"
             with sqla_session() as session:
@@ -342,12 +426,18 @@ class DeviceConfigApi(Resource):
                 data=f"Invalid hostname specified"
             ), 400
 
+        # A saved config artifact is only returned if it was rendered from
+        # the same templates, settings and device data, this is checked by
+        # generate_artifact so the returned config is never stale
         try:
-            config, template_vars = cnaas_nms.confpush.sync_devices.generate_only(hostname)
+            config, template_vars, render_result = \
+                cnaas_nms.confpush.sync_devices.generate_artifact(hostname)
             result['data']['config'] = {
                 'hostname': hostname,
                 'generated_config': config,
-                'available_variables': template_vars
+                'available_variables': template_vars,
+                'artifact_key': render_result.artifact_key if render_result else None,
+                'cached': render_result.cached if render_result else False
             }
         except Exception as e:
             logger.exception(f"Exception while generating config for device {hostname}")
@@ -359,12 +449,106 @@ class DeviceConfigApi(Resource):
         return result
 
 
+class DevicesGenerateConfigApi(Resource):
+    @jwt_required
+    @devices_api.expect(devices_generate_config_model)
+    def post(self):
+        """ Start job to generate config for devices """
+        json_data = request.get_json()
+        kwargs: dict = {}
+
+        if 'hostname' in json_data:
+            hostname = str(json_data['hostname'])
+            if not Device.valid_hostname(hostname):
+                return empty_result(
+                    status='error',
+                    data=f"Hostname '{hostname}' is not a valid hostname"
+                ), 400
+            kwargs['hostname'] = hostname
+        elif 'device_type' in json_data:
+            devtype_str = str(json_data['device_type']).upper()
+            if not DeviceType.has_name(devtype_str):
+                return empty_result(
+                    status='error',
+                    data=f"Invalid device type '{json_data['device_type']}' specified"
+                ), 400
+            kwargs['device_type'] = devtype_str
+        elif 'group' in json_data:
+            group_name = str(json_data['group'])
+            if group_name not in get_groups():
+                return empty_result(status='error', data='Could not find a group with name {}'.format(group_name)), 400
+            kwargs['group'] = group_name
+        elif 'all' not in json_data or not isinstance(json_data['all'], bool) \
+                or not json_data['all']:
+            return empty_result(
+                status='error',
+                data="No devices to generate config for was specified"
+            ), 400
+        if 'use_cache' in json_data and isinstance(json_data['use_cache'], bool):
+            kwargs['use_cache'] = json_data['use_cache']
+
+        scheduler = Scheduler()
+        job_id = scheduler.add_onetime_job(
+            'cnaas_nms.confpush.sync_devices:generate_configs',
+            when=1,
+            scheduled_by=get_jwt_identity(),
+            kwargs=kwargs)
+
+        res = empty_result(data="Scheduled job to generate config for devices")
+        res['job_id'] = job_id
+
+        return res
+
+
+class DeviceCurrentConfigApi(Resource):
+    @jwt_required
+    def get(self, hostname: str):
+        """ Get latest known running configuration of device """
+        result = empty_result()
+        result['data'] = {'config': None}
+        if not Device.valid_hostname(hostname):
+            return empty_result(
+                status='error',
+                data="Invalid hostname specified"
+            ), 400
+        with sqla_session() as session:
+            dev: Device = session.query(Device). \
+                filter(Device.hostname == hostname).one_or_none()
+            if not dev or dev.state != DeviceState.MANAGED:
+                return empty_result(
+                    status='error',
+                    data=f"Hostname '{hostname}' not found or is not a managed device"
+                ), 404
+
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        try:
+            snapshot = None
+            if not refresh:
+                snapshot = get_snapshot(hostname)
+            if not snapshot:
+                running_config = cnaas_nms.confpush.get.get_running_config(hostname)
+                snapshot = save_snapshot(hostname, running_config['config']['running'],
+                                         SnapshotPhase.MANUAL)
+            result['data']['config'] = snapshot.as_dict()
+        except Exception as e:
+            logger.exception(f"Exception while getting config for device {hostname}")
+            return empty_result(
+                status='error',
+                data="Exception while getting config for device {}: {} {}".format(
+                    hostname, type(e), str(e))
+            ), 500
+
+        return result
+
+
 # Devices
 device_api.add_resource(DeviceByIdApi, '/<int:device_id>')
 device_api.add_resource(DeviceConfigApi, '/<string:hostname>/generate_config')
+device_api.add_resource(DeviceCurrentConfigApi, '/<string:hostname>/current_config')
 device_api.add_resource(DeviceApi, '')
 devices_api.add_resource(DevicesApi, '')
+devices_api.add_resource(DevicesGenerateConfigApi, '/generate_config')
 device_init_api.add_resource(DeviceInitApi, '/<int:device_id>')
+device_init_api.add_resource(DeviceInitBulkApi, '')
 device_discover_api.add_resource(DeviceDiscoverApi, '')
 device_syncto_api.add_resource(DeviceSyncApi, '')
-# device/<string:hostname>/current_config
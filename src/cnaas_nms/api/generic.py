@@ -1,14 +1,23 @@
 import re
+from typing import Callable, Optional
 
-from flask import request
+from flask import request, make_response, Response, stream_with_context
 import sqlalchemy
 
+from cnaas_nms.db.serializer import dumps
+from cnaas_nms.db.session import sqla_session
+
 
 FILTER_RE = re.compile(r"^filter\[([a-zA-Z0-9_.]+)\](\[[a-z]+\])?$")
 DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 100
+# Keyset pagination doesn't get slower for later pages, so allow larger pages
+MAX_PER_PAGE_CURSOR = 1000
+# Number of rows fetched from database at a time when streaming
+STREAM_BATCH_SIZE = 1000
 
 
-def limit_results() -> int:
+def limit_results(max_per_page: int = MAX_PER_PAGE) -> int:
     """Find number of results to limit query to, either by user requested
     param or a default value."""
     limit = DEFAULT_PER_PAGE
@@ -17,7 +26,7 @@ def limit_results() -> int:
     if 'per_page' in args:
         try:
             per_page_arg = int(args['per_page'])
-            limit = max(1, min(100, per_page_arg))
+            limit = max(1, min(max_per_page, per_page_arg))
         except:
             pass
 
@@ -48,9 +57,13 @@ def offset_results() -> int:
     return offset
 
 
-def build_filter(f_class, query: sqlalchemy.orm.query.Query):
-    """Generate SQLalchemy filter based on query string and return
-    filtered query.
+def filter_query(f_class, query: sqlalchemy.orm.query.Query):
+    """Apply filters from query string to query, without sorting or
+    pagination.
+
+    Returns:
+        Tuple of filtered query, requested sort attribute (or None) and
+        sqlalchemy asc or desc
     Raises:
         ValueError
     """
@@ -96,6 +109,16 @@ def build_filter(f_class, query: sqlalchemy.orm.query.Query):
 
         query = query.filter(f_class_op(value))
 
+    return query, f_class_order_by_field, order
+
+
+def build_filter(f_class, query: sqlalchemy.orm.query.Query):
+    """Generate SQLalchemy filter based on query string and return
+    filtered query.
+    Raises:
+        ValueError
+    """
+    query, f_class_order_by_field, order = filter_query(f_class, query)
     if f_class_order_by_field:
         query = query.order_by(order(f_class_order_by_field))
     else:
@@ -108,6 +131,103 @@ def build_filter(f_class, query: sqlalchemy.orm.query.Query):
     return query
 
 
+def apply_cursor(f_class, query: sqlalchemy.orm.query.Query, order, cursor: Optional[int]):
+    """Only return rows after cursor, ordered by id."""
+    id_field = getattr(f_class, 'id')
+    if cursor is not None:
+        if order == sqlalchemy.desc:
+            query = query.filter(id_field < cursor)
+        else:
+            query = query.filter(id_field > cursor)
+    return query.order_by(order(id_field))
+
+
+def parse_keyset_args(f_class, query: sqlalchemy.orm.query.Query):
+    """Apply filters and parse sort and cursor arguments for keyset
+    pagination.
+
+    Returns:
+        Tuple of filtered query, sqlalchemy asc or desc and cursor or None
+    Raises:
+        ValueError
+    """
+    query, f_class_order_by_field, order = filter_query(f_class, query)
+    if f_class_order_by_field is not None and f_class_order_by_field.key != 'id':
+        raise ValueError("Only sorting on id is supported with cursor pagination")
+    if order is None:
+        order = sqlalchemy.asc
+    cursor = None
+    if request.args.get('cursor'):
+        try:
+            cursor = int(request.args['cursor'])
+        except ValueError:
+            raise ValueError("Invalid cursor: {}".format(request.args['cursor']))
+    return query, order, cursor
+
+
+def build_keyset_filter(f_class, query: sqlalchemy.orm.query.Query):
+    """Generate SQLalchemy filter based on query string and return a
+    filtered query that is paginated using the cursor argument instead of
+    page. Results are sorted by id, descending if sort=-id, and cursor is the
+    id of the last item on the previous page. Unlike offset pagination the
+    database does not have to read and skip the rows of all previous pages.
+    Raises:
+        ValueError
+    """
+    query, order, cursor = parse_keyset_args(f_class, query)
+    query = apply_cursor(f_class, query, order, cursor)
+    return query.limit(limit_results(MAX_PER_PAGE_CURSOR))
+
+
+def next_cursor(num_items: int, last_id: Optional[int]) -> Optional[int]:
+    """Get cursor for the page after a page of num_items items, or None if
+    this was the last page."""
+    if num_items and num_items >= limit_results(MAX_PER_PAGE_CURSOR):
+        return last_id
+    return None
+
+
+def stream_ndjson(f_class, columns: list, convert: Callable[[tuple], dict]) -> Response:
+    """Stream all rows matching filters from query string as newline
+    delimited JSON. Rows are fetched in batches using keyset pagination so
+    memory use doesn't grow with the number of rows.
+
+    Args:
+        f_class: Model class to filter on
+        columns: Columns to query, the first column must be id
+        convert: Function to convert a row to a JSON serializable dict
+
+    Raises:
+        ValueError
+    """
+    with sqla_session() as session:
+        # Validate arguments before the response is started
+        parse_keyset_args(f_class, session.query(*columns))
+
+    def generate():
+        cursor = None
+        while True:
+            with sqla_session() as session:
+                query, order, first_cursor = parse_keyset_args(f_class, session.query(*columns))
+                query = apply_cursor(f_class, query, order,
+                                     first_cursor if cursor is None else cursor)
+                rows = query.limit(STREAM_BATCH_SIZE).all()
+            for row in rows:
+                yield dumps(convert(row)) + b'\n'
+            if len(rows) < STREAM_BATCH_SIZE:
+                break
+            cursor = rows[-1][0]
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def json_response(result: dict, status: int = 200):
+    """Make a JSON response, encoded with orjson if it's installed."""
+    resp = make_response(dumps(result), status)
+    resp.headers['Content-Type'] = 'application/json'
+    return resp
+
+
 def empty_result(status='success', data=None):
     if status == 'success':
         return {
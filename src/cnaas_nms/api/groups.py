@@ -5,7 +5,7 @@ from flask_jwt_extended import jwt_required
 
 from cnaas_nms.db.device import Device
 from cnaas_nms.api.generic import empty_result
-from cnaas_nms.db.settings import get_groups
+from cnaas_nms.db.settings import get_group_matcher
 from cnaas_nms.db.session import sqla_session
 from cnaas_nms.version import __api_version__
 
@@ -15,20 +15,9 @@ api = Namespace('groups', description='API for handling groups',
 
 
 def groups_populate(group_name: Optional[str] = None):
-    tmpgroups: dict = {}
     with sqla_session() as session:
-        devices: List[Device] = session.query(Device).all()
-        for dev in devices:
-            groups = get_groups(dev.hostname)
-            if not groups:
-                continue
-            for group in groups:
-                if group_name and group != group_name:
-                    continue
-                if group not in tmpgroups:
-                    tmpgroups[group] = []
-                tmpgroups[group].append(dev.hostname)
-    return tmpgroups
+        hostnames: List[str] = [hostname for hostname, in session.query(Device.hostname)]
+    return get_group_matcher().get_members(hostnames, group_name)
 
 
 class GroupsApi(Resource):
@@ -4,10 +4,10 @@ from flask import request
 from flask_restplus import Resource, Namespace, fields
 from flask_jwt_extended import jwt_required
 
-from cnaas_nms.api.generic import empty_result
+from cnaas_nms.api.generic import empty_result, json_response
 from cnaas_nms.db.session import sqla_session
 from cnaas_nms.db.device import Device
-from cnaas_nms.db.interface import Interface, InterfaceConfigType
+from cnaas_nms.db.interface import Interface, InterfaceConfigType, interface_serializer
 from cnaas_nms.db.settings import get_settings
 from cnaas_nms.version import __api_version__
 from cnaas_nms.confpush.sync_devices import resolve_vlanid, resolve_vlanid_list
@@ -29,11 +29,9 @@ class InterfaceApi(Resource):
             if not dev:
                 return empty_result('error', "Device not found"), 404
             result['data']['hostname'] = dev.hostname
-            intfs = session.query(Interface).filter(Interface.device == dev).all()
-            intf: Interface
-            for intf in intfs:
-                result['data']['interfaces'].append(intf.as_dict())
-        return result
+            intfs = session.query(Interface).filter(Interface.device == dev)
+            result['data']['interfaces'] = interface_serializer.serialize_many(intfs)
+        return json_response(result)
 
     @jwt_required
     def put(self, hostname):
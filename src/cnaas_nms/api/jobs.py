@@ -1,12 +1,12 @@
-import json
-from flask import request, make_response
+from flask import request
 from flask_restplus import Resource, Namespace, fields
 from flask_jwt_extended import jwt_required
 from sqlalchemy import func
 
-from cnaas_nms.api.generic import empty_result, build_filter
+from cnaas_nms.api.generic import empty_result, build_filter, build_keyset_filter, \
+    filter_query, json_response, next_cursor
 from cnaas_nms.db.job import Job
-from cnaas_nms.db.joblock import Joblock
+from cnaas_nms.db.joblock import Joblock, joblock_serializer
 from cnaas_nms.db.session import sqla_session
 from cnaas_nms.version import __api_version__
 
@@ -26,19 +26,35 @@ job_model = job_api.model('jobs', {'name': fields.String(required=True)})
 class JobsApi(Resource):
     @jwt_required
     def get(self):
-        """ Get one or more jobs """
+        """ Get one or more jobs, only summary columns are returned.
+        Use cursor for keyset pagination, which is faster for large job tables
+        but doesn't return X-Total-Count """
         data = {'jobs': []}
-        total_count = 0
-        with sqla_session() as session:
-            query = session.query(Job, func.count(Job.id).over().label('total'))
-            query = build_filter(Job, query)
-            for instance in query:
-                data['jobs'].append(instance.Job.as_dict())
-                total_count = instance.total
-
-        resp = make_response(json.dumps(empty_result(status='success', data=data)), 200)
-        resp.headers['X-Total-Count'] = total_count
-        resp.headers['Content-Type'] = 'application/json'
+        total_count = None
+        cursor = None
+        try:
+            with sqla_session() as session:
+                query = Job.summary_query(session)
+                if 'cursor' in request.args:
+                    query = build_keyset_filter(Job, query)
+                    for job in query:
+                        data['jobs'].append(job.as_dict(summary=True))
+                    cursor = next_cursor(len(data['jobs']),
+                                         data['jobs'][-1]['id'] if data['jobs'] else None)
+                else:
+                    query = build_filter(Job, query)
+                    count_query, _, _ = filter_query(Job, session.query(func.count(Job.id)))
+                    total_count = count_query.scalar()
+                    for job in query:
+                        data['jobs'].append(job.as_dict(summary=True))
+        except ValueError as e:
+            return empty_result(status='error', data=str(e)), 400
+
+        resp = json_response(empty_result(status='success', data=data))
+        if total_count is not None:
+            resp.headers['X-Total-Count'] = total_count
+        if cursor is not None:
+            resp.headers['X-Next-Cursor'] = cursor
         return resp
 
 
@@ -49,7 +65,7 @@ class JobByIdApi(Resource):
         with sqla_session() as session:
             job = session.query(Job).filter(Job.id == job_id).one_or_none()
             if job:
-                return empty_result(data={'jobs': [job.as_dict()]})
+                return json_response(empty_result(data={'jobs': [job.as_dict()]}))
             else:
                 return empty_result(status='error', data="No job with id {} found".format(job_id)), 400
 
@@ -60,9 +76,8 @@ class JobLockApi(Resource):
         """ Get job locks """
         locks = []
         with sqla_session() as session:
-            for lock in session.query(Joblock).all():
-                locks.append(lock.as_dict())
-        return empty_result('success', data={'locks': locks})
+            locks = joblock_serializer.serialize_many(session.query(Joblock))
+        return json_response(empty_result('success', data={'locks': locks}))
 
     @jwt_required
     @job_api.expect(job_model)
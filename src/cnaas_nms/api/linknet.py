@@ -2,9 +2,9 @@ from flask import request
 from flask_restplus import Resource, Namespace, fields
 from flask_jwt_extended import jwt_required
 
-from cnaas_nms.api.generic import empty_result
+from cnaas_nms.api.generic import empty_result, json_response
 from cnaas_nms.db.session import sqla_session
-from cnaas_nms.db.linknet import Linknet
+from cnaas_nms.db.linknet import Linknet, linknet_serializer
 from cnaas_nms.db.device import Device
 from cnaas_nms.confpush.underlay import find_free_infra_linknet
 from cnaas_nms.version import __api_version__
@@ -28,9 +28,8 @@ class LinknetsApi(Resource):
         result = {'linknets': []}
         with sqla_session() as session:
             query = session.query(Linknet)
-            for instance in query:
-                result['linknets'].append(instance.as_dict())
-        return empty_result(status='success', data=result)
+            result['linknets'] = linknet_serializer.serialize_many(query)
+        return json_response(empty_result(status='success', data=result))
 
     @jwt_required
     @api.expect(linknet_model)
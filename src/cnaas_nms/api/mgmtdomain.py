@@ -1,10 +1,11 @@
 from flask import request
 from flask_restplus import Resource, Namespace, fields
 from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import joinedload
 
 from ipaddress import IPv4Interface
 
-from cnaas_nms.api.generic import build_filter, empty_result, limit_results
+from cnaas_nms.api.generic import build_filter, empty_result, json_response, limit_results
 from cnaas_nms.db.device import Device
 from cnaas_nms.db.mgmtdomain import Mgmtdomain
 from cnaas_nms.db.session import sqla_session
@@ -94,11 +95,12 @@ class MgmtdomainsApi(Resource):
         result['data'] = {'mgmtdomains': []}
         filter_exp = None
         with sqla_session() as session:
-            query = session.query(Mgmtdomain)
+            query = session.query(Mgmtdomain).options(
+                joinedload(Mgmtdomain.device_a), joinedload(Mgmtdomain.device_b))
             query = build_filter(Mgmtdomain, query).limit(limit_results())
             for instance in query:
                 result['data']['mgmtdomains'].append(instance.as_dict())
-        return result
+        return json_response(result)
 
     @jwt_required
     @api.expect(mgmtdomain_model)
@@ -1,3 +1,4 @@
+import json
 import pprint
 import shutil
 import yaml
@@ -42,6 +43,21 @@ class ApiTests(unittest.TestCase):
         # The one result should have the same ID we asked for
         self.assertEqual(result.json['data']['devices'][0]['hostname'], hostname)
 
+    def test_get_devices_fields_cursor(self):
+        result = self.client.get('/api/v1.0/devices?fields=hostname,state&per_page=1&cursor=')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(result.json['data']['devices']), 1)
+        self.assertEqual(set(result.json['data']['devices'][0].keys()), {'hostname', 'state'})
+        self.assertIn('X-Next-Cursor', result.headers)
+        result = self.client.get('/api/v1.0/devices?fields=password')
+        self.assertEqual(result.status_code, 400)
+
+    def test_get_devices_ndjson(self):
+        result = self.client.get('/api/v1.0/devices?format=ndjson&fields=hostname')
+        self.assertEqual(result.status_code, 200)
+        hostnames = [json.loads(line)['hostname'] for line in result.data.splitlines()]
+        self.assertIn('eosdist1', hostnames)
+
     def test_get_last_job(self):
         result = self.client.get('/api/v1.0/jobs?per_page=1')
 
@@ -52,6 +68,27 @@ class ApiTests(unittest.TestCase):
         # Exactly one result
         self.assertEqual(len(result.json['data']['jobs']), 1)
 
+    def test_get_jobs_cursor(self):
+        result = self.client.get('/api/v1.0/jobs?per_page=1&sort=-id&cursor=')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(result.json['data']['jobs']), 1)
+        # Listings only contain summary columns
+        self.assertNotIn('result', result.json['data']['jobs'][0])
+        self.assertNotIn('X-Total-Count', result.headers)
+        cursor = result.headers['X-Next-Cursor']
+        self.assertEqual(int(cursor), result.json['data']['jobs'][0]['id'])
+        result = self.client.get('/api/v1.0/jobs?per_page=1&sort=-id&cursor={}'.format(cursor))
+        self.assertEqual(result.status_code, 200)
+        for job in result.json['data']['jobs']:
+            self.assertLess(job['id'], int(cursor))
+
+    def test_get_jobs_page(self):
+        result = self.client.get('/api/v1.0/jobs?per_page=1&sort=-scheduled_time')
+        self.assertEqual(result.status_code, 200)
+        self.assertLessEqual(len(result.json['data']['jobs']), 1)
+        self.assertIn('X-Total-Count', result.headers)
+        self.assertNotIn('X-Next-Cursor', result.headers)
+
     def test_get_managementdomain(self):
         result = self.client.get('/api/v1.0/mgmtdomains?per_page=1')
         # 200 OK
@@ -1,10 +1,23 @@
+import io
 import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Pattern, Tuple
 
 
 line_start = r"^[+-][ ]*"
 line_start_remove = r"^-[ ]*"
 DEFAULT_LINE_SCORE = 1.0
-# Stops looking after first match. Only searches a single line at a time.
+# Name used in hit counts for changed lines that didn't match any pattern
+DEFAULT_PATTERN_NAME = 'default'
+# Regex flags that are kept for each pattern in the combined regex
+SCOPED_FLAGS_LETTERS = ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'),
+                        (re.DOTALL, 's'), (re.VERBOSE, 'x'))
+SCOPED_FLAGS = re.IGNORECASE | re.MULTILINE | re.DOTALL | re.VERBOSE
+GLOBAL_FLAGS_RE = re.compile(r"^\(\?[aiLmsux]+\)")
+# Stops looking after first match. Only searches a single line at a time,
+# patterns with a 'block' regex only match lines inside a config block whose
+# header line (or junos [edit ...] path) matches the block regex.
 change_patterns = [
     {
         'name': 'description',
@@ -32,14 +45,165 @@ change_patterns = [
         'modifier': 50.0
     },
 ]
-# TODO: multiline patterns / block-aware config
+
+
+@dataclass
+class ChangeScore:
+    score: float
+    changed_lines: int
+    config_lines: int
+    # Number of changed lines matched by each pattern name
+    hits: Dict[str, int] = field(default_factory=dict)
+
+
+class ChangeScorer(object):
+    """Score diffs using a list of change patterns.
+
+    All line patterns are compiled into one regex with a named group per
+    pattern, alternatives are tried in list order so the first matching
+    pattern wins just like when trying the patterns one by one. Patterns
+    limited to a block are only included in the regex used for lines inside
+    a matching block, one regex is compiled and cached for each combination
+    of active blocks."""
+    def __init__(self, patterns: List[dict], default_score: float = DEFAULT_LINE_SCORE):
+        self.patterns = patterns
+        self.default_score = default_score
+        self._lock = threading.Lock()
+        self._combined: Dict[FrozenSet[int],
+                             Tuple[Optional[Pattern], List[Tuple[int, int]]]] = {}
+        self._block_patterns = [(index, pattern['block']) for index, pattern in enumerate(patterns)
+                                if pattern.get('block') is not None]
+        # Check flags of all patterns up front instead of when first used
+        for pattern in patterns:
+            self._get_source(pattern['regex'])
+
+    @staticmethod
+    def _get_source(pattern: Pattern) -> str:
+        """Get the source of pattern for use inside the combined regex, with
+        the flags of pattern kept as a scoped flag group.
+
+        Raises:
+            ValueError: If pattern uses flags that can't be scoped
+        """
+        flags = pattern.flags & ~re.UNICODE
+        if flags & ~SCOPED_FLAGS:
+            raise ValueError("Change pattern {!r} uses unsupported regex flags".format(
+                pattern.pattern))
+        source = GLOBAL_FLAGS_RE.sub('', pattern.pattern, count=1)
+        if source.startswith('^'):
+            source = source[1:]
+        if flags:
+            letters = ''.join(letter for flag, letter in SCOPED_FLAGS_LETTERS if flags & flag)
+            source = '(?{}:{})'.format(letters, source)
+        return source
+
+    def _get_combined(self, active_blocks: FrozenSet[int]) -> \
+            Tuple[Optional[Pattern], List[Tuple[int, int]]]:
+        """Get combined regex for lines inside active_blocks, and a list of
+        (group index, pattern index) for the named groups in the regex."""
+        cached = self._combined.get(active_blocks)
+        if cached is not None:
+            return cached
+        with self._lock:
+            if active_blocks in self._combined:
+                return self._combined[active_blocks]
+            alternatives = []
+            for index, pattern in enumerate(self.patterns):
+                if pattern.get('block') is not None and index not in active_blocks:
+                    continue
+                alternatives.append((index, self._get_source(pattern['regex'])))
+            if not alternatives:
+                self._combined[active_blocks] = (None, [])
+                return self._combined[active_blocks]
+            regex = re.compile('^(?:{})'.format('|'.join(
+                '(?P<p{}>{})'.format(index, source) for index, source in alternatives)))
+            groups = [(regex.groupindex['p{}'.format(index)], index) for index, _ in alternatives]
+            self._combined[active_blocks] = (regex, groups)
+            return self._combined[active_blocks]
+
+    def match_line(self, line: str, active_blocks: FrozenSet[int] = frozenset()) -> \
+            Optional[int]:
+        """Get index of the first pattern matching a changed line."""
+        regex, groups = self._get_combined(active_blocks)
+        if regex is None:
+            return None
+        match = regex.match(line)
+        if not match:
+            return None
+        for group, index in groups:
+            if match.start(group) != -1:
+                return index
+        return None
+
+    def line_score(self, line: str, active_blocks: FrozenSet[int] = frozenset()) -> float:
+        index = self.match_line(line, active_blocks)
+        if index is None:
+            return self.default_score
+        return 1 * self.patterns[index]['modifier']
+
+    def _header_blocks(self, header: str) -> FrozenSet[int]:
+        return frozenset(index for index, block in self._block_patterns if block.match(header))
+
+    def score(self, config: str, diff: str) -> ChangeScore:
+        """Calculate a score based on how much and what configurations were
+        changed in the diff, see calculate_score."""
+        changed_lines = 0
+        total_line_score = 0.0
+        hits: Dict[str, int] = {}
+        # Stack of (indentation, blocks matched by header) for the config
+        # blocks the current line is inside of
+        block_stack: List[Tuple[int, FrozenSet[int]]] = []
+        active_blocks: FrozenSet[int] = frozenset()
+        for line in io.StringIO(diff):
+            line = line.rstrip('\n')
+            if self._block_patterns:
+                content = line[1:]
+                stripped = content.lstrip(' ')
+                if line.startswith('[edit'):
+                    # Junos diffs show the path of changed blocks instead of
+                    # the block header lines
+                    block_stack = [(-1, self._header_blocks(line[5:].rstrip(']').strip()))]
+                elif stripped:
+                    indent = len(content) - len(stripped)
+                    while block_stack and block_stack[-1][0] >= indent:
+                        block_stack.pop()
+                    active_blocks = frozenset().union(*(blocks for _, blocks in block_stack))
+                    block_stack.append((indent, self._header_blocks(stripped)))
+            if line.startswith('+') or line.startswith('-'):
+                changed_lines += 1
+                index = self.match_line(line, active_blocks)
+                if index is None:
+                    total_line_score += self.default_score
+                    name = DEFAULT_PATTERN_NAME
+                else:
+                    total_line_score += 1 * self.patterns[index]['modifier']
+                    name = self.patterns[index]['name']
+                hits[name] = hits.get(name, 0) + 1
+
+        config_lines = config.count('\n') + 1
+        changed_ratio = changed_lines / float(config_lines)
+
+        # Calculate score, 20% based on number of lines changed, 80% on individual
+        # line score with applied modifiers
+        return ChangeScore(
+            score=(changed_ratio*100*0.2) + (total_line_score*0.8),
+            changed_lines=changed_lines,
+            config_lines=config_lines,
+            hits=hits
+        )
+
+
+change_scorer = ChangeScorer(change_patterns)
 
 
 def calculate_line_score(line: str):
-    for pattern in change_patterns:
-        if re.match(pattern['regex'], line):
-            return 1 * pattern['modifier']
-    return DEFAULT_LINE_SCORE
+    return change_scorer.line_score(line)
+
+
+def score_change(config: str, diff: str) -> ChangeScore:
+    """Calculate change score for a diff, including the number of changed
+    lines matched by each pattern."""
+    return change_scorer.score(config, diff)
 
 
 def calculate_score(config: str, diff: str) -> float:
@@ -53,18 +217,4 @@ def calculate_score(config: str, diff: str) -> float:
     Returns:
         Calculated score, can be much higher than 100.0
     """
-    config_lines = config.split('\n')
-    diff_lines = diff.split('\n')
-    changed_lines = 0
-    total_line_score = 0.0
-    for line in diff_lines:
-        if line.startswith('+') or line.startswith('-'):
-            changed_lines += 1
-            total_line_score += calculate_line_score(line)
-
-    changed_ratio = changed_lines / float(len(config_lines))
-
-    # Calculate score, 20% based on number of lines changed, 80% on individual
-    # line score with applied modifiers
-
-    return (changed_ratio*100*0.2) + (total_line_score*0.8)
+    return change_scorer.score(config, diff).score
@@ -0,0 +1,94 @@
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from cnaas_nms.db.session import db_pool_size
+from cnaas_nms.tools.get_apidata import get_apidata
+
+
+# Default number of devices to work on in parallel for each job type
+DEFAULT_WORKERS = {
+    'default': 50,
+    'sync': 50,
+    'firmware': 50,
+    'init': 50,
+    'discover': 50,
+}
+# Database connections that device workers can never use, so that API
+# requests and other jobs can still get a connection during large jobs
+DEFAULT_DB_RESERVED_CONNECTIONS = 10
+
+
+class ConcurrencyManager(object):
+    """Decide how many devices nornir should work on in parallel.
+
+    The number of workers is set per job type, but tasks from all jobs in
+    this process also share a limit based on the size of the database
+    connection pool since most device tasks open their own database
+    session. Devices of one platform can also be limited separately, for
+    example if that platform is slow to handle many parallel logins."""
+    def __init__(self, workers: Optional[Dict[str, int]] = None,
+                 platform_limits: Optional[Dict[str, int]] = None,
+                 pool_size: int = 50,
+                 db_reserved: int = DEFAULT_DB_RESERVED_CONNECTIONS):
+        self.workers = dict(DEFAULT_WORKERS)
+        if workers:
+            self.workers.update({k: int(v) for k, v in workers.items()})
+        self.platform_limits = {k: int(v) for k, v in (platform_limits or {}).items()}
+        self.db_limit = max(1, pool_size - db_reserved)
+        self._lock = threading.Lock()
+        self._db_slots = threading.BoundedSemaphore(self.db_limit)
+        self._platform_slots: Dict[str, threading.BoundedSemaphore] = {}
+
+    def get_num_workers(self, job_type: str = 'default') -> int:
+        """Get number of nornir workers to use for a job type."""
+        workers = self.workers.get(job_type, self.workers['default'])
+        return max(1, min(workers, self.db_limit))
+
+    def _get_platform_slots(self, platform: str) -> Optional[threading.BoundedSemaphore]:
+        if platform not in self.platform_limits:
+            return None
+        with self._lock:
+            if platform not in self._platform_slots:
+                self._platform_slots[platform] = threading.BoundedSemaphore(
+                    max(1, self.platform_limits[platform]))
+            return self._platform_slots[platform]
+
+    @contextmanager
+    def device_slot(self, platform: str):
+        """Wait until this process has capacity to work on another device."""
+        platform_slots = self._get_platform_slots(platform)
+        if platform_slots:
+            platform_slots.acquire()
+        try:
+            with self._db_slots:
+                yield
+        finally:
+            if platform_slots:
+                platform_slots.release()
+
+    def limit_task(self, task):
+        """Wrap a nornir task so that it only runs when there is a free
+        device slot for the platform of the host."""
+        @functools.wraps(task)
+        def limited_task(nr_task, *args, **kwargs):
+            with self.device_slot(nr_task.host.platform):
+                return task(nr_task, *args, **kwargs)
+        return limited_task
+
+
+def get_concurrency_manager() -> ConcurrencyManager:
+    try:
+        apidata = get_apidata()
+    except Exception:
+        apidata = {}
+    return ConcurrencyManager(
+        workers=apidata.get('nornir_workers'),
+        platform_limits=apidata.get('nornir_platform_limits'),
+        pool_size=db_pool_size,
+        db_reserved=int(apidata.get('db_reserved_connections', DEFAULT_DB_RESERVED_CONNECTIONS))
+    )
+
+
+concurrency_manager = get_concurrency_manager()
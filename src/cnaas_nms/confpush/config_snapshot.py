@@ -0,0 +1,104 @@
+import enum
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+
+from cnaas_nms.confpush.get import calc_config_hash
+from cnaas_nms.db.session import get_redis_client
+
+
+# Seconds to keep a snapshot of device running config
+SNAPSHOT_TTL = 7 * 86400
+
+
+class SnapshotPhase(enum.Enum):
+    PRE_SYNC = 0
+    POST_SYNC = 1
+    MANUAL = 2
+
+    @classmethod
+    def has_value(cls, value):
+        return any(value == item.value for item in cls)
+
+    @classmethod
+    def has_name(cls, value):
+        return any(value == item.name for item in cls)
+
+
+@dataclass
+class ConfigSnapshot:
+    hostname: str
+    config: str
+    config_hash: str
+    phase: SnapshotPhase
+    job_id: Optional[int]
+    timestamp: datetime.datetime
+
+    def as_dict(self) -> dict:
+        return {
+            'hostname': self.hostname,
+            'config': self.config,
+            'config_hash': self.config_hash,
+            'phase': self.phase.name,
+            'job_id': self.job_id,
+            'timestamp': self.timestamp.isoformat()
+        }
+
+
+def get_snapshot_key(hostname: str) -> str:
+    return 'config_snapshot_{}'.format(hostname)
+
+
+def save_snapshot(hostname: str, config: str, phase: SnapshotPhase,
+                  job_id: Optional[int] = None) -> ConfigSnapshot:
+    """Save the latest known running config of a device."""
+    snapshot = ConfigSnapshot(
+        hostname=hostname,
+        config=config,
+        config_hash=calc_config_hash(hostname, config),
+        phase=phase,
+        job_id=job_id,
+        timestamp=datetime.datetime.utcnow()
+    )
+    key = get_snapshot_key(hostname)
+    db = get_redis_client()
+    with db.pipeline() as pipe:
+        pipe.delete(key)
+        pipe.hmset(key, {
+            'config': snapshot.config,
+            'config_hash': snapshot.config_hash,
+            'phase': snapshot.phase.name,
+            'job_id': snapshot.job_id if snapshot.job_id else '',
+            'timestamp': snapshot.timestamp.isoformat()
+        })
+        pipe.expire(key, SNAPSHOT_TTL)
+        pipe.execute()
+    return snapshot
+
+
+def get_snapshot(hostname: str, job_id: Optional[int] = None,
+                 phase: Optional[SnapshotPhase] = None) -> Optional[ConfigSnapshot]:
+    """Get the latest running config snapshot for a device. If job_id or
+    phase is specified only return the snapshot if it was saved by that job
+    or in that phase."""
+    data = get_redis_client().hgetall(get_snapshot_key(hostname))
+    if not data:
+        return None
+    data = {k.decode('utf-8'): v.decode('utf-8') for k, v in data.items()}
+    snapshot = ConfigSnapshot(
+        hostname=hostname,
+        config=data['config'],
+        config_hash=data['config_hash'],
+        phase=SnapshotPhase[data['phase']],
+        job_id=int(data['job_id']) if data['job_id'] else None,
+        timestamp=datetime.datetime.fromisoformat(data['timestamp'])
+    )
+    if job_id is not None and snapshot.job_id != job_id:
+        return None
+    if phase is not None and snapshot.phase != phase:
+        return None
+    return snapshot
+
+
+def delete_snapshot(hostname: str):
+    get_redis_client().delete(get_snapshot_key(hostname))
@@ -3,8 +3,9 @@ import cnaas_nms.confpush.nornir_helper
 from cnaas_nms.tools.log import get_logger
 from cnaas_nms.scheduler.scheduler import Scheduler
 from cnaas_nms.scheduler.wrapper import job_wrapper
+from cnaas_nms.scheduler.jobprogress import report_finished_device
 from cnaas_nms.confpush.nornir_helper import NornirJobResult
-from cnaas_nms.db.session import sqla_session, redis_session
+from cnaas_nms.db.session import sqla_session
 from cnaas_nms.db.device import DeviceType, Device
 
 from nornir.plugins.functions.text import print_result
@@ -227,8 +228,7 @@ def device_upgrade_task(task, job_id: str, reboot: False, filename: str,
             pass
 
     if job_id:
-        with redis_session() as db:
-            db.lpush('finished_devices_' + str(job_id), task.host.name)
+        report_finished_device(job_id, task.host.name)
 
 
 @job_wrapper
@@ -243,7 +243,7 @@ def device_upgrade(download: Optional[bool] = True,
                    reboot: Optional[bool] = False,
                    scheduled_by: Optional[str] = None) -> NornirJobResult:
 
-    nr = cnaas_nms.confpush.nornir_helper.cnaas_init()
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('firmware')
     if hostname:
         nr_filtered = nr.filter(name=hostname).filter(managed=True)
     elif group:
@@ -13,8 +13,9 @@ from nornir.plugins.tasks.networking import napalm_get
 
 import cnaas_nms.confpush.nornir_helper
 from cnaas_nms.db.session import sqla_session
-from cnaas_nms.db.device import Device, DeviceType
+from cnaas_nms.db.device import Device
 from cnaas_nms.db.linknet import Linknet
+from cnaas_nms.db.topology import get_topology
 from cnaas_nms.tools.log import get_logger
 from cnaas_nms.db.interface import Interface
 
@@ -96,16 +97,7 @@ def get_neighbors(hostname: Optional[str] = None, group: Optional[str] = None)\
 def get_uplinks(session, hostname: str) -> Tuple[List, List]:
     logger = get_logger()
     # TODO: check if uplinks are already saved in database?
-    uplinks = []
-    neighbor_hostnames = []
-
-    dev = session.query(Device).filter(Device.hostname == hostname).one()
-    for neighbor_d in dev.get_neighbors(session):
-        if neighbor_d.device_type == DeviceType.DIST:
-            local_if = dev.get_neighbor_local_ifname(session, neighbor_d)
-            if local_if:
-                uplinks.append({'ifname': local_if})
-                neighbor_hostnames.append(neighbor_d.hostname)
+    uplinks, neighbor_hostnames = get_topology(session).get_uplinks(hostname)
     logger.debug("Uplinks for device {} detected: {} neighbor_hostnames: {}". \
                  format(hostname, uplinks, neighbor_hostnames))
 
@@ -206,14 +198,20 @@ def update_inventory(hostname: str, site='default') -> dict:
         return diff
 
 
-def update_linknets(hostname):
+def update_linknets(hostname, neighbors: Optional[dict] = None):
     """Update linknet data for specified device using LLDP neighbor data.
+
+    Args:
+        hostname: Hostname of device to update linknets for
+        neighbors: Optional lldp_neighbors already fetched from the device,
+                   if not specified the device will be queried
     """
     logger = get_logger()
-    result = get_neighbors(hostname=hostname)[hostname][0]
-    if result.failed:
-        raise Exception
-    neighbors = result.result['lldp_neighbors']
+    if neighbors is None:
+        result = get_neighbors(hostname=hostname)[hostname][0]
+        if result.failed:
+            raise Exception
+        neighbors = result.result['lldp_neighbors']
 
     ret = []
 
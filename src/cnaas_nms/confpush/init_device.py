@@ -1,31 +1,58 @@
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from ipaddress import IPv4Interface
 
-from nornir.plugins.tasks import networking, text
+from nornir.plugins.tasks import networking
 from nornir.plugins.functions.text import print_result
 from nornir.core.inventory import ConnectionOptions
 from napalm.base.exceptions import SessionLockedException
-from apscheduler.job import Job
-import yaml
 import os
 
 import cnaas_nms.confpush.nornir_helper
 import cnaas_nms.confpush.get
 import cnaas_nms.db.helper
-from cnaas_nms.db.session import sqla_session
+from cnaas_nms.db.session import sqla_session, get_redis_client
 from cnaas_nms.db.device import Device, DeviceState, DeviceType, DeviceStateException
 from cnaas_nms.scheduler.scheduler import Scheduler
+from cnaas_nms.scheduler.prober import watch_devices, get_management_port
 from cnaas_nms.scheduler.wrapper import job_wrapper
 from cnaas_nms.confpush.nornir_helper import NornirJobResult
 from cnaas_nms.confpush.update import update_interfacedb
-from cnaas_nms.db.git import RepoStructureException
+from cnaas_nms.confpush.template_cache import get_entrypoint, template_file
 from cnaas_nms.db.settings import get_settings
 from cnaas_nms.plugins.pluginmanager import PluginManagerHandler
 from cnaas_nms.db.reservedip import ReservedIP
+from cnaas_nms.db.topology import get_topology
 from cnaas_nms.tools.log import get_logger
 from cnaas_nms.scheduler.thread_data import set_thread_data
 
 
+# Seconds to wait for more DHCP events before starting a batched discover job
+DISCOVER_BATCH_WINDOW = 5
+# Seconds before a scheduled batch that never started is considered lost
+DISCOVER_BATCH_TIMEOUT = 300
+DISCOVER_PENDING_KEY = 'discover_pending'
+DISCOVER_BATCH_JOB_KEY = 'discover_batch_job_id'
+DISCOVER_BATCH_LOCK_KEY = 'discover_batch_lock'
+
+
+def get_probe_address(dev: Device, ip: Optional[str] = None) -> Optional[Tuple[str, int]]:
+    """Get address and port to probe for reachability of device."""
+    if not ip:
+        ip = dev.management_ip if dev.management_ip else dev.dhcp_ip
+    if not ip:
+        return None
+    return str(ip), get_management_port(dev.platform, dev.port)
+
+
+def get_probe_addresses(session, device_ids: List[int]) -> List[Tuple[str, int]]:
+    addresses = []
+    for dev in session.query(Device).filter(Device.id.in_(device_ids)):
+        address = get_probe_address(dev)
+        if address:
+            addresses.append(address)
+    return addresses
+
+
 class ConnectionCheckError(Exception):
     pass
 
@@ -39,16 +66,7 @@ def push_base_management_access(task, device_variables, job_id):
     logger = get_logger()
     logger.debug("Push basetemplate for host: {}".format(task.host.name))
 
-    with open('/etc/cnaas-nms/repository.yml', 'r') as db_file:
-        repo_config = yaml.safe_load(db_file)
-        local_repo_path = repo_config['templates_local']
-
-    mapfile = os.path.join(local_repo_path, task.host.platform, 'mapping.yml')
-    if not os.path.isfile(mapfile):
-        raise RepoStructureException("File {} not found in template repo".format(mapfile))
-    with open(mapfile, 'r') as f:
-        mapping = yaml.safe_load(f)
-        template = mapping['ACCESS']['entrypoint']
+    template = get_entrypoint(task.host.platform, 'ACCESS')
 
     settings, settings_origin = get_settings(task.host.name, DeviceType.ACCESS)
 
@@ -63,10 +81,9 @@ def push_base_management_access(task, device_variables, job_id):
     # Merge dicts, this will overwrite interface list from settings
     template_vars = {**settings, **device_variables, **template_secrets}
 
-    r = task.run(task=text.template_file,
+    r = task.run(task=template_file,
                  name="Generate initial device config",
                  template=template,
-                 path=f"{local_repo_path}/{task.host.platform}",
                  **template_vars)
 
     #TODO: Handle template not found, variables not defined
@@ -83,6 +100,148 @@ def push_base_management_access(task, device_variables, job_id):
              )
 
 
+def push_base_management_access_batch(task, device_variables: Dict[str, dict], job_id):
+    """Push base management config to several devices in one nornir run,
+    device_variables is a dict with variables for each hostname."""
+    push_base_management_access(task, device_variables[task.host.name], job_id)
+
+
+def check_access_init_state(session, device_ids: List[int]) -> Dict[int, str]:
+    """Check that devices exist and are in the correct state to start init.
+
+    Returns:
+        Dict with current hostname for each device_id
+
+    Raises:
+        ValueError, DeviceStateException
+    """
+    devices = {dev.id: dev for dev in
+               session.query(Device).filter(Device.id.in_(device_ids))}
+    hostnames = {}
+    for device_id in device_ids:
+        dev: Device = devices.get(device_id)
+        if not dev:
+            raise ValueError(f"No device with id {device_id} found")
+        if dev.state != DeviceState.DISCOVERED:
+            raise DeviceStateException(
+                f"Device {device_id} must be in state DISCOVERED to begin init")
+        hostnames[device_id] = dev.hostname
+    return hostnames
+
+
+def allocate_access_management(session, device_id: int, new_hostname: str) -> \
+        Tuple[dict, IPv4Interface]:
+    """Find management domain and allocate management IP for an access device,
+    then move the device to state INIT with its new hostname.
+
+    Returns:
+        Variables for base management template and management gateway interface
+    """
+    logger = get_logger()
+    # Find management domain to use for this access switch
+    dev: Device = session.query(Device).filter(Device.id == device_id).one()
+    uplinks, neighbor_hostnames = get_topology(session).get_uplinks(dev.hostname)
+    logger.debug("Uplinks for device {} detected: {} neighbor_hostnames: {}".\
+                 format(device_id, uplinks, neighbor_hostnames))
+    # TODO: check compatability, same dist pair and same ports on dists
+    mgmtdomain = cnaas_nms.db.helper.find_mgmtdomain(session, neighbor_hostnames)
+    if not mgmtdomain:
+        raise Exception(
+            "Could not find appropriate management domain for uplink peer devices: {}".format(
+                neighbor_hostnames))
+    # Select a new management IP for the device
+    ReservedIP.clean_reservations(session, device=dev)
+    session.commit()
+    mgmt_ip = mgmtdomain.find_free_mgmt_ip(session)
+    if not mgmt_ip:
+        raise Exception("Could not find free management IP for management domain {}/{}".format(
+            mgmtdomain.id, mgmtdomain.description))
+    reserved_ip = ReservedIP(device=dev, ip=mgmt_ip)
+    session.add(reserved_ip)
+    # Populate variables for template rendering
+    mgmt_gw_ipif = IPv4Interface(mgmtdomain.ipv4_gw)
+    device_variables = {
+        'mgmt_ipif': str(IPv4Interface('{}/{}'.format(mgmt_ip, mgmt_gw_ipif.network.prefixlen))),
+        'mgmt_ip': str(mgmt_ip),
+        'mgmt_prefixlen': int(mgmt_gw_ipif.network.prefixlen),
+        'interfaces': [],
+        'mgmt_vlan_id': mgmtdomain.vlan,
+        'mgmt_gw': mgmt_gw_ipif.ip
+    }
+    for uplink in uplinks:
+        device_variables['interfaces'].append({
+            'name': uplink['ifname'],
+            'ifclass': 'ACCESS_UPLINK',
+        })
+    # Update device state
+    dev.state = DeviceState.INIT
+    dev.hostname = new_hostname
+    session.commit()
+    return device_variables, mgmt_gw_ipif
+
+
+def save_access_management_ip(device_id: int, hostname: str, device_variables: dict,
+                              mgmt_gw_ipif: IPv4Interface):
+    """Save allocated management IP after base management config was pushed."""
+    logger = get_logger()
+    with sqla_session() as session:
+        dev = session.query(Device).filter(Device.id == device_id).one()
+        dev.management_ip = device_variables['mgmt_ip']
+        # Remove the reserved IP since it's now saved in the device database instead
+        reserved_ip = session.query(ReservedIP).filter(ReservedIP.device == dev).one_or_none()
+        if reserved_ip:
+            session.delete(reserved_ip)
+
+    # Plugin hook, allocated IP
+    try:
+        pmh = PluginManagerHandler()
+        pmh.pm.hook.allocated_ipv4(vrf='mgmt', ipv4_address=device_variables['mgmt_ip'],
+                                   ipv4_network=str(mgmt_gw_ipif.network),
+                                   hostname=hostname
+                                   )
+    except Exception as e:
+        logger.exception("Error while running plugin hooks for allocated_ipv4: ".format(str(e)))
+
+
+def set_access_device_managed(device_id: int, hostname: str, facts: dict):
+    """Move an initialized access device to state MANAGED."""
+    logger = get_logger()
+    with sqla_session() as session:
+        dev: Device = session.query(Device).filter(Device.id == device_id).one()
+        dev.state = DeviceState.MANAGED
+        dev.device_type = DeviceType.ACCESS
+        dev.synchronized = False
+        dev.serial = facts['serial_number']
+        dev.vendor = facts['vendor']
+        dev.model = facts['model']
+        dev.os_version = facts['os_version']
+        management_ip = dev.management_ip
+        dev.dhcp_ip = None
+
+    # Plugin hook: new managed device
+    # Send: hostname , device type , serial , platform , vendor , model , os version
+    try:
+        pmh = PluginManagerHandler()
+        pmh.pm.hook.new_managed_device(
+            hostname=hostname,
+            device_type=DeviceType.ACCESS.name,
+            serial_number=facts['serial_number'],
+            vendor=facts['vendor'],
+            model=facts['model'],
+            os_version=facts['os_version'],
+            management_ip=str(management_ip)
+        )
+    except Exception as e:
+        logger.exception("Error while running plugin hooks for new_managed_device: ".format(str(e)))
+
+    try:
+        update_interfacedb(hostname, replace=True)
+    except Exception as e:
+        logger.exception(
+            "Exception while updating interface database for device {}: {}".\
+            format(hostname, str(e)))
+
+
 @job_wrapper
 def init_access_device_step1(device_id: int, new_hostname: str,
                              job_id: Optional[str] = None,
@@ -104,14 +263,9 @@ def init_access_device_step1(device_id: int, new_hostname: str,
     logger = get_logger()
     # Check that we can find device and that it's in the correct state to start init
     with sqla_session() as session:
-        dev: Device = session.query(Device).filter(Device.id == device_id).one_or_none()
-        if not dev:
-            raise ValueError(f"No device with id {device_id} found")
-        if dev.state != DeviceState.DISCOVERED:
-            raise DeviceStateException("Device must be in state DISCOVERED to begin init")
-        old_hostname = dev.hostname
+        old_hostname = check_access_init_state(session, [device_id])[device_id]
     # Perform connectivity check
-    nr = cnaas_nms.confpush.nornir_helper.cnaas_init()
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('init')
     nr_old_filtered = nr.filter(name=old_hostname)
     try:
         nrresult_old = nr_old_filtered.run(task=networking.napalm_get, getters=["facts"])
@@ -122,57 +276,12 @@ def init_access_device_step1(device_id: int, new_hostname: str,
         raise ConnectionCheckError(f"Failed to connect to device_id {device_id}")
 
     cnaas_nms.confpush.get.update_linknets(old_hostname)
-    uplinks = []
-    neighbor_hostnames = []
     with sqla_session() as session:
-        # Find management domain to use for this access switch
-        dev = session.query(Device).filter(Device.hostname == old_hostname).one()
-        for neighbor_d in dev.get_neighbors(session):
-            if neighbor_d.device_type == DeviceType.DIST:
-                local_if = dev.get_neighbor_local_ifname(session, neighbor_d)
-                if local_if:
-                    uplinks.append({'ifname': local_if})
-                    neighbor_hostnames.append(neighbor_d.hostname)
-        logger.debug("Uplinks for device {} detected: {} neighbor_hostnames: {}".\
-                     format(device_id, uplinks, neighbor_hostnames))
-        # TODO: check compatability, same dist pair and same ports on dists
-        mgmtdomain = cnaas_nms.db.helper.find_mgmtdomain(session, neighbor_hostnames)
-        if not mgmtdomain:
-            raise Exception(
-                "Could not find appropriate management domain for uplink peer devices: {}".format(
-                    neighbor_hostnames))
-        # Select a new management IP for the device
-        ReservedIP.clean_reservations(session, device=dev)
-        session.commit()
-        mgmt_ip = mgmtdomain.find_free_mgmt_ip(session)
-        if not mgmt_ip:
-            raise Exception("Could not find free management IP for management domain {}/{}".format(
-                mgmtdomain.id, mgmtdomain.description))
-        reserved_ip = ReservedIP(device=dev, ip=mgmt_ip)
-        session.add(reserved_ip)
-        # Populate variables for template rendering
-        mgmt_gw_ipif = IPv4Interface(mgmtdomain.ipv4_gw)
-        device_variables = {
-            'mgmt_ipif': str(IPv4Interface('{}/{}'.format(mgmt_ip, mgmt_gw_ipif.network.prefixlen))),
-            'mgmt_ip': str(mgmt_ip),
-            'mgmt_prefixlen': int(mgmt_gw_ipif.network.prefixlen),
-            'interfaces': [],
-            'mgmt_vlan_id': mgmtdomain.vlan,
-            'mgmt_gw': mgmt_gw_ipif.ip
-        }
-        for uplink in uplinks:
-            device_variables['interfaces'].append({
-                'name': uplink['ifname'],
-                'ifclass': 'ACCESS_UPLINK',
-            })
-        # Update device state
-        dev = session.query(Device).filter(Device.id == device_id).one()
-        dev.state = DeviceState.INIT
-        dev.hostname = new_hostname
-        session.commit()
-        hostname = dev.hostname
+        device_variables, mgmt_gw_ipif = allocate_access_management(
+            session, device_id, new_hostname)
+    hostname = new_hostname
 
-    nr = cnaas_nms.confpush.nornir_helper.cnaas_init()
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('init')
     nr_filtered = nr.filter(name=hostname)
 
     # step2. push management config
@@ -192,31 +301,10 @@ def init_access_device_step1(device_id: int, new_hostname: str,
     if not nrresult.failed:
         raise Exception  # we don't expect success here
 
-    with sqla_session() as session:
-        dev = session.query(Device).filter(Device.id == device_id).one()
-        dev.management_ip = device_variables['mgmt_ip']
-        # Remove the reserved IP since it's now saved in the device database instead
-        reserved_ip = session.query(ReservedIP).filter(ReservedIP.device == dev).one_or_none()
-        if reserved_ip:
-            session.delete(reserved_ip)
+    save_access_management_ip(device_id, hostname, device_variables, mgmt_gw_ipif)
 
-    # Plugin hook, allocated IP
-    try:
-        pmh = PluginManagerHandler()
-        pmh.pm.hook.allocated_ipv4(vrf='mgmt', ipv4_address=str(mgmt_ip),
-                                   ipv4_network=str(mgmt_gw_ipif.network),
-                                   hostname=hostname
-                                   )
-    except Exception as e:
-        logger.exception("Error while running plugin hooks for allocated_ipv4: ".format(str(e)))
-
-    # step3. register apscheduler job that continues steps
-    scheduler = Scheduler()
-    next_job_id = scheduler.add_onetime_job(
-        'cnaas_nms.confpush.init_device:init_access_device_step2',
-        when=0,
-        scheduled_by=scheduled_by,
-        kwargs={'device_id': device_id, 'iteration': 1})
+    # step3. register job that continues steps when device answers on new IP
+    next_job_id = schedule_init_access_device_step2(device_id, 0, scheduled_by)
 
     logger.debug(f"Step 2 scheduled as ID {next_job_id}")
 
@@ -227,16 +315,22 @@ def init_access_device_step1(device_id: int, new_hostname: str,
 
 
 def schedule_init_access_device_step2(device_id: int, iteration: int,
-                                      scheduled_by: str) -> Optional[Job]:
+                                      scheduled_by: str) -> Optional[int]:
+    """Schedule init step2 to run as soon as the device answers on its
+    management IP, or at the latest after 30*iteration seconds. Iteration 0
+    is the first attempt directly after step1."""
     max_iterations = 2
-    if iteration > 0 and iteration < max_iterations:
-        scheduler = Scheduler()
-        next_job_id = scheduler.add_onetime_job(
+    if iteration >= 0 and iteration < max_iterations:
+        with sqla_session() as session:
+            addresses = get_probe_addresses(session, [device_id])
+        return watch_devices(
             'cnaas_nms.confpush.init_device:init_access_device_step2',
-            when=(30*iteration),
+            addresses,
+            timeout=30*max(iteration, 1),
             scheduled_by=scheduled_by,
-            kwargs={'device_id': device_id, 'iteration': iteration+1})
-        return next_job_id
+            kwargs={'device_id': device_id, 'iteration': iteration+1},
+            # Device is expected to answer on new IP right away after step1
+            min_delay=0 if iteration == 0 else 10)
     else:
         return None
 
@@ -255,7 +349,7 @@ def init_access_device_step2(device_id: int, iteration: int = -1,
                          format(device_id, dev.state.name))
             raise DeviceStateException("Device must be in state INIT to continue init step 2")
         hostname = dev.hostname
-    nr = cnaas_nms.confpush.nornir_helper.cnaas_init()
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('init')
     nr_filtered = nr.filter(name=hostname)
 
     nrresult = nr_filtered.run(task=networking.napalm_get, getters=["facts"])
@@ -278,58 +372,218 @@ def init_access_device_step2(device_id: int, iteration: int = -1,
     if hostname != found_hostname:
         raise InitError("Newly initialized device presents wrong hostname")
 
+    set_access_device_managed(device_id, hostname, facts)
+
+    return NornirJobResult(
+        nrresult = nrresult
+    )
+
+
+@job_wrapper
+def init_access_devices_step1(device_ids: List[int], new_hostnames: List[str],
+                              job_id: Optional[str] = None,
+                              scheduled_by: Optional[str] = None) -> NornirJobResult:
+    """Initialize several access devices for management by CNaaS-NMS in
+    parallel. Devices that can not be reached or that can not be allocated
+    a management IP are skipped, the rest continue to step 2 as one batch.
+
+    Args:
+        device_ids: Devices to select for initialization
+        new_hostnames: Hostname to configure for each device in device_ids
+        job_id: job_id provided by scheduler when adding job
+        scheduled_by: Username from JWT.
+
+    Returns:
+        Nornir result object
+
+    Raises:
+        DeviceStateException
+    """
+    logger = get_logger()
+    if len(device_ids) != len(new_hostnames):
+        raise ValueError("device_ids and new_hostnames must be of the same length")
+    if len(set(new_hostnames)) != len(new_hostnames):
+        raise ValueError("new_hostnames must be unique")
+    new_hostname_by_id = dict(zip(device_ids, new_hostnames))
+    # Check that all devices are in the correct state before changing anything
     with sqla_session() as session:
-        dev: Device = session.query(Device).filter(Device.id == device_id).one()
-        dev.state = DeviceState.MANAGED
-        dev.device_type = DeviceType.ACCESS
-        dev.synchronized = False
-        dev.serial = facts['serial_number']
-        dev.vendor = facts['vendor']
-        dev.model = facts['model']
-        dev.os_version = facts['os_version']
-        management_ip = dev.management_ip
-        dev.dhcp_ip = None
+        old_hostnames = check_access_init_state(session, device_ids)
+
+    # Connectivity check and LLDP neighbors for all devices in one run
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('init')
+    old_hostname_set = set(old_hostnames.values())
+    nr_old_filtered = nr.filter(filter_func=lambda h: h.name in old_hostname_set)
+    nrresult_old = nr_old_filtered.run(task=networking.napalm_get,
+                                       getters=["facts", "lldp_neighbors"])
+
+    device_variables: Dict[str, dict] = {}
+    mgmt_gw_ipifs: Dict[str, IPv4Interface] = {}
+    init_ids: Dict[str, int] = {}
+    for device_id, old_hostname in old_hostnames.items():
+        new_hostname = new_hostname_by_id[device_id]
+        if old_hostname not in nrresult_old or nrresult_old[old_hostname].failed:
+            logger.error(f"Failed to connect to device_id {device_id}, skipping init")
+            continue
+        try:
+            cnaas_nms.confpush.get.update_linknets(
+                old_hostname, nrresult_old[old_hostname][0].result['lldp_neighbors'])
+            with sqla_session() as session:
+                device_variables[new_hostname], mgmt_gw_ipifs[new_hostname] = \
+                    allocate_access_management(session, device_id, new_hostname)
+            init_ids[new_hostname] = device_id
+        except Exception as e:
+            logger.exception("Could not allocate management for device_id {}, skipping init: {}".
+                             format(device_id, str(e)))
+    if not init_ids:
+        raise InitError("None of the devices could be initialized")
+
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('init')
+    nr_filtered = nr.filter(filter_func=lambda h: h.name in init_ids)
+
+    # step2. push management config to all devices at once
+    nrresult = nr_filtered.run(task=push_base_management_access_batch,
+                               device_variables=device_variables,
+                               job_id=job_id)
+
+    step2_ids = []
+    for hostname, device_id in init_ids.items():
+        if hostname in nrresult and not nrresult[hostname].failed:
+            # we don't expect success here since connectivity is lost
+            logger.error("Unexpected result from pushing base management config to {}".format(
+                hostname))
+            continue
+        save_access_management_ip(device_id, hostname, device_variables[hostname],
+                                  mgmt_gw_ipifs[hostname])
+        step2_ids.append(device_id)
+
+    next_job_id = None
+    if step2_ids:
+        # step3. register job that continues steps when devices answer on new IPs
+        next_job_id = schedule_init_access_devices_step2(step2_ids, 0, scheduled_by)
+        logger.debug(f"Step 2 for device_ids {step2_ids} scheduled as ID {next_job_id}")
 
-    # Plugin hook: new managed device
-    # Send: hostname , device type , serial , platform , vendor , model , os version
-    try:
-        pmh = PluginManagerHandler()
-        pmh.pm.hook.new_managed_device(
-            hostname=hostname,
-            device_type=DeviceType.ACCESS.name,
-            serial_number=facts['serial_number'],
-            vendor=facts['vendor'],
-            model=facts['model'],
-            os_version=facts['os_version'],
-            management_ip=str(management_ip)
-        )
-    except Exception as e:
-        logger.exception("Error while running plugin hooks for new_managed_device: ".format(str(e)))
+    return NornirJobResult(
+        nrresult=nrresult,
+        next_job_id=next_job_id
+    )
 
-    try:
-        update_interfacedb(hostname, replace=True)
-    except Exception as e:
-        logger.exception(
-            "Exception while updating interface database for device {}: {}".\
-            format(hostname, str(e)))
 
+def schedule_init_access_devices_step2(device_ids: List[int], iteration: int,
+                                       scheduled_by: str) -> Optional[int]:
+    """Schedule batched init step2 to run as soon as all devices answer on
+    their management IPs, or at the latest after 30*iteration seconds."""
+    max_iterations = 2
+    if iteration >= 0 and iteration < max_iterations:
+        with sqla_session() as session:
+            addresses = get_probe_addresses(session, device_ids)
+        return watch_devices(
+            'cnaas_nms.confpush.init_device:init_access_devices_step2',
+            addresses,
+            timeout=30*max(iteration, 1),
+            scheduled_by=scheduled_by,
+            kwargs={'device_ids': device_ids, 'iteration': iteration+1},
+            # Device is expected to answer on new IP right away after step1
+            min_delay=0 if iteration == 0 else 10)
+    else:
+        return None
+
+
+@job_wrapper
+def init_access_devices_step2(device_ids: List[int], iteration: int = -1,
+                              job_id: Optional[str] = None,
+                              scheduled_by: Optional[str] = None) -> \
+                              NornirJobResult:
+    """Verify that several devices accepted base management config and move
+    them to state MANAGED. Devices that can't be reached yet are retried
+    together in a new job.
+
+    Raises:
+        InitError: If some devices presented unexpected facts or could not be
+                   reached after the last retry, other devices are still
+                   moved to MANAGED or retried
+    """
+    logger = get_logger()
+    hostnames: Dict[int, str] = {}
+    with sqla_session() as session:
+        for dev in session.query(Device).filter(Device.id.in_(device_ids)):
+            if dev.state != DeviceState.INIT:
+                logger.error("Device with ID {} got to init step2 but is in incorrect state: {}".\
+                             format(dev.id, dev.state.name))
+                continue
+            hostnames[dev.id] = dev.hostname
+    if not hostnames:
+        raise DeviceStateException("No devices in state INIT to continue init step 2")
+    hostname_set = set(hostnames.values())
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('init')
+    nr_filtered = nr.filter(filter_func=lambda h: h.name in hostname_set)
+
+    nrresult = nr_filtered.run(task=networking.napalm_get, getters=["facts"])
+
+    retry_ids = []
+    # hostname -> reason for devices that failed init step 2
+    failed: Dict[str, str] = {}
+    for device_id, hostname in hostnames.items():
+        if hostname not in nrresult or nrresult[hostname].failed:
+            retry_ids.append(device_id)
+            continue
+        try:
+            facts = nrresult[hostname][0].result['facts']
+            found_hostname = facts['hostname']
+        except Exception:
+            failed[hostname] = "Could not log in to device during init step 2"
+            continue
+        if hostname != found_hostname:
+            failed[hostname] = "Newly initialized device presents wrong hostname: {}".format(
+                found_hostname)
+            continue
+        set_access_device_managed(device_id, hostname, facts)
+
+    next_job_id = None
+    if retry_ids:
+        next_job_id = schedule_init_access_devices_step2(retry_ids, iteration,
+                                                         scheduled_by)
+        if not next_job_id:
+            for device_id in retry_ids:
+                failed[hostnames[device_id]] = \
+                    "Device did not answer on new management IP, no retries left"
+    if failed:
+        for hostname, reason in failed.items():
+            logger.error("Init step 2 failed for device {}: {}".format(hostname, reason))
+        errmsg = "Init step 2 failed for {} devices: {}".format(
+            len(failed), ", ".join(sorted(failed.keys())))
+        if next_job_id:
+            errmsg += " (remaining devices are retried in job {})".format(next_job_id)
+        raise InitError(errmsg)
     return NornirJobResult(
-        nrresult = nrresult
+        nrresult=nrresult,
+        next_job_id=next_job_id
     )
 
 
+def get_discover_addresses(session, devices: Dict[str, str]) -> List[Tuple[str, int]]:
+    addresses = []
+    for dev in session.query(Device).filter(Device.ztp_mac.in_(list(devices.keys()))):
+        address = get_probe_address(dev, devices[dev.ztp_mac])
+        if address:
+            addresses.append(address)
+    return addresses
+
+
 def schedule_discover_device(ztp_mac: str, dhcp_ip: str, iteration: int,
-                             scheduled_by: str) -> Optional[Job]:
+                             scheduled_by: str) -> Optional[int]:
+    """Schedule a new discover attempt to run as soon as the device answers,
+    or at the latest after 60*iteration seconds."""
     max_iterations = 5
     if iteration > 0 and iteration < max_iterations:
-        scheduler = Scheduler()
-        next_job_id = scheduler.add_onetime_job(
+        with sqla_session() as session:
+            addresses = get_discover_addresses(session, {ztp_mac: dhcp_ip})
+        return watch_devices(
             'cnaas_nms.confpush.init_device:discover_device',
-            when=(60*iteration),
+            addresses,
+            timeout=60*iteration,
             scheduled_by=scheduled_by,
             kwargs={'ztp_mac': ztp_mac, 'dhcp_ip': dhcp_ip,
                     'iteration': iteration+1})
-        return next_job_id
     else:
         return None
 
@@ -351,7 +605,7 @@ def discover_device(ztp_mac: str, dhcp_ip: str, iteration=-1,
             dev.dhcp_ip = dhcp_ip
         hostname = dev.hostname
 
-    nr = cnaas_nms.confpush.nornir_helper.cnaas_init()
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('discover')
     nr_filtered = nr.filter(name=hostname)
 
     nrresult = nr_filtered.run(task=networking.napalm_get, getters=["facts"])
@@ -388,3 +642,140 @@ def discover_device(ztp_mac: str, dhcp_ip: str, iteration=-1,
         raise e
 
     return NornirJobResult(nrresult=nrresult)
+
+
+def queue_discover_device(ztp_mac: str, dhcp_ip: str, scheduled_by: str) -> int:
+    """Add device to the set of devices pending discovery. DHCP events that
+    arrive within DISCOVER_BATCH_WINDOW seconds of each other are handled by
+    the same discover_devices job.
+
+    Returns:
+        ID of the job that will discover the device
+    """
+    db = get_redis_client()
+    with db.lock(DISCOVER_BATCH_LOCK_KEY, timeout=10):
+        db.hset(DISCOVER_PENDING_KEY, ztp_mac, dhcp_ip)
+        job_id = db.get(DISCOVER_BATCH_JOB_KEY)
+        if job_id:
+            return int(job_id)
+        scheduler = Scheduler()
+        job_id = scheduler.add_onetime_job(
+            'cnaas_nms.confpush.init_device:discover_devices',
+            when=DISCOVER_BATCH_WINDOW,
+            scheduled_by=scheduled_by,
+            kwargs={'iteration': 1})
+        db.set(DISCOVER_BATCH_JOB_KEY, job_id, ex=DISCOVER_BATCH_TIMEOUT)
+        return job_id
+
+
+def pop_pending_discover_devices() -> Dict[str, str]:
+    """Get and remove all devices pending discovery.
+
+    Returns:
+        Dict with dhcp_ip for each ztp_mac
+    """
+    db = get_redis_client()
+    with db.lock(DISCOVER_BATCH_LOCK_KEY, timeout=10):
+        with db.pipeline() as pipe:
+            pipe.hgetall(DISCOVER_PENDING_KEY)
+            pipe.delete(DISCOVER_PENDING_KEY)
+            # Events after this point will schedule a new batch
+            pipe.delete(DISCOVER_BATCH_JOB_KEY)
+            pending, _, _ = pipe.execute()
+    return {k.decode('utf-8'): v.decode('utf-8') for k, v in pending.items()}
+
+
+def schedule_discover_devices(devices: Dict[str, str], iteration: int,
+                              scheduled_by: str) -> Optional[int]:
+    """Schedule a new discover attempt for devices to run as soon as all
+    of them answer, or at the latest after 60*iteration seconds."""
+    max_iterations = 5
+    if iteration > 0 and iteration < max_iterations:
+        with sqla_session() as session:
+            addresses = get_discover_addresses(session, devices)
+        return watch_devices(
+            'cnaas_nms.confpush.init_device:discover_devices',
+            addresses,
+            timeout=60*iteration,
+            scheduled_by=scheduled_by,
+            kwargs={'devices': devices, 'iteration': iteration+1})
+    else:
+        return None
+
+
+@job_wrapper
+def discover_devices(devices: Optional[Dict[str, str]] = None, iteration: int = -1,
+                     job_id: Optional[str] = None,
+                     scheduled_by: Optional[str] = None) -> NornirJobResult:
+    """Discover several devices in state DHCP_BOOT in parallel.
+
+    Args:
+        devices: Dict with dhcp_ip for each ztp_mac to discover, if not
+                 specified all devices queued by queue_discover_device are
+                 discovered
+        iteration: Attempt number, devices that could not be contacted are
+                   retried together in a new job
+        job_id: job_id provided by scheduler when adding job
+        scheduled_by: Username from JWT.
+
+    Returns:
+        Nornir result object
+    """
+    logger = get_logger()
+    if devices is None:
+        devices = pop_pending_discover_devices()
+    hostnames: Dict[str, str] = {}
+    with sqla_session() as session:
+        for dev in session.query(Device).filter(Device.ztp_mac.in_(list(devices.keys()))):
+            if dev.state != DeviceState.DHCP_BOOT:
+                logger.error("Device with ztp_mac {} is in incorrect state: {}".format(
+                    dev.ztp_mac, str(dev.state)
+                ))
+                continue
+            if str(dev.dhcp_ip) != devices[dev.ztp_mac]:
+                dev.dhcp_ip = devices[dev.ztp_mac]
+            hostnames[dev.ztp_mac] = dev.hostname
+    for ztp_mac in devices.keys():
+        if ztp_mac not in hostnames:
+            logger.error("Device with ztp_mac {} not found for discovery".format(ztp_mac))
+    if not hostnames:
+        return NornirJobResult()
+
+    hostname_set = set(hostnames.values())
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('discover')
+    nr_filtered = nr.filter(filter_func=lambda h: h.name in hostname_set)
+
+    nrresult = nr_filtered.run(task=networking.napalm_get, getters=["facts"])
+
+    retry_devices: Dict[str, str] = {}
+    with sqla_session() as session:
+        for ztp_mac, hostname in hostnames.items():
+            if hostname not in nrresult or nrresult[hostname].failed:
+                logger.info("Could not contact device with ztp_mac {} (attempt {})".format(
+                    ztp_mac, iteration
+                ))
+                retry_devices[ztp_mac] = devices[ztp_mac]
+                continue
+            try:
+                facts = nrresult[hostname][0].result['facts']
+                dev: Device = session.query(Device).filter(Device.ztp_mac == ztp_mac).one()
+                dev.serial = facts['serial_number']
+                dev.vendor = facts['vendor']
+                dev.model = facts['model']
+                dev.os_version = facts['os_version']
+                dev.state = DeviceState.DISCOVERED
+                session.commit()
+                logger.info(f"Device with ztp_mac {ztp_mac} successfully scanned, " +
+                            "moving to DISCOVERED state")
+            except Exception as e:
+                session.rollback()
+                logger.exception("Could not update device with ztp_mac {} with new facts: {}".
+                                 format(ztp_mac, str(e)))
+
+    next_job_id = None
+    if retry_devices:
+        next_job_id = schedule_discover_devices(retry_devices, iteration, scheduled_by)
+    return NornirJobResult(
+        nrresult=nrresult,
+        next_job_id=next_job_id
+    )
@@ -0,0 +1,144 @@
+import time
+import threading
+from typing import Dict, Tuple
+
+from nornir.core import Nornir
+from nornir.core.connections import ConnectionPlugin
+
+from cnaas_nms.tools.get_apidata import get_apidata
+from cnaas_nms.tools.log import get_logger
+
+
+CONNECTION_NAME = "napalm"
+
+
+class NapalmConnectionPool(object):
+    """Keep NAPALM connections open between jobs so that new jobs for the
+    same devices don't have to log in again. Connections that has not been
+    used for idle_timeout seconds are closed. A pooled connection is only
+    used by one job at a time."""
+    def __init__(self, idle_timeout: int = 0):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # hostname -> (connection parameters, connection, time of release)
+        self._connections: Dict[str, Tuple[tuple, ConnectionPlugin, float]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.idle_timeout > 0
+
+    @staticmethod
+    def _conn_params(host) -> tuple:
+        params = host.get_connection_parameters(CONNECTION_NAME)
+        return (params.hostname, params.port, params.username, params.password,
+                params.platform)
+
+    @staticmethod
+    def _close(hostname: str, connection: ConnectionPlugin):
+        logger = get_logger()
+        try:
+            connection.close()
+        except Exception as e:
+            logger.debug("Error closing pooled connection to {}: {}".format(hostname, str(e)))
+
+    def evict_idle(self):
+        """Close connections that has been idle for longer than idle_timeout."""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for hostname, (_, connection, released) in list(self._connections.items()):
+                if now - released > self.idle_timeout:
+                    evicted.append((hostname, connection))
+                    del self._connections[hostname]
+        for hostname, connection in evicted:
+            self._close(hostname, connection)
+
+    def attach(self, nr: Nornir):
+        """Give hosts in nr pooled connections, if there are any usable ones."""
+        if not self.enabled:
+            return
+        logger = get_logger()
+        self.evict_idle()
+        for hostname, host in nr.inventory.hosts.items():
+            if CONNECTION_NAME in host.connections:
+                continue
+            with self._lock:
+                pooled = self._connections.pop(hostname, None)
+            if not pooled:
+                continue
+            params, connection, _ = pooled
+            if params != self._conn_params(host):
+                self._close(hostname, connection)
+                continue
+            try:
+                alive = connection.connection.is_alive().get('is_alive', False)
+            except Exception:
+                alive = False
+            if not alive:
+                self._close(hostname, connection)
+                continue
+            logger.debug("Reusing pooled NAPALM connection to {}".format(hostname))
+            host.connections[CONNECTION_NAME] = connection
+
+    @staticmethod
+    def _close_host_connections(nr: Nornir):
+        logger = get_logger()
+        for hostname, host in nr.inventory.hosts.items():
+            try:
+                host.close_connections()
+            except Exception as e:
+                logger.debug("Error closing connections to {}: {}".format(hostname, str(e)))
+
+    def release(self, nr: Nornir):
+        """Take over open connections from hosts in nr, or close them if
+        pooling is disabled. Connections to failed hosts are always closed
+        since they might be left in an unknown state."""
+        if not self.enabled:
+            self._close_host_connections(nr)
+            return
+        now = time.monotonic()
+        replaced = []
+        for hostname, host in nr.inventory.hosts.items():
+            if hostname in nr.data.failed_hosts:
+                continue
+            connection = host.connections.pop(CONNECTION_NAME, None)
+            if not connection:
+                continue
+            with self._lock:
+                if hostname in self._connections:
+                    replaced.append((hostname, self._connections[hostname][1]))
+                self._connections[hostname] = (self._conn_params(host), connection, now)
+        for hostname, connection in replaced:
+            self._close(hostname, connection)
+        # Close connections to failed hosts and any other kind of connection
+        self._close_host_connections(nr)
+        self.evict_idle()
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.items())
+            self._connections = {}
+        for hostname, (_, connection, _) in connections:
+            self._close(hostname, connection)
+
+
+def get_pool_idle_timeout() -> int:
+    try:
+        return int(get_apidata().get('napalm_pool_idle_timeout', 0))
+    except Exception:
+        return 0
+
+
+napalm_pool = NapalmConnectionPool(get_pool_idle_timeout())
+
+
+def open_job_connections(nr: Nornir):
+    """Call when starting a job, hosts will then reuse NAPALM connections
+    from earlier jobs if cross-job pooling is enabled."""
+    napalm_pool.attach(nr)
+
+
+def close_job_connections(nr: Nornir):
+    """Call when a job is done with its devices. Connections are kept by the
+    pool if pooling is enabled, otherwise closed."""
+    napalm_pool.release(nr)
@@ -1,7 +1,9 @@
 from nornir import InitNornir
+from nornir.core import Nornir
 
 from nornir.core.task import AggregatedResult, MultiResult, Result
 from cnaas_nms.scheduler.jobresult import JobResult
+from cnaas_nms.confpush.concurrency import concurrency_manager
 
 from dataclasses import dataclass
 from typing import Optional
@@ -13,15 +15,32 @@ class NornirJobResult(JobResult):
     change_score: Optional[float] = None
 
 
-def cnaas_init():
+class CnaasNornir(Nornir):
+    """Nornir that runs tasks within the limits of the concurrency manager."""
+    def filter(self, *args, **kwargs):
+        b = CnaasNornir(**self.__dict__)
+        b.inventory = self.inventory.filter(*args, **kwargs)
+        return b
+
+    def run(self, task, num_workers=None, **kwargs):
+        return super().run(concurrency_manager.limit_task(task), num_workers=num_workers,
+                           **kwargs)
+
+
+def cnaas_init(job_type: str = 'default') -> CnaasNornir:
+    """Initialize nornir with inventory of all devices.
+
+    Args:
+        job_type: Type of job, used to decide number of workers
+    """
     nr = InitNornir(
-        core={"num_workers": 50},
+        core={"num_workers": concurrency_manager.get_num_workers(job_type)},
         inventory={
             "plugin": "cnaas_nms.confpush.nornir_plugins.cnaas_inventory.CnaasInventory"
         },
         logging={"file": "/tmp/nornir.log", "level": "debug"}
     )
-    return nr
+    return CnaasNornir(**nr.__dict__)
 
 
 def nr_result_serialize(result: AggregatedResult):
@@ -1,15 +1,33 @@
 import os
 import ipaddress
+import threading
+from typing import Dict, Optional, Set, Tuple
 
 from nornir.core.deserializer.inventory import Inventory
 
 from cnaas_nms.db.device import Device, DeviceType, DeviceState
-from cnaas_nms.db.settings import get_groups
+from cnaas_nms.db.settings import get_group_matcher, get_settings_commit
 import cnaas_nms.db.session
 
 
-class CnaasInventory(Inventory):
-    def _get_credentials(self, devicestate):
+class InventoryCache(object):
+    """Nornir inventory data kept between calls to cnaas_init. Each refresh
+    only loads a lightweight projection of the device table, and hosts are
+    only rebuilt if their device row changed or if groups.yml might have
+    changed (settings repository commit moved)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.settings_commit: Optional[str] = None
+        # hostname -> device row projection used to build host
+        self.rows: Dict[str, tuple] = {}
+        self.hosts: Dict[str, dict] = {}
+        self.groups: Dict[str, dict] = {}
+        # group name -> hostnames that are members of group
+        self.group_index: Dict[str, Set[str]] = {}
+        self.credentials: Dict[str, Tuple[str, str]] = {}
+
+    @staticmethod
+    def _get_credentials(devicestate):
         try:
             username = os.environ['USERNAME_' + devicestate]
             password = os.environ['PASSWORD_' + devicestate]
@@ -17,7 +35,8 @@ class CnaasInventory(Inventory):
             raise ValueError('Could not find credentials for state ' + devicestate)
         return username, password
 
-    def _get_management_ip(self, management_ip, dhcp_ip):
+    @staticmethod
+    def _get_management_ip(management_ip, dhcp_ip):
         if issubclass(management_ip.__class__, ipaddress.IPv4Address):
             return str(management_ip)
         elif issubclass(dhcp_ip.__class__, ipaddress.IPv4Address):
@@ -25,30 +44,34 @@ class CnaasInventory(Inventory):
         else:
             return None
 
-    def __init__(self, **kwargs):
-        hosts = {}
-        with cnaas_nms.db.session.sqla_session() as session:
-            instance: Device
-            for instance in session.query(Device):
-                hosts[instance.hostname] = {
-                    'platform': instance.platform,
-                    'groups': [
-                        'T_'+instance.device_type.name,
-                        'S_'+instance.state.name
-                    ],
-                    'data': {
-                        'synchronized': instance.synchronized,
-                        'managed': (True if instance.state == DeviceState.MANAGED else False)
-                    }
-                }
-                for group in get_groups(instance.hostname):
-                    hosts[instance.hostname]['groups'].append(group)
-                hostname = self._get_management_ip(instance.management_ip,
-                                                   instance.dhcp_ip)
-                if hostname:
-                    hosts[instance.hostname]['hostname'] = hostname
-                if instance.port and isinstance(instance.port, int):
-                    hosts[instance.hostname]['port'] = instance.port
+    def _build_host(self, row: tuple, host_groups: list) -> dict:
+        hostname, platform, device_type, state, synchronized, management_ip, dhcp_ip, port = row
+        host = {
+            'platform': platform,
+            'groups': [
+                'T_'+device_type.name,
+                'S_'+state.name
+            ] + host_groups,
+            'data': {
+                'synchronized': synchronized,
+                'managed': (True if state == DeviceState.MANAGED else False)
+            }
+        }
+        mgmt_ip = self._get_management_ip(management_ip, dhcp_ip)
+        if mgmt_ip:
+            host['hostname'] = mgmt_ip
+        if port and isinstance(port, int):
+            host['port'] = port
+        return host
+
+    def _index_host(self, hostname: str, host: Optional[dict]):
+        for members in self.group_index.values():
+            members.discard(hostname)
+        if host:
+            for group in host['groups']:
+                self.group_index.setdefault(group, set()).add(hostname)
+
+    def _build_groups(self, group_names: list) -> dict:
         groups = {
             'global': {
                 'data': {
@@ -60,29 +83,80 @@ class CnaasInventory(Inventory):
             groups['T_'+device_type] = {}
         for device_type in list(DeviceState.__members__):
             groups['S_'+device_type] = {}
-        for group in get_groups():
+        for group in group_names:
             groups[group] = {}
 
-        # Get credentials for device in state DHCP_BOOT
-        username, password = self._get_credentials('DHCP_BOOT')
-        groups['S_DHCP_BOOT']['username'] = username
-        groups['S_DHCP_BOOT']['password'] = password
+        # Get credentials for devices in states DHCP_BOOT, DISCOVERED, INIT
+        # and MANAGED. Environment doesn't change so only read it once.
+        for devicestate in ['DHCP_BOOT', 'DISCOVERED', 'INIT', 'MANAGED']:
+            if devicestate not in self.credentials:
+                self.credentials[devicestate] = self._get_credentials(devicestate)
+            username, password = self.credentials[devicestate]
+            groups['S_'+devicestate]['username'] = username
+            groups['S_'+devicestate]['password'] = password
+        return groups
+
+    def refresh(self):
+        settings_commit = get_settings_commit()
+        with cnaas_nms.db.session.sqla_session() as session:
+            rows = {row[0]: tuple(row) for row in session.query(
+                Device.hostname, Device.platform, Device.device_type, Device.state,
+                Device.synchronized, Device.management_ip, Device.dhcp_ip, Device.port)}
+
+        with self._lock:
+            groups_changed = settings_commit is None or settings_commit != self.settings_commit
+            group_matcher = None
+            if groups_changed:
+                group_matcher = get_group_matcher()
+                self.groups = self._build_groups(group_matcher.get_groups())
+            for hostname in list(self.hosts.keys()):
+                if hostname not in rows:
+                    del self.hosts[hostname]
+                    del self.rows[hostname]
+                    self._index_host(hostname, None)
+            for hostname, row in rows.items():
+                if not groups_changed and self.rows.get(hostname) == row:
+                    continue
+                if groups_changed or hostname not in self.hosts:
+                    if not group_matcher:
+                        group_matcher = get_group_matcher()
+                    host_groups = group_matcher.get_groups(hostname)
+                else:
+                    # Only device row changed, keep groups from settings
+                    host_groups = self.hosts[hostname]['groups'][2:]
+                self.hosts[hostname] = self._build_host(row, host_groups)
+                self.rows[hostname] = row
+                self._index_host(hostname, self.hosts[hostname])
+            self.settings_commit = settings_commit
 
-        # Get credentials for device in state DISCOVERED
-        username, password = self._get_credentials('DISCOVERED')
-        groups['S_DISCOVERED']['username'] = username
-        groups['S_DISCOVERED']['password'] = password
+    def get_inventory(self) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+        """Get fresh copies of hosts and groups that can be used to build
+        a nornir inventory."""
+        self.refresh()
+        with self._lock:
+            hosts = {}
+            for hostname, host in self.hosts.items():
+                hosts[hostname] = dict(host)
+                hosts[hostname]['groups'] = list(host['groups'])
+                hosts[hostname]['data'] = dict(host['data'])
+            groups = {name: dict(group) for name, group in self.groups.items()}
+            groups['global']['data'] = dict(self.groups['global']['data'])
+        return hosts, groups
 
-        # Get credentials for device in state INIT
-        username, password = self._get_credentials('INIT')
-        groups['S_INIT']['username'] = username
-        groups['S_INIT']['password'] = password
+    def get_group_hostnames(self, group: str, refresh: bool = True) -> Set[str]:
+        """Get hostnames of devices that are members of group."""
+        if refresh:
+            self.refresh()
+        with self._lock:
+            return set(self.group_index.get(group, set()))
 
-        # Get credentials for device in state MANAGED
-        username, password = self._get_credentials('MANAGED')
-        groups['S_MANAGED']['username'] = username
-        groups['S_MANAGED']['password'] = password
 
+inventory_cache = InventoryCache()
+
+
+class CnaasInventory(Inventory):
+    def __init__(self, **kwargs):
+        hosts, groups = inventory_cache.get_inventory()
         defaults = {'data': {'k': 'v'}}
         super().__init__(hosts=hosts, groups=groups, defaults=defaults,
                          **kwargs)
@@ -0,0 +1,163 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pickle import PicklingError
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cnaas_nms.confpush.changescore import ChangeScore, score_change
+from cnaas_nms.confpush.template_cache import render_template
+from cnaas_nms.tools.get_apidata import get_apidata
+from cnaas_nms.tools.log import get_logger
+
+
+def get_render_workers() -> int:
+    try:
+        return int(get_apidata().get('sync_render_workers', os.cpu_count() or 1))
+    except Exception:
+        return os.cpu_count() or 1
+
+
+# Number of processes used to render configs and calculate change scores
+RENDER_WORKERS = get_render_workers()
+# Render in the current process if there are fewer devices than this
+RENDER_PARALLEL_MIN = 20
+
+
+@dataclass
+class RenderHost:
+    """The parts of a nornir host that templates can use, nornir hosts
+    themselves can't be sent to worker processes."""
+    name: str
+    hostname: Optional[str]
+    platform: str
+    port: Optional[int]
+
+
+@dataclass
+class RenderBundle:
+    """Everything needed to render config for one device."""
+    host: RenderHost
+    template: str
+    template_vars: dict
+
+
+@dataclass
+class RenderResult:
+    config: Optional[str] = None
+    template_vars: Optional[dict] = None
+    error: Optional[str] = None
+    # Content address of the saved config artifact
+    artifact_key: Optional[str] = None
+    # Config was found in artifact cache and not rendered again
+    cached: bool = False
+
+
+# Jinja filters for worker processes, set before forking
+_jinja_filters: Optional[Dict[str, Callable]] = None
+
+
+def _render_worker_init(jinja_filters: Optional[Dict[str, Callable]]):
+    global _jinja_filters
+    _jinja_filters = jinja_filters
+
+
+def _render_bundle(bundle: RenderBundle) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        config = render_template(bundle.host.platform, bundle.template, _jinja_filters,
+                                 host=bundle.host, **bundle.template_vars)
+        return config, None
+    except Exception as e:
+        return None, "Could not render template {}: {}".format(bundle.template, str(e))
+
+
+def _score_change(config: str, diff: str) -> ChangeScore:
+    return score_change(config, diff)
+
+
+def _get_mp_context():
+    """Workers are forked from a forkserver process instead of from the
+    calling process. The calling process is multi-threaded (scheduler,
+    nornir, prober) and a child forked from it could inherit locks held by
+    other threads, like the template cache lock, and hang forever."""
+    mp_context = multiprocessing.get_context('forkserver')
+    # Import modules once in the forkserver so that workers start quickly
+    mp_context.set_forkserver_preload(['cnaas_nms.confpush.render_pool'])
+    return mp_context
+
+
+def _run_in_pool(func: Callable, args: List[tuple],
+                 jinja_filters: Optional[Dict[str, Callable]] = None) -> list:
+    """Call func for each item in args, in worker processes if there are
+    many items. Falls back to the current process if the worker processes
+    can't be started or die."""
+    _render_worker_init(jinja_filters)
+    if len(args) < RENDER_PARALLEL_MIN or RENDER_WORKERS <= 1:
+        return [func(*arg) for arg in args]
+    logger = get_logger()
+    logger.debug("Running {} for {} devices using {} processes".format(
+        func.__name__, len(args), RENDER_WORKERS))
+    try:
+        with ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                 mp_context=_get_mp_context(),
+                                 initializer=_render_worker_init,
+                                 initargs=(jinja_filters,)) as executor:
+            return list(executor.map(
+                func, *zip(*args),
+                chunksize=max(1, len(args) // (RENDER_WORKERS * 4))
+            ))
+    except (BrokenProcessPool, OSError, PicklingError) as e:
+        logger.warning("Worker processes for {} failed, running in current process: {}".format(
+            func.__name__, str(e)))
+        return [func(*arg) for arg in args]
+
+
+def render_configs(bundles: Dict[str, RenderBundle],
+                   jinja_filters: Optional[Dict[str, Callable]] = None) -> \
+        Dict[str, RenderResult]:
+    """Render configs for many devices.
+
+    Args:
+        bundles: Render bundle for each hostname
+        jinja_filters: Extra jinja filters to use when rendering
+
+    Returns:
+        Result for each hostname, with error set if rendering failed
+    """
+    hostnames = list(bundles.keys())
+    results = _run_in_pool(_render_bundle, [(bundles[hostname],) for hostname in hostnames],
+                           jinja_filters)
+    ret = {}
+    for hostname, (config, error) in zip(hostnames, results):
+        ret[hostname] = RenderResult(config=config,
+                                     template_vars=bundles[hostname].template_vars,
+                                     error=error)
+    return ret
+
+
+def score_changes(diffs: Dict[str, Tuple[str, str]]) -> Dict[str, ChangeScore]:
+    """Calculate change scores and pattern hit counts for many devices.
+
+    Args:
+        diffs: Tuple of (config, diff) for each hostname
+
+    Returns:
+        ChangeScore for each hostname
+    """
+    hostnames = list(diffs.keys())
+    scores = _run_in_pool(_score_change, [diffs[hostname] for hostname in hostnames])
+    return dict(zip(hostnames, scores))
+
+
+def calculate_scores(diffs: Dict[str, Tuple[str, str]]) -> Dict[str, float]:
+    """Calculate change scores for many devices.
+
+    Args:
+        diffs: Tuple of (config, diff) for each hostname
+
+    Returns:
+        Change score for each hostname
+    """
+    return {hostname: change_score.score
+            for hostname, change_score in score_changes(diffs).items()}
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from ipaddress import IPv4Address
+from typing import Optional, List, Dict, Iterable
+
+from cnaas_nms.db.device import Device, DeviceType
+from cnaas_nms.db.interface import Interface, InterfaceConfigType
+from cnaas_nms.db.mgmtdomain import Mgmtdomain
+from cnaas_nms.db.topology import Topology, TopologyLink, get_topology
+from cnaas_nms.tools.log import get_logger
+
+
+@dataclass(frozen=True)
+class DeviceView:
+    id: int
+    hostname: str
+    device_type: DeviceType
+    platform: Optional[str]
+    management_ip: Optional[IPv4Address]
+    infra_ip: Optional[IPv4Address]
+
+    @classmethod
+    def from_device(cls, dev: Device) -> DeviceView:
+        return cls(
+            id=dev.id,
+            hostname=dev.hostname,
+            device_type=dev.device_type,
+            platform=dev.platform,
+            management_ip=dev.management_ip,
+            infra_ip=dev.infra_ip
+        )
+
+
+@dataclass(frozen=True)
+class InterfaceView:
+    name: str
+    configtype: InterfaceConfigType
+    data: Optional[dict]
+
+    @classmethod
+    def from_interface(cls, intf: Interface) -> InterfaceView:
+        return cls(
+            name=intf.name,
+            configtype=intf.configtype,
+            data=dict(intf.data) if intf.data else None
+        )
+
+
+@dataclass(frozen=True)
+class MgmtdomainView:
+    id: int
+    ipv4_gw: Optional[str]
+    vlan: Optional[int]
+    description: Optional[str]
+    esi_mac: Optional[str]
+    device_a_id: Optional[int]
+    device_b_id: Optional[int]
+
+    @classmethod
+    def from_mgmtdomain(cls, mgmtdomain: Mgmtdomain) -> MgmtdomainView:
+        return cls(
+            id=mgmtdomain.id,
+            ipv4_gw=mgmtdomain.ipv4_gw,
+            vlan=mgmtdomain.vlan,
+            description=mgmtdomain.description,
+            esi_mac=mgmtdomain.esi_mac,
+            device_a_id=mgmtdomain.device_a_id,
+            device_b_id=mgmtdomain.device_b_id
+        )
+
+
+class SyncContext(object):
+    """Read-only snapshot of the database objects needed to generate
+    configuration for a set of devices. Everything is loaded up front using
+    a few bulk queries so that Nornir tasks don't need their own database
+    sessions. Links between devices are looked up in the shared topology
+    graph from cnaas_nms.db.topology, so there is only one implementation of
+    neighbor lookups and one rule for when it's rebuilt."""
+    def __init__(self, devices: List[DeviceView], interfaces: Dict[int, List[InterfaceView]],
+                 topology: Topology, mgmtdomains: List[MgmtdomainView]):
+        self._devices_by_id: Dict[int, DeviceView] = {dev.id: dev for dev in devices}
+        self._devices_by_hostname: Dict[str, DeviceView] = \
+            {dev.hostname: dev for dev in devices}
+        self._interfaces: Dict[int, List[InterfaceView]] = interfaces
+        self._topology: Topology = topology
+        self._mgmtdomains: List[MgmtdomainView] = mgmtdomains
+
+    @classmethod
+    def load(cls, session, hostnames: Iterable[str]) -> SyncContext:
+        """Load everything needed to generate configuration for hostnames.
+        Fabric (dist and core) devices are always loaded since they can be
+        referenced as uplinks, neighbors or EVPN spines."""
+        hostnames = list(hostnames)
+        devices: Dict[int, DeviceView] = {}
+        device_query = session.query(Device).filter(
+            Device.hostname.in_(hostnames) |
+            Device.device_type.in_([DeviceType.DIST, DeviceType.CORE])
+        )
+        for dev in device_query:
+            devices[dev.id] = DeviceView.from_device(dev)
+
+        topology = get_topology(session)
+        selected_ids = [dev.id for dev in devices.values() if dev.hostname in hostnames]
+        interfaces: Dict[int, List[InterfaceView]] = {}
+        if selected_ids:
+            # Neighbors that are not fabric devices, for example access switches
+            # connected to a selected dist switch
+            missing_ids = set()
+            for hostname in hostnames:
+                for peer in topology.get_neighbors(hostname):
+                    if peer.id not in devices:
+                        missing_ids.add(peer.id)
+            if missing_ids:
+                for dev in session.query(Device).filter(Device.id.in_(missing_ids)):
+                    devices[dev.id] = DeviceView.from_device(dev)
+            intf_query = session.query(Interface).filter(Interface.device_id.in_(selected_ids))
+            for intf in intf_query:
+                interfaces.setdefault(intf.device_id, []).append(
+                    InterfaceView.from_interface(intf))
+
+        mgmtdomains = [MgmtdomainView.from_mgmtdomain(mgmtdom) for mgmtdom in
+                       session.query(Mgmtdomain)]
+        return cls(list(devices.values()), interfaces, topology, mgmtdomains)
+
+    def get_device(self, hostname: str) -> Optional[DeviceView]:
+        return self._devices_by_hostname.get(hostname)
+
+    def get_device_by_id(self, device_id: int) -> Optional[DeviceView]:
+        return self._devices_by_id.get(device_id)
+
+    def get_interfaces(self, hostname: str) -> List[InterfaceView]:
+        dev = self._devices_by_hostname[hostname]
+        return list(self._interfaces.get(dev.id, []))
+
+    def get_uplink_peers(self, hostname: str) -> List[str]:
+        """Get hostnames of uplink peers for an access device, based on the
+        ACCESS_UPLINK interfaces saved in the interface database."""
+        peer_hostnames = []
+        for intf in self.get_interfaces(hostname):
+            if intf.configtype == InterfaceConfigType.ACCESS_UPLINK and intf.data:
+                peer_hostnames.append(intf.data['neighbor'])
+        return peer_hostnames
+
+    def get_links(self, hostname: str) -> List[TopologyLink]:
+        """Get links from hostname to its neighbors, once per linknet."""
+        return self._topology.get_links(hostname)
+
+    def get_neighbors(self, hostname: str) -> List[DeviceView]:
+        return [self._devices_by_id[peer.id] for peer in self._topology.get_neighbors(hostname)]
+
+    def get_link_to(self, hostname: str, peer_hostname: str) -> Optional[TopologyLink]:
+        """Return link connecting hostname to peer_hostname."""
+        return self._topology.get_link_to(hostname, peer_hostname)
+
+    def get_linknet_localif_mapping(self, hostname: str) -> Dict[str, str]:
+        """Return a mapping with local interface name and what peer device hostname
+        that interface is connected to."""
+        return self._topology.get_linknet_localif_mapping(hostname)
+
+    def find_mgmtdomain(self, hostnames: List[str]) -> Optional[MgmtdomainView]:
+        """Find the corresponding management domain for a pair of
+        distribution switches.
+
+        Raises:
+            ValueError: On invalid hostnames etc
+        """
+        if not isinstance(hostnames, list) or not len(hostnames) == 2:
+            raise ValueError("hostnames argument must be a list with two device hostnames")
+        device_ids = []
+        for hostname in hostnames:
+            if not Device.valid_hostname(hostname):
+                raise ValueError(f"Argument {hostname} is not a valid hostname")
+            if hostname not in self._devices_by_hostname:
+                raise ValueError(f"hostname {hostname} not found in device database")
+            device_ids.append(self._devices_by_hostname[hostname].id)
+        for mgmtdomain in self._mgmtdomains:
+            if {mgmtdomain.device_a_id, mgmtdomain.device_b_id} == set(device_ids):
+                return mgmtdomain
+        return None
+
+    def get_all_mgmtdomains(self, hostname: str) -> List[MgmtdomainView]:
+        """Get all mgmtdomains for a specific distribution switch."""
+        dev = self._devices_by_hostname[hostname]
+        return [mgmtdomain for mgmtdomain in self._mgmtdomains
+                if dev.id in [mgmtdomain.device_a_id, mgmtdomain.device_b_id]]
+
+    def get_evpn_spines(self, settings: dict) -> List[DeviceView]:
+        logger = get_logger()
+        ret = []
+        for entry in settings['evpn_spines']:
+            if 'hostname' in entry and Device.valid_hostname(entry['hostname']):
+                dev = self._devices_by_hostname.get(entry['hostname'])
+                if dev:
+                    ret.append(dev)
+            else:
+                logger.error("Invalid entry specified in settings->evpn_spine, ignoring: {}".
+                             format(entry))
+        return ret
@@ -1,28 +1,38 @@
 import os
-import yaml
-from typing import Optional, List
+import json
+import hashlib
+import datetime
+from typing import Dict, Optional, List
 from ipaddress import IPv4Interface, IPv4Address
 from statistics import median
-from hashlib import sha256
 
-from nornir.plugins.tasks import networking, text
+from nornir.plugins.tasks import networking
 from nornir.plugins.functions.text import print_result
 from nornir.core.filter import F
-from nornir.core.task import MultiResult
+from nornir.core.task import MultiResult, Result
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-import cnaas_nms.db.helper
 import cnaas_nms.confpush.nornir_helper
-from cnaas_nms.db.session import sqla_session, redis_session
-from cnaas_nms.confpush.get import get_uplinks, calc_config_hash
+from cnaas_nms.db.session import sqla_session
+from cnaas_nms.confpush.get import get_uplinks
+from cnaas_nms.confpush.config_snapshot import save_snapshot, SnapshotPhase
 from cnaas_nms.confpush.changescore import calculate_score
+from cnaas_nms.confpush.template_cache import get_entrypoint, template_file, template_cache
+from cnaas_nms.confpush.render_pool import RenderBundle, RenderHost, RenderResult, \
+    render_configs, score_changes
+from cnaas_nms.confpush.sync_context import SyncContext, DeviceView, InterfaceView
+from cnaas_nms.confpush.napalm_pool import open_job_connections, close_job_connections
 from cnaas_nms.tools.log import get_logger
-from cnaas_nms.db.settings import get_settings
+from cnaas_nms.db.settings import get_settings, get_settings_commit
+from cnaas_nms.db.configartifact import ConfigArtifact, calc_input_hash, calc_artifact_key
 from cnaas_nms.db.device import Device, DeviceState, DeviceType
 from cnaas_nms.db.interface import Interface, InterfaceConfigType
 from cnaas_nms.db.joblock import Joblock, JoblockError
-from cnaas_nms.db.git import RepoStructureException
+from cnaas_nms.db.topology import TopologyLink
 from cnaas_nms.confpush.nornir_helper import NornirJobResult
 from cnaas_nms.scheduler.wrapper import job_wrapper
+from cnaas_nms.scheduler.jobresult import DictJobResult
+from cnaas_nms.scheduler.jobprogress import report_finished_device
 from cnaas_nms.scheduler.thread_data import set_thread_data
 
 from cnaas_nms.scheduler.scheduler import Scheduler
@@ -39,22 +49,6 @@ def generate_asn(ipv4_address: IPv4Address) -> Optional[int]:
     return PRIVATE_ASN_START + (ipv4_address.packed[2]*256 + ipv4_address.packed[3])
 
 
-def get_evpn_spines(session, settings: dict):
-    logger = get_logger()
-    device_hostnames = []
-    for entry in settings['evpn_spines']:
-        if 'hostname' in entry and Device.valid_hostname(entry['hostname']):
-            device_hostnames.append(entry['hostname'])
-        else:
-            logger.error("Invalid entry specified in settings->evpn_spine, ignoring: {}".format(entry))
-    ret = []
-    for hostname in device_hostnames:
-        dev = session.query(Device).filter(Device.hostname == hostname).one_or_none()
-        if dev:
-            ret.append(dev)
-    return ret
-
-
 def resolve_vlanid(vlan_name: str, vxlans: dict) -> Optional[int]:
     logger = get_logger()
     if type(vlan_name) == int:
@@ -81,162 +75,155 @@ def resolve_vlanid_list(vlan_name_list: List[str], vxlans: dict) -> List[int]:
     return ret
 
 
-def push_sync_device(task, dry_run: bool = True, generate_only: bool = False,
-                     job_id: Optional[str] = None,
-                     scheduled_by: Optional[str] = None):
-    """
-    Nornir task to generate config and push to device
+def get_template_vars(hostname: str, sync_context: SyncContext) -> (str, DeviceType, dict):
+    """Collect all variables used to render the config of a device.
 
     Args:
-        task: nornir task, sent by nornir when doing .run()
-        dry_run: Don't commit config to device, just do compare/diff
-        generate_only: Only generate text config, don't try to commit or
-                       even do dry_run compare to running config
+        hostname: Hostname of device
+        sync_context: Prefetched database objects for the device
 
     Returns:
-
+        (platform, device type, dict with template variables)
     """
-    set_thread_data(job_id)
-    logger = get_logger()
-    hostname = task.host.name
-    with sqla_session() as session:
-        dev: Device = session.query(Device).filter(Device.hostname == hostname).one()
-        mgmt_ip = dev.management_ip
-        infra_ip = dev.infra_ip
-        if not mgmt_ip:
-            raise Exception("Could not find management IP for device {}".format(hostname))
-        devtype: DeviceType = dev.device_type
-        if isinstance(dev.platform, str):
-            platform: str = dev.platform
-        else:
-            raise ValueError("Unknown platform: {}".format(dev.platform))
-        settings, settings_origin = get_settings(hostname, devtype)
-        device_variables = {
-            'mgmt_ip': str(mgmt_ip)
+    dev: DeviceView = sync_context.get_device(hostname)
+    if not dev:
+        raise ValueError("Device {} not found in device database".format(hostname))
+    mgmt_ip = dev.management_ip
+    infra_ip = dev.infra_ip
+    if not mgmt_ip:
+        raise Exception("Could not find management IP for device {}".format(hostname))
+    devtype: DeviceType = dev.device_type
+    if isinstance(dev.platform, str):
+        platform: str = dev.platform
+    else:
+        raise ValueError("Unknown platform: {}".format(dev.platform))
+    settings, settings_origin = get_settings(hostname, devtype)
+    device_variables = {
+        'mgmt_ip': str(mgmt_ip)
+    }
+
+    if devtype == DeviceType.ACCESS:
+        neighbor_hostnames = sync_context.get_uplink_peers(hostname)
+        if not neighbor_hostnames:
+            raise Exception("Could not find any uplink neighbors for device {}".format(
+                hostname))
+        mgmtdomain = sync_context.find_mgmtdomain(neighbor_hostnames)
+        if not mgmtdomain:
+            raise Exception(
+                "Could not find appropriate management domain for uplink peer devices: {}".
+                format(neighbor_hostnames))
+
+        mgmt_gw_ipif = IPv4Interface(mgmtdomain.ipv4_gw)
+        access_device_variables = {
+            'mgmt_vlan_id': mgmtdomain.vlan,
+            'mgmt_gw': str(mgmt_gw_ipif.ip),
+            'mgmt_ipif': str(IPv4Interface('{}/{}'.format(mgmt_ip,
+                                                          mgmt_gw_ipif.network.prefixlen))),
+            'mgmt_prefixlen': int(mgmt_gw_ipif.network.prefixlen),
+            'interfaces': []
         }
-
-        if devtype == DeviceType.ACCESS:
-            neighbor_hostnames = dev.get_uplink_peers(session)
-            if not neighbor_hostnames:
-                raise Exception("Could not find any uplink neighbors for device {}".format(
-                    hostname))
-            mgmtdomain = cnaas_nms.db.helper.find_mgmtdomain(session, neighbor_hostnames)
-            if not mgmtdomain:
-                raise Exception(
-                    "Could not find appropriate management domain for uplink peer devices: {}".
-                    format(neighbor_hostnames))
-
-            mgmt_gw_ipif = IPv4Interface(mgmtdomain.ipv4_gw)
-            access_device_variables = {
-                'mgmt_vlan_id': mgmtdomain.vlan,
-                'mgmt_gw': str(mgmt_gw_ipif.ip),
-                'mgmt_ipif': str(IPv4Interface('{}/{}'.format(mgmt_ip,
-                                                              mgmt_gw_ipif.network.prefixlen))),
-                'mgmt_prefixlen': int(mgmt_gw_ipif.network.prefixlen),
-                'interfaces': []
-            }
-            intfs = session.query(Interface).filter(Interface.device == dev).all()
-            intf: Interface
-            for intf in intfs:
-                untagged_vlan = None
-                tagged_vlan_list = []
-                intfdata = None
-                if intf.data:
-                    if 'untagged_vlan' in intf.data:
-                        untagged_vlan = resolve_vlanid(intf.data['untagged_vlan'],
-                                                       settings['vxlans'])
-                    if 'tagged_vlan_list' in intf.data:
-                        tagged_vlan_list = resolve_vlanid_list(intf.data['tagged_vlan_list'],
-                                                               settings['vxlans'])
-                    intfdata = dict(intf.data)
-                access_device_variables['interfaces'].append({
-                    'name': intf.name,
-                    'ifclass': intf.configtype.name,
-                    'untagged_vlan': untagged_vlan,
-                    'tagged_vlan_list': tagged_vlan_list,
-                    'data': intfdata
-                })
-
-            device_variables = {**access_device_variables, **device_variables}
-        elif devtype == DeviceType.DIST or devtype == DeviceType.CORE:
-            asn = generate_asn(infra_ip)
-            fabric_device_variables = {
-                'mgmt_ipif': str(IPv4Interface('{}/32'.format(mgmt_ip))),
-                'mgmt_prefixlen': 32,
-                'infra_ipif': str(IPv4Interface('{}/32'.format(infra_ip))),
-                'infra_ip': str(infra_ip),
-                'interfaces': [],
-                'bgp_ipv4_peers': [],
-                'bgp_evpn_peers': [],
-                'mgmtdomains': [],
-                'asn': asn
-            }
-            ifname_peer_map = dev.get_linknet_localif_mapping(session)
-            if 'interfaces' in settings and settings['interfaces']:
-                for intf in settings['interfaces']:
-                    try:
-                        ifindexnum: int = Interface.interface_index_num(intf['name'])
-                    except ValueError as e:
-                        ifindexnum: int = 0
-                    if 'ifclass' in intf and intf['ifclass'] == 'downlink':
-                        data = {}
-                        if intf['name'] in ifname_peer_map:
-                            data['description'] = ifname_peer_map[intf['name']]
-                        fabric_device_variables['interfaces'].append({
-                            'name': intf['name'],
-                            'ifclass': intf['ifclass'],
-                            'indexnum': ifindexnum,
-                            'data': data
-                        })
-                    elif 'ifclass' in intf and intf['ifclass'] == 'custom':
-                        fabric_device_variables['interfaces'].append({
-                            'name': intf['name'],
-                            'ifclass': intf['ifclass'],
-                            'config': intf['config'],
-                            'indexnum': ifindexnum
-                        })
-            if devtype == DeviceType.DIST:
-                for mgmtdom in cnaas_nms.db.helper.get_all_mgmtdomains(session, hostname):
-                    fabric_device_variables['mgmtdomains'].append({
-                        'id': mgmtdom.id,
-                        'ipv4_gw': mgmtdom.ipv4_gw,
-                        'vlan': mgmtdom.vlan,
-                        'description': mgmtdom.description,
-                        'esi_mac': mgmtdom.esi_mac
+        intf: InterfaceView
+        for intf in sync_context.get_interfaces(hostname):
+            untagged_vlan = None
+            tagged_vlan_list = []
+            intfdata = None
+            if intf.data:
+                if 'untagged_vlan' in intf.data:
+                    untagged_vlan = resolve_vlanid(intf.data['untagged_vlan'],
+                                                   settings['vxlans'])
+                if 'tagged_vlan_list' in intf.data:
+                    tagged_vlan_list = resolve_vlanid_list(intf.data['tagged_vlan_list'],
+                                                           settings['vxlans'])
+                intfdata = dict(intf.data)
+            access_device_variables['interfaces'].append({
+                'name': intf.name,
+                'ifclass': intf.configtype.name,
+                'untagged_vlan': untagged_vlan,
+                'tagged_vlan_list': tagged_vlan_list,
+                'data': intfdata
+            })
+
+        device_variables = {**access_device_variables, **device_variables}
+    elif devtype == DeviceType.DIST or devtype == DeviceType.CORE:
+        asn = generate_asn(infra_ip)
+        fabric_device_variables = {
+            'mgmt_ipif': str(IPv4Interface('{}/32'.format(mgmt_ip))),
+            'mgmt_prefixlen': 32,
+            'infra_ipif': str(IPv4Interface('{}/32'.format(infra_ip))),
+            'infra_ip': str(infra_ip),
+            'interfaces': [],
+            'bgp_ipv4_peers': [],
+            'bgp_evpn_peers': [],
+            'mgmtdomains': [],
+            'asn': asn
+        }
+        ifname_peer_map = sync_context.get_linknet_localif_mapping(hostname)
+        if 'interfaces' in settings and settings['interfaces']:
+            for intf in settings['interfaces']:
+                try:
+                    ifindexnum: int = Interface.interface_index_num(intf['name'])
+                except ValueError as e:
+                    ifindexnum: int = 0
+                if 'ifclass' in intf and intf['ifclass'] == 'downlink':
+                    data = {}
+                    if intf['name'] in ifname_peer_map:
+                        data['description'] = ifname_peer_map[intf['name']]
+                    fabric_device_variables['interfaces'].append({
+                        'name': intf['name'],
+                        'ifclass': intf['ifclass'],
+                        'indexnum': ifindexnum,
+                        'data': data
+                    })
+                elif 'ifclass' in intf and intf['ifclass'] == 'custom':
+                    fabric_device_variables['interfaces'].append({
+                        'name': intf['name'],
+                        'ifclass': intf['ifclass'],
+                        'config': intf['config'],
+                        'indexnum': ifindexnum
                     })
-            # find fabric neighbors
-            fabric_links = []
-            for neighbor_d in dev.get_neighbors(session):
-                if neighbor_d.device_type == DeviceType.DIST or neighbor_d.device_type == DeviceType.CORE:
-                    local_if = dev.get_neighbor_local_ifname(session, neighbor_d)
-                    local_ipif = dev.get_neighbor_local_ipif(session, neighbor_d)
-                    neighbor_ip = dev.get_neighbor_ip(session, neighbor_d)
-                    if local_if:
-                        fabric_device_variables['interfaces'].append({
-                            'name': local_if,
-                            'ifclass': 'fabric',
-                            'ipv4if': local_ipif,
-                            'peer_hostname': neighbor_d.hostname,
-                            'peer_infra_lo': str(neighbor_d.infra_ip),
-                            'peer_ip': str(neighbor_ip),
-                            'peer_asn': generate_asn(neighbor_d.infra_ip)
-                        })
-                        fabric_device_variables['bgp_ipv4_peers'].append({
-                            'peer_hostname': neighbor_d.hostname,
-                            'peer_infra_lo': str(neighbor_d.infra_ip),
-                            'peer_ip': str(neighbor_ip),
-                            'peer_asn': generate_asn(neighbor_d.infra_ip)
-                        })
-            # populate evpn spines data
-            for neighbor_d in get_evpn_spines(session, settings):
-                if neighbor_d.hostname == dev.hostname:
-                    continue
-                fabric_device_variables['bgp_evpn_peers'].append({
-                    'peer_hostname': neighbor_d.hostname,
-                    'peer_infra_lo': str(neighbor_d.infra_ip),
-                    'peer_asn': generate_asn(neighbor_d.infra_ip)
+        if devtype == DeviceType.DIST:
+            for mgmtdom in sync_context.get_all_mgmtdomains(hostname):
+                fabric_device_variables['mgmtdomains'].append({
+                    'id': mgmtdom.id,
+                    'ipv4_gw': mgmtdom.ipv4_gw,
+                    'vlan': mgmtdom.vlan,
+                    'description': mgmtdom.description,
+                    'esi_mac': mgmtdom.esi_mac
                 })
-            device_variables = {**fabric_device_variables, **device_variables}
+        # find fabric neighbors
+        link: TopologyLink
+        for link in sync_context.get_links(hostname):
+            neighbor_d = sync_context.get_device_by_id(link.peer.id)
+            if neighbor_d.device_type == DeviceType.DIST or neighbor_d.device_type == DeviceType.CORE:
+                local_if = link.local_port
+                local_ipif = link.local_ipif
+                neighbor_ip = link.peer_ip
+                if local_if:
+                    fabric_device_variables['interfaces'].append({
+                        'name': local_if,
+                        'ifclass': 'fabric',
+                        'ipv4if': local_ipif,
+                        'peer_hostname': neighbor_d.hostname,
+                        'peer_infra_lo': str(neighbor_d.infra_ip),
+                        'peer_ip': str(neighbor_ip),
+                        'peer_asn': generate_asn(neighbor_d.infra_ip)
+                    })
+                    fabric_device_variables['bgp_ipv4_peers'].append({
+                        'peer_hostname': neighbor_d.hostname,
+                        'peer_infra_lo': str(neighbor_d.infra_ip),
+                        'peer_ip': str(neighbor_ip),
+                        'peer_asn': generate_asn(neighbor_d.infra_ip)
+                    })
+        # populate evpn spines data
+        for neighbor_d in sync_context.get_evpn_spines(settings):
+            if neighbor_d.hostname == dev.hostname:
+                continue
+            fabric_device_variables['bgp_evpn_peers'].append({
+                'peer_hostname': neighbor_d.hostname,
+                'peer_infra_lo': str(neighbor_d.infra_ip),
+                'peer_asn': generate_asn(neighbor_d.infra_ip)
+            })
+        device_variables = {**fabric_device_variables, **device_variables}
 
     # Add all environment variables starting with TEMPLATE_SECRET_ to
     # the list of configuration variables. The idea is to store secret
@@ -252,23 +239,73 @@ def push_sync_device(task, dry_run: bool = True, generate_only: bool = False,
     # device variables that contains more information
     template_vars = {**settings, **device_variables, **template_secrets}
 
-    with open('/etc/cnaas-nms/repository.yml', 'r') as db_file:
-        repo_config = yaml.safe_load(db_file)
-        local_repo_path = repo_config['templates_local']
+    return platform, devtype, template_vars
+
+
+def get_render_bundle(host, sync_context: SyncContext) -> RenderBundle:
+    """Collect everything needed to render config for a nornir host, the
+    result can be rendered in another process."""
+    platform, devtype, template_vars = get_template_vars(host.name, sync_context)
+    return RenderBundle(
+        host=RenderHost(name=host.name, hostname=host.hostname, platform=host.platform,
+                        port=host.port),
+        template=get_entrypoint(platform, devtype.name),
+        template_vars=template_vars
+    )
+
+
+def prerendered_config(task, config: str) -> Result:
+    """Nornir task that returns a config that was already rendered."""
+    return Result(host=task.host, result=config)
+
+
+def push_sync_device(task, dry_run: bool = True, generate_only: bool = False,
+                     job_id: Optional[str] = None,
+                     scheduled_by: Optional[str] = None,
+                     sync_context: Optional[SyncContext] = None,
+                     rendered: Optional[Dict[str, RenderResult]] = None,
+                     calc_score: bool = True):
+    """
+    Nornir task to generate config and push to device
 
-    mapfile = os.path.join(local_repo_path, platform, 'mapping.yml')
-    if not os.path.isfile(mapfile):
-        raise RepoStructureException("File {} not found in template repo".format(mapfile))
-    with open(mapfile, 'r') as f:
-        mapping = yaml.safe_load(f)
-        template = mapping[devtype.name]['entrypoint']
+    Args:
+        task: nornir task, sent by nornir when doing .run()
+        dry_run: Don't commit config to device, just do compare/diff
+        generate_only: Only generate text config, don't try to commit or
+                       even do dry_run compare to running config
+        sync_context: Prefetched database objects, if not specified the
+                      device data will be loaded from the database
+        rendered: Configs already rendered by render_configs, if the host
+                  is found here the config is not rendered again
+        calc_score: Calculate change score for the host, can be turned off
+                    if the caller calculates scores for all hosts itself
 
-    logger.debug("Generate config for host: {}".format(task.host.name))
-    r = task.run(task=text.template_file,
-                 name="Generate device config",
-                 template=template,
-                 path=f"{local_repo_path}/{task.host.platform}",
-                 **template_vars)
+    Returns:
+
+    """
+    set_thread_data(job_id)
+    logger = get_logger()
+    hostname = task.host.name
+    if rendered and hostname in rendered:
+        render_result = rendered[hostname]
+        if render_result.error:
+            raise Exception(render_result.error)
+        r = task.run(task=prerendered_config,
+                     name="Generate device config",
+                     config=render_result.config)
+        template_vars = render_result.template_vars
+    else:
+        if not sync_context:
+            with sqla_session() as session:
+                sync_context = SyncContext.load(session, [hostname])
+        platform, devtype, template_vars = get_template_vars(hostname, sync_context)
+        template = get_entrypoint(platform, devtype.name)
+
+        logger.debug("Generate config for host: {}".format(task.host.name))
+        r = task.run(task=template_file,
+                     name="Generate device config",
+                     template=template,
+                     **template_vars)
 
     # TODO: Handle template not found, variables not defined
     # jinja2.exceptions.UndefinedError
@@ -282,24 +319,108 @@ def push_sync_device(task, dry_run: bool = True, generate_only: bool = False,
         logger.debug("Synchronize device config for host: {} ({}:{})".format(
             task.host.name, task.host.hostname, task.host.port))
 
-        task.host.open_connection("napalm", configuration=task.nornir.config)
+        # Connection is opened on first use and kept open for the whole job
         task.run(task=networking.napalm_configure,
                  name="Sync device config",
                  replace=True,
                  configuration=task.host["config"],
                  dry_run=dry_run
                  )
-        task.host.close_connection("napalm")
 
-        if task.results[1].diff:
-            config = task.results[1].host["config"]
-            diff = task.results[1].diff
-            task.host["change_score"] = calculate_score(config, diff)
-        else:
-            task.host["change_score"] = 0
+        if calc_score:
+            if task.results[1].diff:
+                config = task.results[1].host["config"]
+                diff = task.results[1].diff
+                task.host["change_score"] = calculate_score(config, diff)
+            else:
+                task.host["change_score"] = 0
     if job_id:
-        with redis_session() as db:
-            db.lpush('finished_devices_' + str(job_id), task.host.name)
+        report_finished_device(job_id, task.host.name)
+
+
+def strip_secrets(template_vars: dict) -> dict:
+    """Remove TEMPLATE_SECRET_ variables, for storing template variables."""
+    return {k: v for k, v in template_vars.items() if not k.startswith('TEMPLATE_SECRET_')}
+
+
+def render_device_configs(nr, sync_context: SyncContext, job_id: Optional[int] = None,
+                          use_cache: bool = True) -> Dict[str, RenderResult]:
+    """Render configs for all hosts in nr and save them as config artifacts.
+    Hosts that have an artifact rendered from the same inputs are not
+    rendered again, the rest are rendered using worker processes if there
+    are many hosts.
+
+    Args:
+        nr: Nornir object filtered to hosts to render config for
+        sync_context: Prefetched database objects for the hosts
+        job_id: Job that rendered the configs
+        use_cache: Reuse configs from existing artifacts
+
+    Returns:
+        Render result for each hostname
+    """
+    template_commit = template_cache.commit
+    settings_commit = get_settings_commit()
+    bundles: Dict[str, RenderBundle] = {}
+    rendered: Dict[str, RenderResult] = {}
+    for hostname, host in nr.inventory.hosts.items():
+        try:
+            bundles[hostname] = get_render_bundle(host, sync_context)
+        except Exception as e:
+            rendered[hostname] = RenderResult(error=str(e))
+    jinja_filters = nr.config.jinja2.filters
+    input_hashes = {hostname: calc_input_hash(bundle.host.platform, bundle.template,
+                                              template_commit, bundle.template_vars,
+                                              jinja_filters)
+                    for hostname, bundle in bundles.items()}
+
+    now = datetime.datetime.utcnow()
+    if use_cache:
+        with sqla_session() as session:
+            artifact: ConfigArtifact
+            for hostname, artifact in ConfigArtifact.get_by_inputs(session, input_hashes).items():
+                artifact.last_used = now
+                rendered[hostname] = RenderResult(
+                    config=artifact.config,
+                    template_vars=bundles[hostname].template_vars,
+                    artifact_key=artifact.artifact_key,
+                    cached=True
+                )
+
+    new_results = render_configs(
+        {hostname: bundle for hostname, bundle in bundles.items() if hostname not in rendered},
+        jinja_filters)
+    artifacts = []
+    for hostname, result in new_results.items():
+        rendered[hostname] = result
+        if result.error:
+            continue
+        result.artifact_key = calc_artifact_key(result.config, template_commit, settings_commit)
+        artifacts.append({
+            'hostname': hostname,
+            'artifact_key': result.artifact_key,
+            'input_hash': input_hashes[hostname],
+            'config_hash': hashlib.sha256(result.config.encode()).hexdigest(),
+            'template_commit': template_commit,
+            'settings_commit': settings_commit,
+            'config': result.config,
+            'template_vars': json.loads(json.dumps(strip_secrets(result.template_vars),
+                                                   default=str)),
+            'job_id': job_id,
+            'last_used': now
+        })
+    if artifacts:
+        with sqla_session() as session:
+            stmt = pg_insert(ConfigArtifact.__table__).values(artifacts)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['hostname', 'input_hash'],
+                set_={col: stmt.excluded[col] for col in
+                      ['artifact_key', 'config_hash', 'template_commit', 'settings_commit',
+                       'config', 'template_vars', 'job_id', 'last_used']}
+            )
+            session.execute(stmt)
+            ConfigArtifact.purge(session, [artifact['hostname'] for artifact in artifacts])
+    return rendered
 
 
 def generate_only(hostname: str) -> (str, dict):
@@ -312,31 +433,95 @@ def generate_only(hostname: str) -> (str, dict):
     Returns:
         (string with config, dict with available template variables)
     """
+    config, template_vars, _ = generate_artifact(hostname)
+    return config, template_vars
+
+
+def generate_artifact(hostname: str) -> (str, dict, Optional[RenderResult]):
+    """
+    Generate configuration for a device, or get it from a config artifact
+    if nothing used to generate the config has changed.
+
+    Args:
+        hostname: Hostname of device generate config for
+
+    Returns:
+        (string with config, dict with available template variables,
+         render result)
+    """
     logger = get_logger()
     nr = cnaas_nms.confpush.nornir_helper.cnaas_init()
     nr_filtered = nr.filter(name=hostname).filter(managed=True)
-    template_vars = {}
     if len(nr_filtered.inventory.hosts) != 1:
         raise ValueError("Invalid hostname: {}".format(hostname))
+    with sqla_session() as session:
+        sync_context = SyncContext.load(session, [hostname])
     try:
-        nrresult = nr_filtered.run(task=push_sync_device, generate_only=True)
-        if nrresult[hostname][0].failed:
-            raise Exception("Could not generate config for device {}: {}".format(
-                hostname, nrresult[hostname][0].result
-            ))
-        if "template_vars" in nrresult[hostname][1].host:
-            template_vars = nrresult[hostname][1].host["template_vars"]
-        if nrresult.failed:
-            print_result(nrresult)
-            raise Exception("Failed to generate config for {}".format(hostname))
-
-        return nrresult[hostname][1].result, template_vars
+        result = render_device_configs(nr_filtered, sync_context)[hostname]
     except Exception as e:
         logger.exception("Exception while generating config: {}".format(str(e)))
-        if len(nrresult[hostname]) >= 2:
-            return nrresult[hostname][1].result, template_vars
-        else:
-            return str(e), template_vars
+        return str(e), {}, None
+    if result.error:
+        logger.error("Could not generate config for device {}: {}".format(
+            hostname, result.error))
+        return result.error, result.template_vars or {}, result
+    return result.config, result.template_vars, result
+
+
+@job_wrapper
+def generate_configs(hostname: Optional[str] = None, device_type: Optional[str] = None,
+                     group: Optional[str] = None, use_cache: bool = True,
+                     job_id: Optional[int] = None,
+                     scheduled_by: Optional[str] = None) -> DictJobResult:
+    """Generate configs for managed devices and save them as config
+    artifacts, without connecting to any device. If no arguments are
+    specified configs are generated for all managed devices.
+
+    Args:
+        hostname: Specify a single host by hostname
+        device_type: Specify a device type
+        group: Specify a group of devices
+        use_cache: Don't render devices that has an artifact rendered from
+                   the same inputs
+        job_id: job_id provided by scheduler when adding a new job
+        scheduled_by: Username from JWT
+
+    Returns:
+        DictJobResult
+    """
+    logger = get_logger()
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init()
+    if hostname:
+        nr_filtered = nr.filter(name=hostname).filter(managed=True)
+    elif device_type:
+        nr_filtered = nr.filter(F(groups__contains='T_'+device_type)).filter(managed=True)
+    elif group:
+        nr_filtered = nr.filter(F(groups__contains=group)).filter(managed=True)
+    else:
+        nr_filtered = nr.filter(managed=True)
+    device_list = list(nr_filtered.inventory.hosts.keys())
+    logger.info("Device(s) selected for config generation: {}".format(device_list))
+
+    with sqla_session() as session:
+        sync_context = SyncContext.load(session, device_list)
+    rendered = render_device_configs(nr_filtered, sync_context, job_id=job_id,
+                                     use_cache=use_cache)
+    devices = {}
+    for device, result in rendered.items():
+        devices[device] = {
+            'failed': bool(result.error),
+            'artifact_key': result.artifact_key,
+            'cached': result.cached,
+            'error': result.error
+        }
+        if job_id:
+            report_finished_device(job_id, device)
+    failed = [device for device, data in devices.items() if data['failed']]
+    if failed:
+        logger.error("Could not generate config for devices: {}".format(failed))
+    logger.info("Generated config for {} devices, {} from artifact cache".format(
+        len(devices) - len(failed), len([d for d in devices.values() if d['cached']])))
+    return DictJobResult(result={'devices': devices})
 
 
 def sync_check_hash(task, force=False, job_id=None):
@@ -356,27 +541,28 @@ def sync_check_hash(task, force=False, job_id=None):
     if stored_hash is None:
         return
 
-    task.host.open_connection("napalm", configuration=task.nornir.config)
     res = task.run(task=napalm_get, getters=["config"])
-    task.host.close_connection("napalm")
 
-    running_config = dict(res.result)['config']['running'].encode()
+    running_config = dict(res.result)['config']['running']
     if running_config is None:
         raise Exception('Failed to get running configuration')
-    hash_obj = sha256(running_config)
-    running_hash = hash_obj.hexdigest()
+    # Keep running config for this job and the current_config API
+    snapshot = save_snapshot(task.host.name, running_config, SnapshotPhase.PRE_SYNC, job_id)
+    running_hash = snapshot.config_hash
     if stored_hash != running_hash:
         raise Exception('Device {} configuration is altered outside of CNaaS!'.format(task.host.name))
 
 
-def update_config_hash(task):
+def update_config_hash(task, job_id=None):
     logger = get_logger()
     try:
         res = task.run(task=napalm_get, getters=["config"])
         if not isinstance(res, MultiResult) or len(res) != 1 or not isinstance(res[0].result, dict) \
                 or 'config' not in res[0].result:
             raise Exception("Unable to get config from device")
-        new_config_hash = calc_config_hash(task.host.name, res[0].result['config']['running'])
+        snapshot = save_snapshot(task.host.name, res[0].result['config']['running'],
+                                 SnapshotPhase.POST_SYNC, job_id)
+        new_config_hash = snapshot.config_hash
         if not new_config_hash:
             raise ValueError("Empty config hash")
     except Exception as e:
@@ -414,7 +600,7 @@ def sync_devices(hostname: Optional[str] = None, device_type: Optional[str] = No
         NornirJobResult
     """
     logger = get_logger()
-    nr = cnaas_nms.confpush.nornir_helper.cnaas_init()
+    nr = cnaas_nms.confpush.nornir_helper.cnaas_init('sync')
     if hostname:
         nr_filtered = nr.filter(name=hostname).filter(managed=True)
     else:
@@ -440,100 +626,154 @@ def sync_devices(hostname: Optional[str] = None, device_type: Optional[str] = No
         device_list
     ))
 
-    try:
-        nrresult = nr_filtered.run(task=sync_check_hash,
-                                   force=force,
-                                   job_id=job_id)
-        print_result(nrresult)
-    except Exception as e:
-        logger.exception("Exception while checking config hash: {}".format(str(e)))
-        raise e
-    else:
-        if nrresult.failed:
-            raise Exception('Configuration hash check failed for {}'.format(
-                ' '.join(nrresult.failed_hosts.keys())))
-
-    if not dry_run:
+    with sqla_session() as session:
+        sync_context = SyncContext.load(session, device_list)
+    # Render configs in worker processes first, only device I/O runs in
+    # the nornir threads
+    rendered = render_device_configs(nr_filtered, sync_context, job_id=job_id)
+    generated_hashes = {host: hashlib.sha256(result.config.encode()).hexdigest()
+                        for host, result in rendered.items() if not result.error}
+
+    # Devices that would get the same generated config as they were last
+    # synchronized to don't need to be compared with their running config,
+    # a device selected by hostname is always compared
+    skipped_hosts = []
+    if not force and not resync and not hostname:
         with sqla_session() as session:
-            logger.info("Trying to acquire lock for devices to run syncto job: {}".format(job_id))
-            if not Joblock.acquire_lock(session, name='devices', job_id=job_id):
-                raise JoblockError("Unable to acquire lock for configuring devices")
-
+            for host, generated_config_hash, confhash in session.query(
+                    Device.hostname, Device.generated_config_hash, Device.confhash).\
+                    filter(Device.hostname.in_(list(generated_hashes.keys()))):
+                if confhash and generated_config_hash == generated_hashes[host]:
+                    skipped_hosts.append(host)
+        if skipped_hosts:
+            logger.info("Generated config unchanged since last sync, skipping: {}".format(
+                skipped_hosts))
+    nr_sync = nr_filtered.filter(filter_func=lambda h: h.name not in skipped_hosts)
+
+    # NAPALM connections are reused by all phases of the job
+    open_job_connections(nr_sync)
+    devices_locked = False
     try:
-        nrresult = nr_filtered.run(task=push_sync_device, dry_run=dry_run,
-                                   job_id=job_id)
-        print_result(nrresult)
-    except Exception as e:
-        logger.exception("Exception while synchronizing devices: {}".format(str(e)))
         try:
-            if not dry_run:
-                with sqla_session() as session:
-                    logger.info("Releasing lock for devices from syncto job: {}".format(job_id))
-                    Joblock.release_lock(session, job_id=job_id)
-        except Exception:
-            logger.error("Unable to release devices lock after syncto job")
-        return NornirJobResult(nrresult=nrresult)
-
-    failed_hosts = list(nrresult.failed_hosts.keys())
-    for hostname in failed_hosts:
-        logger.error("Synchronization of device '{}' failed".format(hostname))
-
-    if nrresult.failed:
-        logger.error("Not all devices were successfully synchronized")
-
-    total_change_score = 1
-    change_scores = []
-    changed_hosts = []
-    unchanged_hosts = []
-    # calculate change impact score
-    for host, results in nrresult.items():
-        if len(results) != 3:
-            logger.debug("Unable to calculate change score for failed device {}".format(host))
-        elif results[2].diff:
-            changed_hosts.append(host)
-            if "change_score" in results[0].host:
-                change_scores.append(results[0].host["change_score"])
-                logger.debug("Change score for host {}: {}".format(
-                    host, results[0].host["change_score"]))
+            nrresult = nr_sync.run(task=sync_check_hash,
+                                       force=force,
+                                       job_id=job_id)
+            print_result(nrresult)
+        except Exception as e:
+            logger.exception("Exception while checking config hash: {}".format(str(e)))
+            raise e
         else:
-            unchanged_hosts.append(host)
-            change_scores.append(0)
-            logger.debug("Empty diff for host {}, 0 change score".format(
-                host))
+            if nrresult.failed:
+                raise Exception('Configuration hash check failed for {}'.format(
+                    ' '.join(nrresult.failed_hosts.keys())))
 
-    if not dry_run:
-        def exclude_filter(host, exclude_list=failed_hosts+unchanged_hosts):
-            if host.name in exclude_list:
-                return False
-            else:
-                return True
+        if not dry_run:
+            with sqla_session() as session:
+                logger.info("Trying to acquire lock for devices to run syncto job: {}".format(
+                    job_id))
+                if not Joblock.acquire_lock(session, name='devices', job_id=job_id):
+                    raise JoblockError("Unable to acquire lock for configuring devices")
+            devices_locked = True
 
-        # set new config hash for devices that was successfully updated
-        nr_successful = nr_filtered.filter(filter_func=exclude_filter)
         try:
-            nrresult_confighash = nr_successful.run(task=update_config_hash)
+            nrresult = nr_sync.run(task=push_sync_device, dry_run=dry_run,
+                                       job_id=job_id, sync_context=sync_context,
+                                       rendered=rendered, calc_score=False)
+            print_result(nrresult)
         except Exception as e:
-            logger.exception("Exception while updating config hashes: {}".format(str(e)))
-        else:
-            if nrresult_confighash.failed:
-                logger.error("Unable to update some config hashes: {}".format(
-                    list(nrresult_confighash.failed_hosts.keys())))
+            logger.exception("Exception while synchronizing devices: {}".format(str(e)))
+            return NornirJobResult(nrresult=nrresult)
 
-    # set devices as synchronized if needed
-    with sqla_session() as session:
-        for hostname in changed_hosts:
-            if dry_run:
-                dev: Device = session.query(Device).filter(Device.hostname == hostname).one()
-                dev.synchronized = False
+        failed_hosts = list(nrresult.failed_hosts.keys())
+        for hostname in failed_hosts:
+            logger.error("Synchronization of device '{}' failed".format(hostname))
+
+        if nrresult.failed:
+            logger.error("Not all devices were successfully synchronized")
+
+        # Calculate change scores for all changed hosts in worker processes
+        diffs = {}
+        for host, results in nrresult.items():
+            if len(results) == 3 and results[2].diff:
+                diffs[host] = (results[0].host["config"], results[2].diff)
+        pattern_hits = {}
+        for host, change_score in score_changes(diffs).items():
+            nrresult[host][0].host["change_score"] = change_score.score
+            for name, count in change_score.hits.items():
+                pattern_hits[name] = pattern_hits.get(name, 0) + count
+        if pattern_hits:
+            logger.debug("Changed lines per change score pattern: {}".format(pattern_hits))
+
+        total_change_score = 1
+        change_scores = []
+        changed_hosts = []
+        unchanged_hosts = []
+        # calculate change impact score
+        for host, results in nrresult.items():
+            if len(results) != 3:
+                logger.debug("Unable to calculate change score for failed device {}".format(host))
+            elif results[2].diff:
+                changed_hosts.append(host)
+                if "change_score" in results[0].host:
+                    change_scores.append(results[0].host["change_score"])
+                    logger.debug("Change score for host {}: {}".format(
+                        host, results[0].host["change_score"]))
             else:
-                dev: Device = session.query(Device).filter(Device.hostname == hostname).one()
-                dev.synchronized = True
-        for hostname in unchanged_hosts:
-            dev: Device = session.query(Device).filter(Device.hostname == hostname).one()
-            dev.synchronized = True
+                unchanged_hosts.append(host)
+                change_scores.append(0)
+                logger.debug("Empty diff for host {}, 0 change score".format(
+                    host))
+        for host in skipped_hosts:
+            unchanged_hosts.append(host)
+            change_scores.append(0)
+
         if not dry_run:
-            logger.info("Releasing lock for devices from syncto job: {}".format(job_id))
-            Joblock.release_lock(session, job_id=job_id)
+            def exclude_filter(host, exclude_list=failed_hosts+unchanged_hosts):
+                if host.name in exclude_list:
+                    return False
+                else:
+                    return True
+
+            # set new config hash for devices that was successfully updated
+            nr_successful = nr_sync.filter(filter_func=exclude_filter)
+            try:
+                nrresult_confighash = nr_successful.run(task=update_config_hash,
+                                                         job_id=job_id)
+            except Exception as e:
+                logger.exception("Exception while updating config hashes: {}".format(str(e)))
+            else:
+                if nrresult_confighash.failed:
+                    logger.error("Unable to update some config hashes: {}".format(
+                        list(nrresult_confighash.failed_hosts.keys())))
+
+        # set devices as synchronized if needed
+        with sqla_session() as session:
+            if dry_run:
+                unsynced_count = Device.set_syncstatus(session, changed_hosts, False)
+                synced_count = Device.set_syncstatus(session, unchanged_hosts, True)
+            else:
+                unsynced_count = 0
+                synced_count = Device.set_syncstatus(session, changed_hosts + unchanged_hosts,
+                                                     True)
+            logger.debug("Sync status changed for {} devices to synchronized and {} devices "
+                         "to unsynchronized".format(synced_count, unsynced_count))
+            # Remember which generated config devices are now synchronized to
+            synced_hosts = unchanged_hosts if dry_run else changed_hosts + unchanged_hosts
+            Device.set_generated_config_hashes(
+                session,
+                {host: generated_hashes[host] for host in synced_hosts
+                 if host in generated_hashes and host not in failed_hosts})
+    finally:
+        close_job_connections(nr_sync)
+        # Always release the lock once devices may have been configured,
+        # also if something after the push fails
+        if devices_locked:
+            try:
+                with sqla_session() as session:
+                    logger.info("Releasing lock for devices from syncto job: {}".format(job_id))
+                    Joblock.release_lock(session, job_id=job_id)
+            except Exception:
+                logger.error("Unable to release devices lock after syncto job")
 
     if not change_scores or total_change_score >= 100 or failed_hosts:
         total_change_score = 100
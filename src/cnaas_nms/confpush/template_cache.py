@@ -0,0 +1,246 @@
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Callable, FrozenSet, List, Set, Tuple
+
+import yaml
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template, meta
+from jinja2.exceptions import TemplateNotFound
+from nornir.core.task import Result
+
+from cnaas_nms.db.exceptions import RepoStructureException
+from cnaas_nms.tools.githelper import get_repo_commit
+from cnaas_nms.tools.log import get_logger
+
+
+# Settings keys that are read by get_template_vars in sync_devices when
+# building template variables, even if no template references them
+CODE_SETTINGS_KEYS = {'interfaces', 'vxlans', 'evpn_spines'}
+
+
+@dataclass
+class TemplateDependencies:
+    # Names of all templates used when rendering, including the template itself
+    templates: Set[str] = field(default_factory=set)
+    # Variables that the templates read from the render context
+    variables: Set[str] = field(default_factory=set)
+    # False if some template name is only known when rendering, like
+    # {% include variable %}
+    complete: bool = True
+
+
+def find_template_dependencies(env: Environment, template: str) -> TemplateDependencies:
+    """Follow include, import and extends statements from template by
+    parsing the Jinja AST of each template, without rendering anything.
+
+    Args:
+        env: Environment with a loader for the templates
+        template: Name of the template to start from, usually an entrypoint
+
+    Returns:
+        Templates and variables used by template
+    """
+    deps = TemplateDependencies()
+    pending = [template]
+    while pending:
+        name = pending.pop()
+        if name in deps.templates:
+            continue
+        deps.templates.add(name)
+        try:
+            source, _, _ = env.loader.get_source(env, name)
+        except TemplateNotFound:
+            # Missing templates can be included with "ignore missing", keep
+            # the name so that adding the template later is noticed
+            if name == template:
+                raise
+            continue
+        ast = env.parse(source, name)
+        deps.variables.update(meta.find_undeclared_variables(ast))
+        for ref in meta.find_referenced_templates(ast):
+            if ref is None:
+                deps.complete = False
+            else:
+                pending.append(ref)
+    return deps
+
+
+def get_filters_key(jinja_filters: Optional[Dict[str, Callable]]) -> \
+        FrozenSet[Tuple[str, Callable]]:
+    """Key identifying a set of jinja filters, environments with different
+    filters are cached separately."""
+    return frozenset((jinja_filters or {}).items())
+
+
+class TemplateCache(object):
+    """Process wide cache of Jinja2 environments and parsed mapping.yml files,
+    one environment per platform and set of jinja filters. Compiled templates
+    are kept by each environment, so every template is only parsed once per
+    templates repository commit."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local_repo_path: Optional[str] = None
+        self._commit: Optional[str] = None
+        self._environments: Dict[Tuple[str, FrozenSet[Tuple[str, Callable]]], Environment] = {}
+        self._mappings: Dict[str, dict] = {}
+        self._dependencies: Dict[Tuple[str, str], TemplateDependencies] = {}
+
+    @property
+    def local_repo_path(self) -> str:
+        if not self._local_repo_path:
+            with open('/etc/cnaas-nms/repository.yml', 'r') as db_file:
+                repo_config = yaml.safe_load(db_file)
+                self._local_repo_path = repo_config['templates_local']
+        return self._local_repo_path
+
+    def _check_commit(self, commit: Optional[str]):
+        """Drop everything cached if the templates repository has moved to
+        another commit since the cache was populated. Must be called with
+        the lock held, commit is read by the caller before taking the lock."""
+        if commit != self._commit or commit is None:
+            self._environments = {}
+            self._mappings = {}
+            self._dependencies = {}
+            self._commit = commit
+
+    def clear(self):
+        with self._lock:
+            self._environments = {}
+            self._mappings = {}
+            self._dependencies = {}
+            self._commit = None
+
+    @property
+    def commit(self) -> Optional[str]:
+        commit = get_repo_commit(self.local_repo_path)
+        with self._lock:
+            self._check_commit(commit)
+            return self._commit
+
+    def get_environment(self, platform: str,
+                        jinja_filters: Optional[Dict[str, Callable]] = None) -> Environment:
+        commit = get_repo_commit(self.local_repo_path)
+        key = (platform, get_filters_key(jinja_filters))
+        with self._lock:
+            self._check_commit(commit)
+            if key not in self._environments:
+                env = Environment(
+                    loader=FileSystemLoader(os.path.join(self.local_repo_path, platform)),
+                    undefined=StrictUndefined, trim_blocks=True, auto_reload=False
+                )
+                env.filters.update(jinja_filters or {})
+                self._environments[key] = env
+            return self._environments[key]
+
+    def get_mapping(self, platform: str) -> dict:
+        commit = get_repo_commit(self.local_repo_path)
+        with self._lock:
+            self._check_commit(commit)
+            if platform not in self._mappings:
+                mapfile = os.path.join(self.local_repo_path, platform, 'mapping.yml')
+                if not os.path.isfile(mapfile):
+                    raise RepoStructureException(
+                        "File {} not found in template repo".format(mapfile))
+                with open(mapfile, 'r') as f:
+                    self._mappings[platform] = yaml.safe_load(f)
+            return self._mappings[platform]
+
+    def get_template(self, platform: str, template: str,
+                     jinja_filters: Optional[Dict[str, Callable]] = None) -> Template:
+        return self.get_environment(platform, jinja_filters).get_template(template)
+
+    def get_platforms(self) -> List[str]:
+        """Get names of platform directories that have a mapping.yml."""
+        platforms = []
+        for platform in sorted(os.listdir(self.local_repo_path)):
+            path = os.path.join(self.local_repo_path, platform)
+            if not os.path.isdir(path) or platform.startswith('.'):
+                continue
+            if os.path.isfile(os.path.join(path, 'mapping.yml')):
+                platforms.append(platform)
+        return platforms
+
+    def get_dependencies(self, platform: str, template: str) -> TemplateDependencies:
+        commit = get_repo_commit(self.local_repo_path)
+        with self._lock:
+            self._check_commit(commit)
+            if (platform, template) in self._dependencies:
+                return self._dependencies[(platform, template)]
+        # Templates are only parsed here, so use a separate environment
+        # without filters instead of populating the rendering environment
+        env = Environment(loader=FileSystemLoader(os.path.join(self.local_repo_path, platform)))
+        deps = find_template_dependencies(env, template)
+        with self._lock:
+            self._dependencies[(platform, template)] = deps
+        return deps
+
+
+template_cache = TemplateCache()
+
+
+def clear_template_cache():
+    logger = get_logger()
+    logger.debug("Clearing template cache")
+    template_cache.clear()
+
+
+def get_entrypoint(platform: str, devtype_name: str) -> str:
+    """Get the name of the entrypoint template for a device type from
+    mapping.yml of the platform."""
+    mapping = template_cache.get_mapping(platform)
+    try:
+        return mapping[devtype_name]['entrypoint']
+    except (KeyError, TypeError):
+        raise RepoStructureException(
+            "No entrypoint for device type {} found in {}/mapping.yml".format(
+                devtype_name, platform))
+
+
+def get_template_dependencies(platform: str, template: str) -> TemplateDependencies:
+    """Get templates and variables used by a template, cached per templates
+    repository commit."""
+    return template_cache.get_dependencies(platform, template)
+
+
+def get_devtype_variables(devtype_name: str) -> Optional[Set[str]]:
+    """Get variables that templates for a device type reference on any
+    platform, including settings keys used when building template variables.
+
+    Returns:
+        Set of variable names, or None if they could not be determined
+    """
+    variables = set(CODE_SETTINGS_KEYS)
+    for platform in template_cache.get_platforms():
+        mapping = template_cache.get_mapping(platform)
+        if not isinstance(mapping, dict) or devtype_name not in mapping:
+            continue
+        deps = get_template_dependencies(platform, get_entrypoint(platform, devtype_name))
+        if not deps.complete:
+            return None
+        variables.update(deps.variables)
+    return variables
+
+
+def render_template(platform: str, template: str,
+                    jinja_filters: Optional[Dict[str, Callable]] = None, **kwargs) -> str:
+    return template_cache.get_template(platform, template, jinja_filters).render(**kwargs)
+
+
+def template_file(task, template: str, jinja_filters: Optional[Dict[str, Callable]] = None,
+                  **kwargs) -> Result:
+    """Nornir task to render a template from the templates repository, like
+    nornir.plugins.tasks.text.template_file but using cached environments.
+
+    Args:
+        task: nornir task
+        template: filename of template inside the platform directory
+        jinja_filters: jinja filters to enable, defaults to nornir.config.jinja2.filters
+        **kwargs: additional data to pass to the template
+
+    Returns:
+        Result with the rendered string
+    """
+    jinja_filters = jinja_filters or task.nornir.config.jinja2.filters
+    text = render_template(task.host.platform, template, jinja_filters,
+                           host=task.host, **kwargs)
+    return Result(host=task.host, result=text)
@@ -0,0 +1,97 @@
+import re
+import unittest
+
+from cnaas_nms.confpush.changescore import calculate_score, score_change, \
+    change_patterns, ChangeScorer, DEFAULT_LINE_SCORE
+
+
+def reference_score(config: str, diff: str) -> float:
+    """Score calculated by trying one line pattern at a time."""
+    changed_lines = 0
+    total_line_score = 0.0
+    for line in diff.split('\n'):
+        if line.startswith('+') or line.startswith('-'):
+            changed_lines += 1
+            for pattern in change_patterns:
+                if 'block' not in pattern and re.match(pattern['regex'], line):
+                    total_line_score += pattern['modifier']
+                    break
+            else:
+                total_line_score += DEFAULT_LINE_SCORE
+    changed_ratio = changed_lines / float(len(config.split('\n')))
+    return (changed_ratio*100*0.2) + (total_line_score*0.8)
+
+
+class ChangeScoreTests(unittest.TestCase):
+    config = "hostname eosaccess\ninterface Ethernet1\n   description test\n" \
+             "   spanning-tree portfast\nrouter bgp 65000\n   neighbor 10.0.0.1\n"
+
+    def test_same_as_single_patterns(self):
+        diffs = [
+            "",
+            "+   description test",
+            "-vlan 10\n+   description test\n-ip address 10.0.0.1/24",
+            " interface Ethernet1\n-   spanning-tree portfast\n+   switchport mode access",
+            "-   no ip routing vrf MGMT\n-   router-id 10.0.0.1\n+hostname new",
+        ]
+        for diff in diffs:
+            self.assertAlmostEqual(calculate_score(self.config, diff),
+                                   reference_score(self.config, diff))
+
+    def test_first_match_wins(self):
+        # Matches both "removed ip address" and "removed routing"
+        result = score_change(self.config, "-ip address router 10.0.0.1/24")
+        self.assertEqual(result.hits, {'removed ip address': 1})
+
+    def test_hits(self):
+        diff = "--- running\n+++ session\n-vlan 10\n-vlan 20\n+   description x\n+hostname a"
+        result = score_change(self.config, diff)
+        self.assertEqual(result.changed_lines, 6)
+        self.assertEqual(result.config_lines, 7)
+        self.assertEqual(result.hits, {'default': 3, 'removed vlan': 2, 'description': 1})
+
+    def test_block_pattern(self):
+        scorer = ChangeScorer(change_patterns + [
+            {
+                'name': 'removed bgp neighbor',
+                'regex': re.compile(r"^-[ ]*neighbor"),
+                'block': re.compile(r"(router bgp|protocols bgp)"),
+                'modifier': 50.0
+            },
+        ])
+        eos_diff = " router bgp 65000\n-   neighbor 10.0.0.1 remote-as 65001\n" \
+                   " interface Ethernet1\n-   neighbor something"
+        result = scorer.score(self.config, eos_diff)
+        self.assertEqual(result.hits, {'removed bgp neighbor': 1, 'default': 1})
+        junos_diff = "[edit protocols bgp group CORE]\n-    neighbor 10.0.0.1;\n" \
+                     "[edit interfaces]\n-    neighbor 10.0.0.1;"
+        result = scorer.score(self.config, junos_diff)
+        self.assertEqual(result.hits, {'removed bgp neighbor': 1, 'default': 1})
+        # Block patterns are not used outside of their blocks
+        result = score_change(self.config, eos_diff)
+        self.assertEqual(result.hits, {'default': 2})
+
+    def test_pattern_flags(self):
+        scorer = ChangeScorer([
+            {'name': 'shutdown', 'regex': re.compile(r"^\+[ ]*shutdown", re.IGNORECASE),
+             'modifier': 20.0},
+            {'name': 'inline', 'regex': re.compile(r"(?i)^-[ ]*VLAN"), 'modifier': 10.0},
+        ])
+        result = scorer.score("a\n", "+SHUTDOWN\n-vlan 10\n+Description")
+        self.assertEqual(result.hits, {'shutdown': 1, 'inline': 1, 'default': 1})
+        with self.assertRaises(ValueError):
+            ChangeScorer([{'name': 'ascii', 'regex': re.compile(r"^-\w", re.ASCII),
+                           'modifier': 1.0}])
+
+    def test_custom_patterns(self):
+        scorer = ChangeScorer([
+            {'name': 'shutdown', 'regex': re.compile(r"^\+[ ]*shutdown"), 'modifier': 20.0},
+            {'name': 'any', 'regex': re.compile(r"^[+-]"), 'modifier': 2.0},
+        ])
+        result = scorer.score("a\nb\nc\nd\n", "+shutdown\n-foo\n context")
+        self.assertEqual(result.hits, {'shutdown': 1, 'any': 1})
+        self.assertAlmostEqual(result.score, (2 / 5.0 * 100 * 0.2) + (22.0 * 0.8))
+
+
+if __name__ == '__main__':
+    unittest.main()
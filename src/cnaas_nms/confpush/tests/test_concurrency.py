@@ -0,0 +1,45 @@
+import unittest
+import threading
+import time
+
+from cnaas_nms.confpush.concurrency import ConcurrencyManager
+
+
+class ConcurrencyTests(unittest.TestCase):
+    def test_num_workers(self):
+        manager = ConcurrencyManager(workers={'sync': 20, 'firmware': 100},
+                                     pool_size=50, db_reserved=10)
+        self.assertEqual(manager.get_num_workers('sync'), 20)
+        # Capped by database connections available for device workers
+        self.assertEqual(manager.get_num_workers('firmware'), 40)
+        self.assertEqual(manager.get_num_workers('unknown'), 40)
+        manager = ConcurrencyManager(pool_size=5, db_reserved=10)
+        self.assertEqual(manager.get_num_workers(), 1)
+
+    def test_platform_limit(self):
+        manager = ConcurrencyManager(platform_limits={'junos': 2})
+        running = {'junos': 0, 'eos': 0}
+        max_running = {'junos': 0, 'eos': 0}
+        lock = threading.Lock()
+
+        def work(platform):
+            with manager.device_slot(platform):
+                with lock:
+                    running[platform] += 1
+                    max_running[platform] = max(max_running[platform], running[platform])
+                time.sleep(0.05)
+                with lock:
+                    running[platform] -= 1
+
+        threads = [threading.Thread(target=work, args=(platform,))
+                   for platform in ['junos', 'eos'] * 5]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max_running['junos'], 2)
+        self.assertGreater(max_running['eos'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
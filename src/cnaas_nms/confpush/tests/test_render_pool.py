@@ -0,0 +1,21 @@
+import unittest
+
+from cnaas_nms.confpush.changescore import calculate_score
+from cnaas_nms.confpush.render_pool import calculate_scores, RENDER_PARALLEL_MIN
+
+
+class RenderPoolTests(unittest.TestCase):
+    def test_calculate_scores(self):
+        config = "hostname eosaccess\ninterface Ethernet1\n   description test\n"
+        diffs = {}
+        for i in range(RENDER_PARALLEL_MIN * 2):
+            diffs['host{}'.format(i)] = (
+                config, "-vlan {}\n+   description test{}\n-ip address 10.0.0.{}/24".format(i, i, i))
+        scores = calculate_scores(diffs)
+        self.assertEqual(list(scores.keys()), list(diffs.keys()))
+        for hostname, (host_config, diff) in diffs.items():
+            self.assertEqual(scores[hostname], calculate_score(host_config, diff))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import tempfile
+import unittest
+
+from jinja2 import Environment, DictLoader
+
+from cnaas_nms.confpush.template_cache import TemplateCache, find_template_dependencies
+from cnaas_nms.tools.githelper import get_repo_commit
+
+
+class TemplateCacheTests(unittest.TestCase):
+    def test_find_template_dependencies(self):
+        env = Environment(loader=DictLoader({
+            'access.j2': "{% extends 'base.j2' %}{% block body %}"
+                         "{% include 'interfaces.j2' %}{% endblock %}",
+            'base.j2': "{% import 'macros.j2' as m %}hostname {{ hostname }}\n"
+                       "{% block body %}{% endblock %}",
+            'macros.j2': "{% macro vlan(id) %}vlan {{ id }}{% endmacro %}",
+            'interfaces.j2': "{% for intf in interfaces %}{{ intf.name }}{% endfor %}"
+                             "{% include 'optional.j2' ignore missing %}",
+            'unused.j2': "{{ ntp_servers }}",
+        }))
+        deps = find_template_dependencies(env, 'access.j2')
+        self.assertEqual(deps.templates, {'access.j2', 'base.j2', 'macros.j2',
+                                          'interfaces.j2', 'optional.j2'})
+        self.assertEqual(deps.variables, {'hostname', 'interfaces'})
+        self.assertTrue(deps.complete)
+
+    def test_find_dynamic_include(self):
+        env = Environment(loader=DictLoader({
+            'core.j2': "{% include platform_file %}",
+        }))
+        deps = find_template_dependencies(env, 'core.j2')
+        self.assertFalse(deps.complete)
+        self.assertIn('platform_file', deps.variables)
+
+    def test_environment_filters(self):
+        with tempfile.TemporaryDirectory() as repo_path:
+            os.mkdir(os.path.join(repo_path, 'eos'))
+            with open(os.path.join(repo_path, 'eos', 'access.j2'), 'w') as f:
+                f.write("hostname {{ hostname | mark }}")
+            cache = TemplateCache()
+            cache._local_repo_path = repo_path
+            self.assertEqual(
+                cache.get_template('eos', 'access.j2', {'mark': lambda v: v + '-a'}).render(
+                    hostname='sw1'),
+                'hostname sw1-a')
+            # A different filter set must not reuse the first environment
+            self.assertEqual(
+                cache.get_template('eos', 'access.j2', {'mark': lambda v: v + '-b'}).render(
+                    hostname='sw1'),
+                'hostname sw1-b')
+
+    def test_get_repo_commit(self):
+        with tempfile.TemporaryDirectory() as repo_path:
+            self.assertIsNone(get_repo_commit(os.path.join(repo_path, 'missing')))
+            subprocess.run(['git', 'init', '-q', repo_path], check=True)
+            # No commits yet
+            self.assertIsNone(get_repo_commit(repo_path))
+            subprocess.run(['git', '-C', repo_path, '-c', 'user.name=test',
+                            '-c', 'user.email=test@example.com',
+                            'commit', '-q', '--allow-empty', '-m', 'test'], check=True)
+            head = subprocess.check_output(
+                ['git', '-C', repo_path, 'rev-parse', 'HEAD']).decode().strip()
+            self.assertEqual(get_repo_commit(repo_path), head)
+            # Refs moved to packed-refs
+            subprocess.run(['git', '-C', repo_path, 'pack-refs', '--all'], check=True)
+            self.assertEqual(get_repo_commit(repo_path), head)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,64 +1,44 @@
 from typing import Optional
 
-from ipaddress import IPv4Network, IPv4Address, IPv4Interface
-from sqlalchemy.orm import load_only
+from ipaddress import IPv4Network, IPv4Address
 
 from cnaas_nms.db.device import Device, DeviceType
 from cnaas_nms.db.linknet import Linknet
 from cnaas_nms.db.settings import get_settings
+from cnaas_nms.db.ipalloc import find_free_address, get_used_addresses, lock_address_pool
 
 
 def find_free_infra_ip(session) -> Optional[IPv4Address]:
-    """Returns first free IPv4 infra IP."""
-    used_ips = []
-    device_query = session.query(Device). \
-        filter(Device.infra_ip != None).options(load_only("infra_ip"))
-    for device in device_query:
-        used_ips.append(device.infra_ip)
+    """Returns first free IPv4 infra IP. The pool is locked for other
+    allocations until session is committed."""
     settings, settings_origin = get_settings(device_type=DeviceType.CORE)
     infra_ip_net = IPv4Network(settings['underlay']['infra_lo_net'])
-    for num, net in enumerate(infra_ip_net.subnets(new_prefix=32)):
-        ipaddr = IPv4Address(net.network_address)
-        if ipaddr in used_ips:
-            continue
-        else:
-            return ipaddr
+    lock_address_pool(session, infra_ip_net)
+    used_ips = get_used_addresses(session, Device.infra_ip, infra_ip_net)
+    free_net = find_free_address(infra_ip_net, used_ips)
+    if free_net:
+        return IPv4Address(free_net.network_address)
     return None
 
 
 def find_free_mgmt_lo_ip(session) -> Optional[IPv4Address]:
-    """Returns first free IPv4 infra IP."""
-    used_ips = []
-    device_query = session.query(Device). \
-        filter(Device.management_ip != None).options(load_only("management_ip"))
-    for device in device_query:
-        used_ips.append(device.management_ip)
-
+    """Returns first free IPv4 management loopback IP. The pool is locked for
+    other allocations until session is committed."""
     settings, settings_origin = get_settings(device_type=DeviceType.CORE)
     mgmt_lo_net = IPv4Network(settings['underlay']['mgmt_lo_net'])
-    for num, net in enumerate(mgmt_lo_net.subnets(new_prefix=32)):
-        ipaddr = IPv4Address(net.network_address)
-        if ipaddr in used_ips:
-            continue
-        else:
-            return ipaddr
+    lock_address_pool(session, mgmt_lo_net)
+    used_ips = get_used_addresses(session, Device.management_ip, mgmt_lo_net)
+    free_net = find_free_address(mgmt_lo_net, used_ips)
+    if free_net:
+        return IPv4Address(free_net.network_address)
     return None
 
 
 def find_free_infra_linknet(session) -> Optional[IPv4Network]:
-    """Returns first free IPv4 infra linknet (/31)."""
-    used_linknets = []
-    linknet_query = session.query(Linknet). \
-        filter(Linknet.device_a_ip != None)
-    ln: Linknet
-    for ln in linknet_query:
-        used_linknets.append(IPv4Interface(ln.ipv4_network).network)
-
+    """Returns first free IPv4 infra linknet (/31). The pool is locked for
+    other allocations until session is committed."""
     settings, settings_origin = get_settings(device_type=DeviceType.CORE)
     infra_ip_net = IPv4Network(settings['underlay']['infra_link_net'])
-    for num, net in enumerate(infra_ip_net.subnets(new_prefix=31)):
-        if net in used_linknets:
-            continue
-        else:
-            return net
-    return None
+    lock_address_pool(session, infra_ip_net)
+    used_linknets = get_used_addresses(session, Linknet.ipv4_network, infra_ip_net)
+    return find_free_address(infra_ip_net, used_linknets, prefixlen=31)
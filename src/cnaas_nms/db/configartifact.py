@@ -0,0 +1,122 @@
+import datetime
+import hashlib
+import json
+from typing import Callable, Dict, List, Optional
+
+import jinja2
+
+from sqlalchemy import Column, Integer, Unicode, String, UnicodeText, DateTime
+from sqlalchemy import UniqueConstraint
+from sqlalchemy.dialects.postgresql.json import JSONB
+
+import cnaas_nms.db.base
+import cnaas_nms.version
+from cnaas_nms.db.helper import json_dumper
+from cnaas_nms.db.serializer import ModelSerializer
+
+
+# Number of artifacts to keep for each device
+ARTIFACTS_PER_DEVICE = 5
+
+
+def get_filters_marker(jinja_filters: Optional[Dict[str, Callable]]) -> List[str]:
+    """Names and implementations of jinja filters, as part of the input hash."""
+    return sorted('{}={}.{}'.format(name, getattr(func, '__module__', ''),
+                                    getattr(func, '__qualname__', repr(func)))
+                  for name, func in (jinja_filters or {}).items())
+
+
+def calc_input_hash(platform: str, template: str, template_commit: Optional[str],
+                    template_vars: dict,
+                    jinja_filters: Optional[Dict[str, Callable]] = None) -> str:
+    """Calculate a fingerprint of everything that is used to render the
+    config of a device. template_vars contains settings and secrets, so the
+    settings commit doesn't need to be part of the fingerprint. The template
+    name is relative to the platform directory, so the platform is included.
+    Filter implementations and rendering code might change between versions,
+    so the jinja2 and CNaaS-NMS versions are included as well."""
+    data = json.dumps([platform, template, template_commit, template_vars,
+                       get_filters_marker(jinja_filters),
+                       jinja2.__version__, cnaas_nms.version.__version__],
+                      sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def calc_artifact_key(config: str, template_commit: Optional[str],
+                      settings_commit: Optional[str]) -> str:
+    """Content address of a rendered config."""
+    h = hashlib.sha256(config.encode())
+    h.update('\n{}\n{}'.format(template_commit, settings_commit).encode())
+    return h.hexdigest()
+
+
+class ConfigArtifact(cnaas_nms.db.base.Base):
+    """A rendered device config, together with the repository commits and a
+    fingerprint of the variables it was rendered from."""
+    __tablename__ = 'config_artifact'
+    __table_args__ = (
+        None,
+        UniqueConstraint('hostname', 'input_hash'),
+    )
+    id = Column(Integer, autoincrement=True, primary_key=True)
+    hostname = Column(Unicode(64), index=True, nullable=False)
+    artifact_key = Column(String(64), index=True, nullable=False)
+    input_hash = Column(String(64), nullable=False)
+    config_hash = Column(String(64), nullable=False)
+    template_commit = Column(String(40))
+    settings_commit = Column(String(40))
+    config = Column(UnicodeText, nullable=False)
+    template_vars = Column(JSONB)
+    job_id = Column(Integer)
+    last_used = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+    def as_dict(self, include_config: bool = True) -> dict:
+        """Return JSON serializable dict."""
+        if include_config:
+            return configartifact_serializer.serialize(self)
+        return configartifact_serializer.serialize(
+            self, [field for field in configartifact_serializer.fields if field != 'config'])
+
+    @classmethod
+    def get_by_inputs(cls, session, input_hashes: Dict[str, str]) -> \
+            Dict[str, 'ConfigArtifact']:
+        """Find artifacts rendered from the same inputs.
+
+        Args:
+            input_hashes: Input hash for each hostname
+
+        Returns:
+            Artifact for each hostname that has a matching artifact
+        """
+        if not input_hashes:
+            return {}
+        ret = {}
+        query = session.query(ConfigArtifact).\
+            filter(ConfigArtifact.hostname.in_(list(input_hashes.keys()))).\
+            filter(ConfigArtifact.input_hash.in_(list(set(input_hashes.values()))))
+        for artifact in query:
+            if input_hashes.get(artifact.hostname) == artifact.input_hash:
+                ret[artifact.hostname] = artifact
+        return ret
+
+    @classmethod
+    def purge(cls, session, hostnames: List[str], keep: int = ARTIFACTS_PER_DEVICE) -> int:
+        """Remove all but the keep most recently used artifacts of devices.
+
+        Returns:
+            Number of removed artifacts
+        """
+        removed = 0
+        for hostname in hostnames:
+            old_ids = [artifact_id for artifact_id, in session.query(ConfigArtifact.id).
+                       filter(ConfigArtifact.hostname == hostname).
+                       order_by(ConfigArtifact.last_used.desc()).
+                       offset(keep)]
+            if old_ids:
+                removed += session.query(ConfigArtifact).\
+                    filter(ConfigArtifact.id.in_(old_ids)).\
+                    delete(synchronize_session=False)
+        return removed
+
+
+configartifact_serializer = ModelSerializer(ConfigArtifact, datetime_converter=json_dumper)
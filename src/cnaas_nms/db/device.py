@@ -4,11 +4,13 @@ import ipaddress
 import datetime
 import enum
 import re
-from typing import Optional, List
+from typing import Iterable, Optional, List
 
-from sqlalchemy import Column, Integer, Unicode, String, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, Unicode, String, UniqueConstraint
 from sqlalchemy import Enum, DateTime, Boolean
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Sequence
+from sqlalchemy import any_, bindparam, event, inspect, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy_utils import IPAddressType
 
@@ -17,6 +19,7 @@ import cnaas_nms.db.site
 import cnaas_nms.db.linknet
 
 from cnaas_nms.db.interface import Interface, InterfaceConfigType
+from cnaas_nms.db.serializer import ModelSerializer
 
 
 class DeviceException(Exception):
@@ -61,6 +64,12 @@ class DeviceType(enum.Enum):
         return any(value == item.name for item in cls)
 
 
+# Sync epochs are taken from this sequence, so a higher epoch means a more
+# recent change of sync status
+DEVICE_SYNC_EPOCH_SEQ = Sequence('device_sync_epoch_seq',
+                                 metadata=cnaas_nms.db.base.Base.metadata)
+
+
 class Device(cnaas_nms.db.base.Base):
     __tablename__ = 'device'
     __table_args__ = (
@@ -83,38 +92,31 @@ class Device(cnaas_nms.db.base.Base):
     model = Column(String(64))
     os_version = Column(String(64))
     synchronized = Column(Boolean, default=False)
+    # Epoch of the last change of synchronized, devices updated by the same
+    # bulk update share an epoch
+    sync_epoch = Column(BigInteger)
     state = Column(Enum(DeviceState), nullable=False)  # type: ignore
     device_type = Column(Enum(DeviceType), nullable=False)
     confhash = Column(String(64))  # SHA256 = 64 characters
+    # SHA256 of the generated config that the device was last synchronized to
+    generated_config_hash = Column(String(64))
     last_seen = Column(DateTime, default=datetime.datetime.utcnow)  # onupdate=now
     port = Column(Integer)
 
     def as_dict(self) -> dict:
         """Return JSON serializable dict."""
-        d = {}
-        for col in self.__table__.columns:
-            value = getattr(self, col.name)
-            if issubclass(value.__class__, enum.Enum):
-                value = value.name
-            elif issubclass(value.__class__, cnaas_nms.db.base.Base):
-                continue
-            elif issubclass(value.__class__, ipaddress.IPv4Address):
-                value = str(value)
-            elif issubclass(value.__class__, datetime.datetime):
-                value = str(value)
-            d[col.name] = value
-        return d
+        return device_serializer.serialize(self)
 
     def get_neighbors(self, session) -> List[Device]:
         """Look up neighbors from cnaas_nms.db.linknet.Linknets and return them as a list of Device objects."""
         linknets = self.get_linknets(session)
-        ret = []
-        for linknet in linknets:
-            if linknet.device_a_id == self.id:
-                ret.append(session.query(Device).filter(Device.id == linknet.device_b_id).one())
-            else:
-                ret.append(session.query(Device).filter(Device.id == linknet.device_a_id).one())
-        return ret
+        peer_ids = [linknet.device_b_id if linknet.device_a_id == self.id else linknet.device_a_id
+                    for linknet in linknets]
+        if not peer_ids:
+            return []
+        peers = {dev.id: dev for dev in
+                 session.query(Device).filter(Device.id.in_(set(peer_ids)))}
+        return [peers[peer_id] for peer_id in peer_ids]
 
     def get_linknets(self, session) -> List[cnaas_nms.db.linknet.Linknet]:
         """Look up linknets and return a list of Linknet objects."""
@@ -133,12 +135,16 @@ class Device(cnaas_nms.db.base.Base):
         """Return a mapping with local interface name and what peer device hostname
         that interface is connected to."""
         linknets: List[cnaas_nms.db.linknet.Linknet] = self.get_linknets(session)
+        peer_ids = {linknet.device_a_id for linknet in linknets} | \
+            {linknet.device_b_id for linknet in linknets}
+        peer_hostnames = dict(session.query(Device.id, Device.hostname).
+                              filter(Device.id.in_(peer_ids))) if peer_ids else {}
         ret = {}
         for linknet in linknets:
-            if linknet.device_a == self:
-                ret[linknet.device_a_port] = linknet.device_b.hostname
-            elif linknet.device_b == self:
-                ret[linknet.device_b_port] = linknet.device_a.hostname
+            if linknet.device_a_id == self.id:
+                ret[linknet.device_a_port] = peer_hostnames[linknet.device_b_id]
+            elif linknet.device_b_id == self.id:
+                ret[linknet.device_b_port] = peer_hostnames[linknet.device_a_id]
             else:
                 raise Exception("Got invalid linknets for device {}: {}".format(
                     self.hostname, linknets
@@ -209,18 +215,63 @@ class Device(cnaas_nms.db.base.Base):
                                       re.IGNORECASE)
         return all(hostname_part_re.match(x) for x in hostname.split('.'))
 
+    @classmethod
+    def next_sync_epoch(cls, session) -> int:
+        return session.execute(select([DEVICE_SYNC_EPOCH_SEQ.next_value()])).scalar()
+
+    @classmethod
+    def _update_syncstatus(cls, session, condition, syncstatus: bool) -> int:
+        """Set synchronized for all devices matching condition in a single
+        UPDATE statement. Devices that already have the requested status are
+        not touched and keep their sync epoch.
+
+        Returns:
+            Number of devices that changed sync status
+        """
+        table = cls.__table__
+        stmt = update(table).\
+            where(condition).\
+            where(table.c.synchronized.is_distinct_from(syncstatus)).\
+            values(synchronized=syncstatus, sync_epoch=cls.next_sync_epoch(session))
+        return session.execute(stmt).rowcount
+
+    @classmethod
+    def set_syncstatus(cls, session, hostnames: Iterable[str], syncstatus: bool) -> int:
+        """Update sync status of devices with the given hostnames.
+
+        Returns:
+            Number of devices that changed sync status
+        """
+        hostnames = list(set(hostnames))
+        if not hostnames:
+            return 0
+        condition = cls.__table__.c.hostname == any_(
+            bindparam('hostnames', hostnames, type_=ARRAY(String)))
+        return cls._update_syncstatus(session, condition, syncstatus)
+
     @classmethod
     def set_devtype_syncstatus(cls, session, devtype: DeviceType,
-                               platform: Optional[str] = None, syncstatus=False):
-        """Update sync status of devices of type devtype"""
-        dev: Device
+                               platform: Optional[str] = None, syncstatus=False) -> int:
+        """Update sync status of devices of type devtype
+
+        Returns:
+            Number of devices that changed sync status
+        """
+        table = cls.__table__
+        condition = table.c.device_type == devtype
         if platform:
-            dev_query = session.query(Device).filter(Device.device_type == devtype).\
-                filter(Device.platform == platform).all()
-        else:
-            dev_query = session.query(Device).filter(Device.device_type == devtype).all()
-        for dev in dev_query:
-            dev.synchronized = syncstatus
+            condition = condition & (table.c.platform == platform)
+        return cls._update_syncstatus(session, condition, syncstatus)
+
+    @classmethod
+    def get_existing_hostnames(cls, session, hostnames: Iterable[str]) -> set:
+        """Return the hostnames of hostnames that exist in the database."""
+        hostnames = list(set(hostnames))
+        if not hostnames:
+            return set()
+        query = session.query(Device.hostname).filter(
+            Device.hostname == any_(bindparam('hostnames', hostnames, type_=ARRAY(String))))
+        return {hostname for hostname, in query}
 
     @classmethod
     def device_create(cls, **kwargs) -> Device:
@@ -247,6 +298,24 @@ class Device(cnaas_nms.db.base.Base):
             return 'Device not found'
         instance.confhash = hexdigest
 
+    @classmethod
+    def set_generated_config_hashes(cls, session, hexdigests: dict) -> int:
+        """Save hash of generated config for devices, hexdigests is a dict
+        with hash for each hostname.
+
+        Returns:
+            Number of devices updated
+        """
+        if not hexdigests:
+            return 0
+        hostnames = list(hexdigests.keys())
+        result = session.execute(
+            text("UPDATE device SET generated_config_hash = v.hash "
+                 "FROM unnest(:hostnames, :hashes) AS v(hostname, hash) "
+                 "WHERE device.hostname = v.hostname"),
+            {'hostnames': hostnames, 'hashes': [hexdigests[h] for h in hostnames]})
+        return result.rowcount
+
     @classmethod
     def get_config_hash(cls, session, hostname):
         instance: Device = session.query(Device).filter(Device.hostname == hostname).one_or_none()
@@ -394,3 +463,11 @@ class Device(cnaas_nms.db.base.Base):
         return data, errors
 
 
+@event.listens_for(Device, 'before_update')
+def _before_device_update(mapper, connection, target: Device):
+    # Devices updated one at a time through the ORM also get a new sync epoch
+    if inspect(target).attrs.synchronized.history.has_changes():
+        target.sync_epoch = DEVICE_SYNC_EPOCH_SEQ.next_value()
+
+
+device_serializer = ModelSerializer(Device)
@@ -1,22 +1,24 @@
 import enum
 import os
 import datetime
-from typing import Set, Tuple
+from typing import Dict, Set, Tuple, Optional
 
 from git import Repo
 from git import InvalidGitRepositoryError, NoSuchPathError
 from git.exc import NoSuchPathError, GitCommandError
 import yaml
-from redis_lru import RedisLRU
 
 from cnaas_nms.db.exceptions import ConfigException, RepoStructureException
 from cnaas_nms.tools.log import get_logger
 from cnaas_nms.db.settings import get_settings, SettingsSyntaxError, DIR_STRUCTURE, \
-    check_settings_collisions, VlanConflictError
+    check_settings_collisions, VlanConflictError, clear_settings_cache, \
+    validate_devices_settings
 from cnaas_nms.db.device import Device, DeviceType
-from cnaas_nms.db.session import sqla_session, redis_session
+from cnaas_nms.db.session import sqla_session
 from cnaas_nms.db.job import Job, JobStatus
 from cnaas_nms.db.joblock import Joblock, JoblockError
+from cnaas_nms.confpush.template_cache import clear_template_cache, \
+    get_template_dependencies, get_devtype_variables
 
 logger = get_logger()
 
@@ -124,9 +126,11 @@ def _refresh_repo_task(repo_type: RepoType = RepoType.TEMPLATES) -> str:
 
     ret = ''
     changed_files: Set[str] = set()
+    head_before_pull: Optional[str] = None
     try:
         local_repo = Repo(local_repo_path)
         prev_commit = local_repo.commit().hexsha
+        head_before_pull = prev_commit
         diff = local_repo.remotes.origin.pull()
         for item in diff:
             ret += 'Commit {} by {} at {}\n'.format(
@@ -163,22 +167,23 @@ def _refresh_repo_task(repo_type: RepoType = RepoType.TEMPLATES) -> str:
 
     if repo_type == RepoType.SETTINGS:
         try:
-            logger.debug("Clearing redis-lru cache for settings")
-            with redis_session() as redis_db:
-                cache = RedisLRU(redis_db)
-                cache.clear_all_cache()
+            logger.debug("Clearing settings cache")
+            clear_settings_cache()
             get_settings()
             test_devtypes = [DeviceType.ACCESS, DeviceType.DIST, DeviceType.CORE]
             for devtype in test_devtypes:
                 get_settings(device_type=devtype)
+            hostnames = []
             for hostname in os.listdir(os.path.join(local_repo_path, 'devices')):
                 hostname_path = os.path.join(local_repo_path, 'devices', hostname)
                 if not os.path.isdir(hostname_path) or hostname.startswith('.'):
                     continue
                 if not Device.valid_hostname(hostname):
                     continue
-                get_settings(hostname)
-            check_settings_collisions()
+                hostnames.append(hostname)
+            validate_devices_settings(hostnames)
+            check_settings_collisions(changed_files=changed_files,
+                                      prev_commit=head_before_pull)
         except SettingsSyntaxError as e:
             logger.exception("Error in settings repo configuration: {}".format(str(e)))
             raise e
@@ -186,7 +191,9 @@ def _refresh_repo_task(repo_type: RepoType = RepoType.TEMPLATES) -> str:
             logger.exception("VLAN conflict in repo configuration: {}".format(str(e)))
             raise e
         logger.debug("Files changed in settings repository: {}".format(changed_files))
-        updated_devtypes, updated_hostnames = settings_syncstatus(updated_settings=changed_files)
+        updated_devtypes, updated_hostnames = settings_syncstatus(
+            updated_settings=changed_files, local_repo_path=local_repo_path,
+            prev_commit=head_before_pull)
         logger.debug("Devicestypes to be marked unsynced after repo refresh: {}".
                      format(', '.join([dt.name for dt in updated_devtypes])))
         logger.debug("Devices to be marked unsynced after repo refresh: {}".
@@ -195,15 +202,15 @@ def _refresh_repo_task(repo_type: RepoType = RepoType.TEMPLATES) -> str:
             devtype: DeviceType
             for devtype in updated_devtypes:
                 Device.set_devtype_syncstatus(session, devtype, syncstatus=False)
-            for hostname in updated_hostnames:
-                dev: Device = session.query(Device).\
-                    filter(Device.hostname == hostname).one_or_none()
-                if dev:
-                    dev.synchronized = False
-                else:
-                    logger.warn("Settings updated for unknown device: {}".format(hostname))
+            known_hostnames = Device.get_existing_hostnames(session, updated_hostnames)
+            for hostname in sorted(set(updated_hostnames) - known_hostnames):
+                logger.warn("Settings updated for unknown device: {}".format(hostname))
+            unsynced_count = Device.set_syncstatus(session, known_hostnames, False)
+            logger.debug("{} devices marked unsynced after repo refresh".format(
+                unsynced_count))
 
     if repo_type == RepoType.TEMPLATES:
+        clear_template_cache()
         logger.debug("Files changed in template repository: {}".format(changed_files))
         updated_devtypes = template_syncstatus(updated_templates=changed_files)
         updated_list = ['{}:{}'.format(platform, dt.name) for dt, platform in updated_devtypes]
@@ -244,15 +251,17 @@ def template_syncstatus(updated_templates: set) -> Set[Tuple[DeviceType, str]]:
             raise RepoStructureException(
                 "Could not parse {}/mapping.yml in template repo: {}".format(path, str(e)))
 
+        mapping_updated = os.path.join(platform, 'mapping.yml') in updated_templates
         devtype: DeviceType
         for devtype in DeviceType:
             if devtype.name in mapping:
-                update_required = False
+                update_required = mapping_updated
                 try:
-                    dependencies = list([mapping[devtype.name]['entrypoint']])
+                    entrypoint = mapping[devtype.name]['entrypoint']
+                    dependencies = set([entrypoint])
                     if 'dependencies' in mapping[devtype.name] and \
                             isinstance(mapping[devtype.name]['dependencies'], list):
-                        dependencies.extend(mapping[devtype.name]['dependencies'])
+                        dependencies.update(mapping[devtype.name]['dependencies'])
                 except KeyError as e:
                     logger.exception(
                         "Could not parse mapping.yml in template repo for {}, value not found: {}".
@@ -261,9 +270,24 @@ def template_syncstatus(updated_templates: set) -> Set[Tuple[DeviceType, str]]:
                         "Could not parse mapping.yml in template repo for {}, value not found: {}".
                         format(devtype.name, str(e)))
 
+                # Add templates that are included, imported or extended from
+                # the entrypoint. If that can't be determined any template
+                # file of the platform might be used.
+                try:
+                    template_deps = get_template_dependencies(platform, entrypoint)
+                    dependencies.update(template_deps.templates)
+                    complete = template_deps.complete
+                except Exception as e:
+                    logger.warning("Could not find template dependencies for {} on {}: {}".
+                                   format(devtype.name, platform, str(e)))
+                    complete = False
+
                 for dependency in dependencies:
                     if os.path.join(platform, dependency) in updated_templates:
                         update_required = True
+                if not complete and any(
+                        f.startswith(platform + os.path.sep) for f in updated_templates):
+                    update_required = True
                 if update_required:
                     logger.info("Template for device type {} has been updated".
                                 format(devtype.name))
@@ -272,30 +296,98 @@ def template_syncstatus(updated_templates: set) -> Set[Tuple[DeviceType, str]]:
     return unsynced_devtypes
 
 
-def settings_syncstatus(updated_settings: set) -> Tuple[Set[DeviceType], Set[str]]:
+def diff_settings_keys(old: dict, new: dict) -> Set[str]:
+    """Get top level settings keys that differ between two versions of a
+    settings file."""
+    return {key for key in set(old) | set(new) if old.get(key) != new.get(key)}
+
+
+def get_changed_settings_keys(local_repo_path: str, prev_commit: str,
+                              filename: str) -> Optional[Set[str]]:
+    """Get top level keys changed in a settings file since prev_commit.
+
+    Returns:
+        Set of changed keys, or None if the file could not be compared
+    """
+    try:
+        try:
+            old_data = yaml.safe_load(
+                Repo(local_repo_path).git.show('{}:{}'.format(prev_commit, filename)))
+        except GitCommandError:
+            # File did not exist in previous commit
+            old_data = None
+        new_path = os.path.join(local_repo_path, filename)
+        new_data = None
+        if os.path.isfile(new_path):
+            with open(new_path, 'r') as f:
+                new_data = yaml.safe_load(f)
+    except Exception as e:
+        logger.debug("Could not compare settings file {}: {}".format(filename, str(e)))
+        return None
+    old_data = old_data or {}
+    new_data = new_data or {}
+    if not isinstance(old_data, dict) or not isinstance(new_data, dict):
+        return None
+    return diff_settings_keys(old_data, new_data)
+
+
+def settings_syncstatus(updated_settings: set,
+                        local_repo_path: Optional[str] = None,
+                        prev_commit: Optional[str] = None) \
+        -> Tuple[Set[DeviceType], Set[str]]:
     """Determine what devices has become unsynchronized after updating
-    the settings repository."""
+    the settings repository.
+
+    If the settings repository path and the commit before the update is
+    specified, only device types that use any of the changed settings keys
+    in their templates are marked unsynchronized.
+    """
     unsynced_devtypes = set()
     unsynced_hostnames = set()
+    devtype_variables: Dict[DeviceType, Optional[Set[str]]] = {}
+
+    def uses_keys(devtypes: Set[DeviceType], changed_keys: Optional[Set[str]]) \
+            -> Set[DeviceType]:
+        if changed_keys is None:
+            return devtypes
+        ret = set()
+        for devtype in devtypes:
+            if devtype not in devtype_variables:
+                try:
+                    devtype_variables[devtype] = get_devtype_variables(devtype.name)
+                except Exception as e:
+                    logger.warning("Could not find template variables for {}: {}".
+                                   format(devtype.name, str(e)))
+                    devtype_variables[devtype] = None
+            variables = devtype_variables[devtype]
+            if variables is None or variables & changed_keys:
+                ret.add(devtype)
+        return ret
+
+    all_devtypes = {DeviceType.ACCESS, DeviceType.DIST, DeviceType.CORE}
     filename: str
     for filename in updated_settings:
         basedir = filename.split(os.path.sep)[0]
         if basedir not in DIR_STRUCTURE:
             continue
+        changed_keys = None
+        if local_repo_path and prev_commit:
+            changed_keys = get_changed_settings_keys(local_repo_path, prev_commit, filename)
+            logger.debug("Settings keys changed in {}: {}".format(filename, changed_keys))
         if basedir.startswith('global'):
-            return {DeviceType.ACCESS, DeviceType.DIST, DeviceType.CORE}, set()
+            unsynced_devtypes.update(uses_keys(all_devtypes, changed_keys))
         elif basedir.startswith('fabric'):
-            unsynced_devtypes.update({DeviceType.DIST, DeviceType.CORE})
+            unsynced_devtypes.update(uses_keys({DeviceType.DIST, DeviceType.CORE}, changed_keys))
         elif basedir.startswith('access'):
-            unsynced_devtypes.add(DeviceType.ACCESS)
+            unsynced_devtypes.update(uses_keys({DeviceType.ACCESS}, changed_keys))
         elif basedir.startswith('dist'):
-            unsynced_devtypes.add(DeviceType.DIST)
+            unsynced_devtypes.update(uses_keys({DeviceType.DIST}, changed_keys))
         elif basedir.startswith('core'):
-            unsynced_devtypes.add(DeviceType.CORE)
+            unsynced_devtypes.update(uses_keys({DeviceType.CORE}, changed_keys))
         elif basedir.startswith('devices'):
             try:
                 hostname = filename.split(os.path.sep)[1]
-                if Device.valid_hostname(hostname):
+                if Device.valid_hostname(hostname) and uses_keys(all_devtypes, changed_keys):
                     unsynced_hostnames.add(hostname)
             except Exception as e:
                 logger.exception("Error in settings devices directory: {}".format(str(e)))
@@ -9,6 +9,7 @@ from sqlalchemy import Enum
 
 import cnaas_nms.db.base
 import cnaas_nms.db.device
+from cnaas_nms.db.serializer import ModelSerializer
 
 
 class InterfaceConfigType(enum.Enum):
@@ -45,15 +46,7 @@ class Interface(cnaas_nms.db.base.Base):
 
     def as_dict(self) -> dict:
         """Return JSON serializable dict."""
-        d = {}
-        for col in self.__table__.columns:
-            value = getattr(self, col.name)
-            if issubclass(value.__class__, enum.Enum):
-                value = value.name
-            elif issubclass(value.__class__, cnaas_nms.db.base.Base):
-                continue
-            d[col.name] = value
-        return d
+        return interface_serializer.serialize(self)
 
     @classmethod
     def interface_index_num(cls, ifname: str):
@@ -86,3 +79,5 @@ class Interface(cnaas_nms.db.base.Base):
                 missing_groups += 1
         return index_num
 
+
+interface_serializer = ModelSerializer(Interface)
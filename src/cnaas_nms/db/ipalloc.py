@@ -0,0 +1,115 @@
+import hashlib
+from bisect import bisect_left, bisect_right
+from ipaddress import IPv4Address, IPv4Interface, IPv4Network
+from typing import Iterable, List, Optional, Union
+
+from sqlalchemy import cast, text
+from sqlalchemy.dialects.postgresql import INET
+
+
+def first_free_index(used: List[int], start: int, end: int) -> Optional[int]:
+    """Find the lowest integer in the range start to end (inclusive) that is
+    not in used.
+
+    Args:
+        used: Sorted list of unique integers that are already used
+        start: First integer of range
+        end: Last integer of range
+
+    Returns:
+        First free integer, or None if all integers in the range are used
+    """
+    if start > end:
+        return None
+    # Only look at used integers inside the range
+    lo = bisect_left(used, start)
+    hi = bisect_right(used, end)
+    # used[i] >= start + (i - lo) for all i since used is sorted and unique,
+    # the first free integer is before the first index where equality breaks
+    first, last = lo, hi
+    while first < last:
+        mid = (first + last) // 2
+        if used[mid] == start + (mid - lo):
+            first = mid + 1
+        else:
+            last = mid
+    candidate = start + (first - lo)
+    if candidate > end:
+        return None
+    return candidate
+
+
+def find_free_address(network: IPv4Network,
+                      used: Iterable[Union[IPv4Address, IPv4Network, IPv4Interface, str]],
+                      prefixlen: int = 32, skip_first: int = 0,
+                      hosts_only: bool = False) -> Optional[IPv4Network]:
+    """Find the first free subnet of size prefixlen inside network.
+
+    Args:
+        network: Network to allocate from
+        used: Addresses or networks that are already in use, anything outside
+              network is ignored
+        prefixlen: Prefix length of subnet to allocate, 32 for single addresses
+                   and 31 for linknets
+        skip_first: Number of subnets to skip at the start of network
+        hosts_only: Don't allocate network or broadcast address of network,
+                    like IPv4Network.hosts()
+
+    Returns:
+        First free subnet, or None if network is full
+    """
+    size = 2 ** (32 - prefixlen)
+    net_start = int(network.network_address)
+    net_end = int(network.broadcast_address)
+    if hosts_only and network.prefixlen < 31:
+        net_start += 1
+        net_end -= 1
+    # Work with subnet numbers instead of addresses
+    start = -(-net_start // size) + skip_first
+    end = (net_end + 1) // size - 1
+
+    used_indexes = set()
+    for item in used:
+        if isinstance(item, str):
+            item = IPv4Interface(item)
+        if isinstance(item, IPv4Interface):
+            item = item.network if prefixlen < 32 else item.ip
+        if isinstance(item, IPv4Network):
+            first_addr = int(item.network_address)
+            last_addr = int(item.broadcast_address)
+        else:
+            first_addr = last_addr = int(item)
+        for index in range(first_addr // size, last_addr // size + 1):
+            used_indexes.add(index)
+
+    index = first_free_index(sorted(used_indexes), start, end)
+    if index is None:
+        return None
+    return IPv4Network((index * size, prefixlen))
+
+
+def get_used_addresses(session, column, network: IPv4Network) -> List[str]:
+    """Get values of an IP address or network column that are inside network.
+    The filtering is done in the database so that only relevant rows are
+    loaded."""
+    query = session.query(column).\
+        filter(column != None).\
+        filter(cast(column, INET).op('<<=')(str(network)))
+    return [str(value) for value, in query]
+
+
+def get_pool_lock_key(network: IPv4Network) -> int:
+    """Get a 64 bit advisory lock key that is unique for an address pool."""
+    digest = hashlib.sha256('ipalloc:{}'.format(network).encode()).digest()
+    return int.from_bytes(digest[:8], byteorder='big', signed=True)
+
+
+def lock_address_pool(session, network: IPv4Network):
+    """Lock allocations from network until the current transaction ends.
+
+    Other sessions trying to allocate from the same network will wait until
+    this transaction is committed or rolled back, so the allocated address
+    must be saved in the same transaction. Allocations from other networks
+    are not affected."""
+    session.execute(text("SELECT pg_advisory_xact_lock(:key)"),
+                    {'key': get_pool_lock_key(network)})
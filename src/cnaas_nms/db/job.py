@@ -1,13 +1,13 @@
 import enum
 import datetime
 import json
-from typing import Optional
+from typing import Optional, Tuple
 
-from sqlalchemy import Column, Integer, Unicode, SmallInteger
+from sqlalchemy import Column, Integer, Unicode, SmallInteger, Boolean
 from sqlalchemy import Enum, DateTime
 from sqlalchemy import ForeignKey
 from sqlalchemy.dialects.postgresql.json import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, load_only
 from nornir.core.task import AggregatedResult
 
 import cnaas_nms.db.base
@@ -15,12 +15,35 @@ import cnaas_nms.db.device
 from cnaas_nms.confpush.nornir_helper import nr_result_serialize, NornirJobResult
 from cnaas_nms.scheduler.jobresult import StrJobResult, DictJobResult
 from cnaas_nms.db.helper import json_dumper
+from cnaas_nms.db.serializer import ModelSerializer
+from cnaas_nms.tools.get_apidata import get_apidata
 from cnaas_nms.tools.log import get_logger
 
 
 logger = get_logger()
 
 
+def get_result_retention() -> Tuple[int, int]:
+    """Get number of days before job results are compacted and removed,
+    0 disables."""
+    try:
+        apidata = get_apidata()
+        return (int(apidata.get('job_result_compact_days', 30)),
+                int(apidata.get('job_result_retention_days', 365)))
+    except Exception:
+        return 30, 365
+
+
+# Jobs finished more than this number of days ago have rendered configs
+# and diffs removed from their results
+RESULT_COMPACT_DAYS, RESULT_RETENTION_DAYS = get_result_retention()
+# Seconds between retention runs
+RESULT_MAINTENANCE_INTERVAL = 3600
+# Number of results to compact per database round trip
+RESULT_COMPACT_BATCH = 100
+_last_result_maintenance: Optional[datetime.datetime] = None
+
+
 class JobStatus(enum.Enum):
     UNKNOWN = 0
     SCHEDULED = 1
@@ -38,6 +61,70 @@ class JobStatus(enum.Enum):
         return any(value == item.name for item in cls)
 
 
+class JobResultData(cnaas_nms.db.base.Base):
+    """Result of a job, kept outside of the job table so that job listings
+    don't have to read the results of every device."""
+    __tablename__ = 'job_result'
+    __table_args__ = (
+        None,
+    )
+    job_id = Column(Integer, ForeignKey('job.id', ondelete='CASCADE'), primary_key=True)
+    result = Column(JSONB)
+    compacted = Column(Boolean, default=False, nullable=False)
+
+    @staticmethod
+    def compact_result(result):
+        """Remove rendered configs, diffs and task results from a serialized
+        nornir result, only keeping status of each device and task."""
+        if not isinstance(result, dict) or not isinstance(result.get('devices'), dict):
+            return result
+        devices = {}
+        for hostname, host_result in result['devices'].items():
+            if not isinstance(host_result, dict):
+                continue
+            devices[hostname] = {
+                'failed': host_result.get('failed'),
+                'job_tasks': [
+                    {'task_name': task.get('task_name'), 'failed': task.get('failed')}
+                    for task in host_result.get('job_tasks', []) if isinstance(task, dict)
+                ]
+            }
+        return {**result, 'devices': devices}
+
+    @classmethod
+    def maintain(cls, session, compact_days: int = RESULT_COMPACT_DAYS,
+                 retention_days: int = RESULT_RETENTION_DAYS) -> Tuple[int, int]:
+        """Compact and remove results of old jobs.
+
+        Returns:
+            Number of compacted and removed results
+        """
+        now = datetime.datetime.utcnow()
+        removed = 0
+        if retention_days > 0:
+            old_jobs = session.query(Job.id).\
+                filter(Job.finish_time < now - datetime.timedelta(days=retention_days))
+            removed = session.query(JobResultData).\
+                filter(JobResultData.job_id.in_(old_jobs)).\
+                delete(synchronize_session=False)
+        compacted = 0
+        if compact_days > 0:
+            while True:
+                batch = session.query(JobResultData).\
+                    join(Job, Job.id == JobResultData.job_id).\
+                    filter(Job.finish_time < now - datetime.timedelta(days=compact_days)).\
+                    filter(JobResultData.compacted == False).\
+                    limit(RESULT_COMPACT_BATCH).all()
+                if not batch:
+                    break
+                for job_result in batch:
+                    job_result.result = cls.compact_result(job_result.result)
+                    job_result.compacted = True
+                session.flush()
+                compacted += len(batch)
+        return compacted, removed
+
+
 class Job(cnaas_nms.db.base.Base):
     __tablename__ = 'job'
     __table_args__ = (
@@ -54,25 +141,44 @@ class Job(cnaas_nms.db.base.Base):
     ticket_ref = Column(Unicode(32), index=True)
     next_job_id = Column(Integer, ForeignKey('job.id'))
     next_job = relationship("Job", remote_side=[id])
-    result = Column(JSONB)
+    result_data = relationship(JobResultData, uselist=False, lazy='select',
+                               cascade='all, delete-orphan', passive_deletes=True)
     exception = Column(JSONB)
     finished_devices = Column(JSONB)
     change_score = Column(SmallInteger)  # should be in range 0-100
 
-    def as_dict(self) -> dict:
-        """Return JSON serializable dict."""
-        d = {}
-        for col in self.__table__.columns:
-            value = getattr(self, col.name)
-            if issubclass(value.__class__, enum.Enum):
-                value = value.name
-            elif issubclass(value.__class__, cnaas_nms.db.base.Base):
-                continue
-            elif issubclass(value.__class__, datetime.datetime):
-                value = json_dumper(value)
-            elif type(col.type) == JSONB and value and type(value) == str:
-                value = json.loads(value)
-            d[col.name] = value
+    # Columns returned when listing jobs
+    SUMMARY_COLUMNS = ['id', 'status', 'scheduled_time', 'start_time', 'finish_time',
+                       'function_name', 'scheduled_by', 'comment', 'ticket_ref',
+                       'next_job_id', 'change_score']
+
+    @property
+    def result(self):
+        """Result of job, loaded from the job_result table when accessed."""
+        if self.result_data is None:
+            return None
+        return self.result_data.result
+
+    @result.setter
+    def result(self, value):
+        if self.result_data is None:
+            self.result_data = JobResultData(result=value)
+        else:
+            self.result_data.result = value
+            self.result_data.compacted = False
+
+    @classmethod
+    def summary_query(cls, session):
+        """Query that only loads summary columns of jobs."""
+        return session.query(Job).options(load_only(*cls.SUMMARY_COLUMNS))
+
+    def as_dict(self, summary: bool = False) -> dict:
+        """Return JSON serializable dict. If summary is set only summary
+        columns are returned, otherwise result is loaded and included."""
+        if summary:
+            return job_serializer.serialize(self, self.SUMMARY_COLUMNS)
+        d = job_serializer.serialize(self)
+        d['result'] = self.result
         return d
 
     def start_job(self, function_name: str, scheduled_by: str):
@@ -91,7 +197,8 @@ class Job(cnaas_nms.db.base.Base):
             elif isinstance(res, (StrJobResult, DictJobResult)):
                 self.result = res.result
             else:
-                self.result = json.dumps(res, default=json_dumper)
+                # Store as JSON object instead of a JSON encoded string
+                self.result = json.loads(json.dumps(res, default=json_dumper))
         except Exception as e:
             logger.exception("Job {} got unserializable ({}) result after finishing: {}". \
                            format(self.id, str(e), self.result))
@@ -108,13 +215,13 @@ class Job(cnaas_nms.db.base.Base):
         self.finish_time = datetime.datetime.utcnow()
         self.status = JobStatus.EXCEPTION
         try:
-            self.exception = json.dumps(
+            self.exception = json.loads(json.dumps(
                 {
                     'message': str(e),
                     'type': type(e).__name__,
                     'args': e.args,
                     'traceback': traceback
-                }, default=json_dumper)
+                }, default=json_dumper))
         except Exception as e:
             errmsg = "Unable to serialize exception or traceback: {}".format(str(e))
             logger.exception(errmsg)
@@ -142,3 +249,25 @@ class Job(cnaas_nms.db.base.Base):
                     "Job found in past SCHEDULED state at startup moved to ABORTED, id: {}".
                     format(job.id))
                 job.status = JobStatus.ABORTED
+
+    @classmethod
+    def maintain_results(cls, session, force: bool = False):
+        """Run JobResultData.maintain if it hasn't been run for
+        RESULT_MAINTENANCE_INTERVAL seconds in this process."""
+        global _last_result_maintenance
+        now = datetime.datetime.utcnow()
+        if not force and _last_result_maintenance and \
+                (now - _last_result_maintenance).total_seconds() < RESULT_MAINTENANCE_INTERVAL:
+            return
+        _last_result_maintenance = now
+        try:
+            compacted, removed = JobResultData.maintain(session)
+            if compacted or removed:
+                logger.info("Compacted {} and removed {} old job results".format(
+                    compacted, removed))
+        except Exception as e:
+            session.rollback()
+            logger.exception("Could not compact old job results: {}".format(str(e)))
+
+
+job_serializer = ModelSerializer(Job, datetime_converter=json_dumper)
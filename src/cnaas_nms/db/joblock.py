@@ -7,6 +7,7 @@ from sqlalchemy.orm import relationship
 import cnaas_nms.db.base
 from cnaas_nms.db.job import Job
 from cnaas_nms.db.session import sqla_session
+from cnaas_nms.db.serializer import ModelSerializer
 
 
 class JoblockError(Exception):
@@ -23,15 +24,7 @@ class Joblock(cnaas_nms.db.base.Base):
 
     def as_dict(self) -> dict:
         """Return JSON serializable dict."""
-        d = {}
-        for col in self.__table__.columns:
-            value = getattr(self, col.name)
-            if issubclass(value.__class__, cnaas_nms.db.base.Base):
-                continue
-            elif issubclass(value.__class__, datetime.datetime):
-                value = str(value)
-            d[col.name] = value
-        return d
+        return joblock_serializer.serialize(self)
 
     @classmethod
     def acquire_lock(cls, session: sqla_session, name: str, job_id: int) -> bool:
@@ -92,3 +85,5 @@ class Joblock(cnaas_nms.db.base.Base):
         """Clear/release all locks in the database."""
         return session.query(Joblock).delete()
 
+
+joblock_serializer = ModelSerializer(Joblock)
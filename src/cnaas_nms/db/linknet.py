@@ -1,6 +1,4 @@
 import ipaddress
-import enum
-import datetime
 
 from sqlalchemy import Column, Integer, Unicode, UniqueConstraint
 from sqlalchemy import ForeignKey
@@ -10,6 +8,7 @@ from sqlalchemy_utils import IPAddressType
 import cnaas_nms.db.base
 import cnaas_nms.db.site
 import cnaas_nms.db.device
+from cnaas_nms.db.serializer import ModelSerializer
 
 
 class Linknet(cnaas_nms.db.base.Base):
@@ -37,19 +36,7 @@ class Linknet(cnaas_nms.db.base.Base):
 
     def as_dict(self):
         """Return JSON serializable dict."""
-        d = {}
-        for col in self.__table__.columns:
-            value = getattr(self, col.name)
-            if issubclass(value.__class__, enum.Enum):
-                value = value.value
-            elif issubclass(value.__class__, cnaas_nms.db.base.Base):
-                continue
-            elif issubclass(value.__class__, ipaddress.IPv4Address):
-                value = str(value)
-            elif issubclass(value.__class__, datetime.datetime):
-                value = str(value)
-            d[col.name] = value
-        return d
+        return linknet_serializer.serialize(self)
 
     @classmethod
     def create_linknet(cls, session, hostname_a, interface_a, hostname_b, interface_b, linknet):
@@ -89,3 +76,6 @@ class Linknet(cnaas_nms.db.base.Base):
         new_linknet.device_b_port = interface_b
         new_linknet.device_b_ip = ip_b
         return new_linknet
+
+
+linknet_serializer = ModelSerializer(Linknet, enum_attr='value')
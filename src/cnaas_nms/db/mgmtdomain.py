@@ -1,12 +1,9 @@
-import ipaddress
-import datetime
-import enum
 from ipaddress import IPv4Interface, IPv4Address
 from typing import Optional
 
 from sqlalchemy import Column, Integer, String, Unicode, UniqueConstraint
 from sqlalchemy import ForeignKey
-from sqlalchemy.orm import relationship, load_only
+from sqlalchemy.orm import relationship
 from sqlalchemy_utils import IPAddressType
 
 import cnaas_nms.db.base
@@ -14,6 +11,8 @@ import cnaas_nms.db.site
 import cnaas_nms.db.device
 from cnaas_nms.db.device import Device
 from cnaas_nms.db.reservedip import ReservedIP
+from cnaas_nms.db.serializer import ModelSerializer
+from cnaas_nms.db.ipalloc import find_free_address, get_used_addresses, lock_address_pool
 
 class Mgmtdomain(cnaas_nms.db.base.Base):
     __tablename__ = 'mgmtdomain'
@@ -37,18 +36,7 @@ class Mgmtdomain(cnaas_nms.db.base.Base):
 
     def as_dict(self):
         """Return JSON serializable dict."""
-        d = {}
-        for col in self.__table__.columns:
-            value = getattr(self, col.name)
-            if issubclass(value.__class__, enum.Enum):
-                value = value.value
-            elif issubclass(value.__class__, cnaas_nms.db.base.Base):
-                continue
-            elif issubclass(value.__class__, ipaddress.IPv4Address):
-                value = str(value)
-            elif issubclass(value.__class__, datetime.datetime):
-                value = str(value)
-            d[col.name] = value
+        d = mgmtdomain_serializer.serialize(self)
         try:
             d['device_a'] = str(self.device_a.hostname)
             d['device_b'] = str(self.device_b.hostname)
@@ -57,26 +45,18 @@ class Mgmtdomain(cnaas_nms.db.base.Base):
         return d
 
     def find_free_mgmt_ip(self, session) -> Optional[IPv4Address]:
-        """Return first available IPv4 address from this Mgmtdomain's ipv4_gw network.""" 
-        used_ips = []
-        reserved_ips = []
-        device_query = session.query(Device).\
-            filter(Device.management_ip != None).options(load_only("management_ip"))
-        for device in device_query:
-            used_ips.append(device.management_ip)
-        reserved_ip_query = session.query(ReservedIP).options(load_only("ip"))
-        for reserved_ip in reserved_ip_query:
-            reserved_ips.append(reserved_ip.ip)
-
+        """Return first available IPv4 address from this Mgmtdomain's ipv4_gw network.
+        The management network stays locked for other allocations until session
+        is committed, so save the address using the same session."""
         mgmt_net = IPv4Interface(self.ipv4_gw).network
-        for num, host in enumerate(mgmt_net.hosts()):
-            if num < 5:  # reserve 5 first hosts
-                continue
-            if host in reserved_ips:
-                continue
-            if host in used_ips:
-                continue
-            else:
-                return IPv4Address(host)
+        lock_address_pool(session, mgmt_net)
+        used_ips = get_used_addresses(session, Device.management_ip, mgmt_net)
+        used_ips += get_used_addresses(session, ReservedIP.ip, mgmt_net)
+        # reserve 5 first hosts
+        free_net = find_free_address(mgmt_net, used_ips, skip_first=5, hosts_only=True)
+        if free_net:
+            return IPv4Address(free_net.network_address)
         return None
 
+
+mgmtdomain_serializer = ModelSerializer(Mgmtdomain, enum_attr='value')
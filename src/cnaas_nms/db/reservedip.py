@@ -8,6 +8,7 @@ from sqlalchemy.orm import relationship, backref
 
 import cnaas_nms.db.base
 import cnaas_nms.db.device
+from cnaas_nms.db.serializer import ModelSerializer
 from cnaas_nms.tools.log import get_logger
 
 
@@ -27,13 +28,7 @@ class ReservedIP(cnaas_nms.db.base.Base):
 
     def as_dict(self) -> dict:
         """Return JSON serializable dict."""
-        d = {}
-        for col in self.__table__.columns:
-            value = getattr(self, col.name)
-            if issubclass(value.__class__, cnaas_nms.db.base.Base):
-                continue
-            d[col.name] = value
-        return d
+        return reservedip_serializer.serialize(self)
 
     @classmethod
     def clean_reservations(cls, session, device: Optional[cnaas_nms.db.device.Device] = None,
@@ -50,3 +45,6 @@ class ReservedIP(cnaas_nms.db.base.Base):
                     rip.ip, rip.device.hostname, rip.last_seen
                 ))
                 session.delete(rip)
+
+
+reservedip_serializer = ModelSerializer(ReservedIP)
@@ -0,0 +1,130 @@
+import json
+import operator
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import sqlalchemy
+from sqlalchemy_utils import IPAddressType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    """Encode obj as JSON bytes, using orjson if it's installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # Integers larger than 64 bits and other types orjson can't handle
+            pass
+    return json.dumps(obj).encode()
+
+
+class ModelSerializer(object):
+    """Convert model instances or query rows to JSON serializable dicts.
+
+    The converter for each column is chosen once from the column type
+    instead of inspecting every value, and the function that builds the
+    dict for a set of fields is compiled once and reused for every row."""
+    def __init__(self, model, enum_attr: str = 'name',
+                 datetime_converter: Callable = str,
+                 converters: Optional[Dict[str, Optional[Callable]]] = None):
+        """
+        Args:
+            model: Model class to serialize
+            enum_attr: Attribute of enum values to use, name or value
+            datetime_converter: Function to convert datetime values
+            converters: Converter functions for specific columns, overriding
+                        the converter chosen from the column type
+        """
+        self.model = model
+        self.enum_attr = enum_attr
+        self.datetime_converter = datetime_converter
+        self.fields: List[str] = [col.name for col in model.__table__.columns]
+        self._converters: Dict[str, Optional[Callable]] = {
+            col.name: self._get_converter(col) for col in model.__table__.columns
+        }
+        self._converters.update(converters or {})
+        self._lock = threading.Lock()
+        self._row_converters: Dict[Tuple[str, ...], Callable] = {}
+        self._instance_converters: Dict[Tuple[str, ...], Callable] = {}
+
+    def _get_converter(self, col: sqlalchemy.Column) -> Optional[Callable]:
+        if isinstance(col.type, sqlalchemy.Enum):
+            return operator.attrgetter(self.enum_attr)
+        elif isinstance(col.type, IPAddressType):
+            return str
+        elif isinstance(col.type, sqlalchemy.DateTime):
+            return self.datetime_converter
+        return None
+
+    def parse_fields(self, fields_arg: Optional[str]) -> Tuple[str, ...]:
+        """Parse a comma separated list of field names, like the fields
+        query string argument. All fields are returned if fields_arg is empty.
+
+        Raises:
+            ValueError
+        """
+        if not fields_arg:
+            return tuple(self.fields)
+        fields = tuple(field.strip() for field in fields_arg.split(',') if field.strip())
+        for field in fields:
+            if field not in self._converters:
+                raise ValueError("{} is not a valid field".format(field))
+        return fields
+
+    def query_columns(self, fields: Sequence[str]) -> list:
+        """Get model attributes to query for fields, id is always the first
+        column so that it can be used as a pagination cursor."""
+        return [self.model.id] + [getattr(self.model, field) for field in fields]
+
+    def _compile(self, fields: Tuple[str, ...]) -> Callable[[Sequence], dict]:
+        converters = [(field, self._converters[field]) for field in fields]
+        if not any(converter for _, converter in converters):
+            def convert(values: Sequence) -> dict:
+                return dict(zip(fields, values))
+            return convert
+
+        def convert(values: Sequence) -> dict:
+            return {
+                field: value if converter is None or value is None else converter(value)
+                for (field, converter), value in zip(converters, values)
+            }
+        return convert
+
+    def row_converter(self, fields: Sequence[str]) -> Callable[[Sequence], dict]:
+        """Get function that converts a row from a query of
+        query_columns(fields) to a dict."""
+        fields = tuple(fields)
+        with self._lock:
+            if fields not in self._row_converters:
+                convert = self._compile(fields)
+                self._row_converters[fields] = lambda row: convert(row[1:])
+            return self._row_converters[fields]
+
+    def instance_converter(self, fields: Optional[Sequence[str]] = None) -> \
+            Callable[[object], dict]:
+        """Get function that converts a model instance to a dict."""
+        fields = tuple(fields or self.fields)
+        with self._lock:
+            if fields not in self._instance_converters:
+                convert = self._compile(fields)
+                if len(fields) == 1:
+                    getter = operator.attrgetter(fields[0])
+                    self._instance_converters[fields] = \
+                        lambda instance: convert((getter(instance),))
+                else:
+                    getter = operator.attrgetter(*fields)
+                    self._instance_converters[fields] = \
+                        lambda instance: convert(getter(instance))
+            return self._instance_converters[fields]
+
+    def serialize(self, instance, fields: Optional[Sequence[str]] = None) -> dict:
+        return self.instance_converter(fields)(instance)
+
+    def serialize_many(self, instances, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        convert = self.instance_converter(fields)
+        return [convert(instance) for instance in instances]
@@ -1,4 +1,7 @@
 import os
+import threading
+from typing import Optional
+
 import yaml
 from contextlib import contextmanager
 
@@ -32,8 +35,17 @@ def get_sqlalchemy_conn_str(**kwargs) -> str:
     )
 
 
+def get_db_pool_size() -> int:
+    """Number of database connections each process is allowed to open."""
+    try:
+        return int(get_dbdata().get('pool_size', 50))
+    except Exception:
+        return 50
+
+
 conn_str = get_sqlalchemy_conn_str()
-engine = create_engine(conn_str, pool_size=50, max_overflow=0)
+db_pool_size = get_db_pool_size()
+engine = create_engine(conn_str, pool_size=db_pool_size, max_overflow=0)
 connection = engine.connect()
 Session = sessionmaker(bind=engine)
 
@@ -63,3 +75,18 @@ def redis_session(**kwargs):
     db_data = get_dbdata(**kwargs)
     with StrictRedis(host=db_data['redis_hostname'], port=6379) as conn:
         yield conn
+
+
+_redis_client: Optional[StrictRedis] = None
+_redis_client_lock = threading.Lock()
+
+
+def get_redis_client() -> StrictRedis:
+    """Get a redis client shared by all threads in this process."""
+    global _redis_client
+    with _redis_client_lock:
+        if not _redis_client:
+            db_data = get_dbdata()
+            _redis_client = StrictRedis(host=db_data['redis_hostname'], port=6379,
+                                        retry_on_timeout=True, socket_keepalive=True)
+    return _redis_client
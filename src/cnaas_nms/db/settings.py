@@ -1,27 +1,36 @@
 import os
 import re
+import copy
+import pickle
+import threading
+import multiprocessing
 import pkg_resources
-from typing import List, Optional, Union, Tuple, Set, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Union, Tuple, Set, Dict, Any
 
 import yaml
 from pydantic.error_wrappers import ValidationError
-import redis
-from redis_lru import RedisLRU
 
 from cnaas_nms.db.settings_fields import f_root, f_groups
 from cnaas_nms.tools.mergedict import MetadataDict, merge_dict_origin
 from cnaas_nms.db.device import Device, DeviceType, DeviceState
-from cnaas_nms.db.session import sqla_session, get_dbdata
+from cnaas_nms.db.session import sqla_session, get_dbdata, get_redis_client
 from cnaas_nms.db.mgmtdomain import Mgmtdomain
+from cnaas_nms.db.linknet import Linknet
+from cnaas_nms.db.topology import get_topology
+from cnaas_nms.tools.githelper import get_repo_commit
 from cnaas_nms.tools.log import get_logger
 
 
 db_data = get_dbdata()
-redis_client = redis.StrictRedis(
-    host=db_data['redis_hostname'], port=6379,
-    retry_on_timeout=True, socket_keepalive=True
-)
-redis_lru_cache = RedisLRU(redis_client)
+# Optionally share resolved settings between processes via redis
+SETTINGS_SHARED_CACHE = bool(db_data.get('settings_shared_cache', False))
+SETTINGS_SHARED_CACHE_TTL = 86400
+# Number of processes used to validate device settings on repository refresh
+SETTINGS_VALIDATION_WORKERS = int(db_data.get('settings_validation_workers',
+                                              os.cpu_count() or 1))
+# Validate in the current process if there are fewer devices than this
+SETTINGS_VALIDATION_PARALLEL_MIN = 20
 
 
 class VerifyPathException(Exception):
@@ -217,19 +226,154 @@ def check_settings_syntax(settings_dict: dict, settings_metadata_dict: dict) ->
         return ret_dict
 
 
-def check_settings_collisions(unique_vlans: bool = True):
+class VlanCollisionIndex(object):
+    """Index of VXLAN/VLAN usage per device, used to find VLAN and VNI
+    collisions between devices. Devices can be updated or removed one at a
+    time so that only devices affected by a settings change has to be
+    evaluated again."""
+    def __init__(self):
+        self.commit: Optional[str] = None
+        self.built = False
+        self.mgmt_vlans: Set[int] = set()
+        # VNI/VLAN id -> vxlan name -> number of devices using that combination
+        self.vni_names: Dict[int, Dict[str, int]] = {}
+        self.vlan_names: Dict[int, Dict[str, int]] = {}
+        # hostname -> list of (vxlan_name, vni, vlan_id)
+        self.device_entries: Dict[str, List[Tuple[str, int, Optional[int]]]] = {}
+        self.device_types: Dict[str, DeviceType] = {}
+        self.device_errors: Dict[str, str] = {}
+        # dist hostname -> downstream access hostnames used in its settings
+        self.downstream: Dict[str, Set[str]] = {}
+
+    def clear(self):
+        self.__init__()
+
+    @staticmethod
+    def _refcount(index: Dict[int, Dict[str, int]], key: int, name: str, diff: int):
+        names = index.setdefault(key, {})
+        names[name] = names.get(name, 0) + diff
+        if names[name] <= 0:
+            del names[name]
+        if not names:
+            del index[key]
+
+    def remove_device(self, hostname: str):
+        for vxlan_name, vni, vlan_id in self.device_entries.pop(hostname, []):
+            self._refcount(self.vni_names, vni, vxlan_name, -1)
+            if vlan_id is not None:
+                self._refcount(self.vlan_names, vlan_id, vxlan_name, -1)
+        self.device_types.pop(hostname, None)
+        self.device_errors.pop(hostname, None)
+        self.downstream.pop(hostname, None)
+
+    def update_device(self, hostname: str, settings: dict, device_type: DeviceType,
+                      downstream: Optional[Set[str]] = None):
+        logger = get_logger()
+        self.remove_device(hostname)
+        entries = []
+        vlan_ids: Set[int] = set()
+        vlan_names: Set[str] = set()
+        for vxlan_name, vxlan_data in settings.get('vxlans', {}).items():
+            # VXLAN VNI checks
+            if 'vni' not in vxlan_data or not isinstance(vxlan_data['vni'], int):
+                logger.error("VXLAN {} is missing vni".format(vxlan_name))
+                continue
+            # VLAN id checks
+            if 'vlan_id' not in vxlan_data or not isinstance(vxlan_data['vlan_id'], int):
+                logger.error("VXLAN {} is missing vlan_id".format(vxlan_name))
+                entries.append((vxlan_name, vxlan_data['vni'], None))
+                continue
+            entries.append((vxlan_name, vxlan_data['vni'], vxlan_data['vlan_id']))
+            if vxlan_data['vlan_id'] in vlan_ids and hostname not in self.device_errors:
+                self.device_errors[hostname] = \
+                    "VLAN id {} used multiple times in device {}".format(
+                        vxlan_data['vlan_id'], hostname)
+            vlan_ids.add(vxlan_data['vlan_id'])
+            # VLAN name checks
+            if 'vlan_name' not in vxlan_data or not isinstance(vxlan_data['vlan_name'], str):
+                logger.error("VXLAN {} is missing vlan_name".format(vxlan_name))
+                continue
+            if vxlan_data['vlan_name'] in vlan_names and device_type == DeviceType.ACCESS \
+                    and hostname not in self.device_errors:
+                # only trigger for access switches
+                self.device_errors[hostname] = \
+                    "VLAN name {} used multiple times in device {}".format(
+                        vxlan_data['vlan_name'], hostname)
+            vlan_names.add(vxlan_data['vlan_name'])
+        for vxlan_name, vni, vlan_id in entries:
+            self._refcount(self.vni_names, vni, vxlan_name, 1)
+            if vlan_id is not None:
+                self._refcount(self.vlan_names, vlan_id, vxlan_name, 1)
+        self.device_entries[hostname] = entries
+        self.device_types[hostname] = device_type
+        if downstream is not None:
+            self.downstream[hostname] = downstream
+
+    def check(self, unique_vlans: bool = True):
+        """Raise VlanConflictError if any collisions are found in the index."""
+        for vni, names in self.vni_names.items():
+            if len(names) > 1:
+                raise VlanConflictError(
+                    "VXLAN VNI {} used in VXLAN {} is already used elsewhere".format(
+                        vni, sorted(names)[-1]
+                    ))
+        if unique_vlans:
+            for vlan_id, names in self.vlan_names.items():
+                if len(names) > 1 or vlan_id in self.mgmt_vlans:
+                    raise VlanConflictError(
+                        "VLAN id {} used in VXLAN {} is already used elsewhere".format(
+                            vlan_id, sorted(names)[-1]
+                        ))
+        for hostname in sorted(self.device_errors.keys()):
+            raise VlanConflictError(self.device_errors[hostname])
+
+
+vlan_collision_index = VlanCollisionIndex()
+
+
+def get_collision_affected_hostnames(changed_files: Set[str]) -> Optional[Set[str]]:
+    """Get hostnames affected by changed settings files, or None if all
+    devices might be affected."""
+    affected_hostnames: Set[str] = set()
+    for filename in changed_files:
+        path = filename.split(os.path.sep)
+        if path[0] not in DIR_STRUCTURE:
+            continue
+        if path[0] == 'devices':
+            if len(path) > 1 and Device.valid_hostname(path[1]):
+                affected_hostnames.add(path[1])
+        else:
+            return None
+    return affected_hostnames
+
+
+def check_settings_collisions(unique_vlans: bool = True,
+                              changed_files: Optional[Set[str]] = None,
+                              prev_commit: Optional[str] = None):
     """Check settings for any duplicates/collisions.
     This will call get_settings on all devices so make sure to not call this
     from get_settings.
 
+    If changed_files and the commit they were changed from is specified,
+    and the collision index was built from that commit, only devices affected
+    by the changed files will be evaluated again.
+
     Args:
         unique_vlans: If enabled VLANs has to be globally unique
+        changed_files: Settings files changed since prev_commit
+        prev_commit: Settings repository commit before the update
 
     Returns:
 
     """
+    logger = get_logger()
+    index = vlan_collision_index
     mgmt_vlans: Set[int] = set()
-    devices_dict: dict[str, dict] = {}
+    affected_hostnames: Optional[Set[str]] = None
+    if changed_files is not None and prev_commit and index.built and \
+            index.commit == prev_commit:
+        affected_hostnames = get_collision_affected_hostnames(changed_files)
+
     with sqla_session() as session:
         mgmtdoms = session.query(Mgmtdomain).all()
         for mgmtdom in mgmtdoms:
@@ -240,84 +384,163 @@ def check_settings_collisions(unique_vlans: bool = True):
                             mgmtdom.vlan
                         ))
                 mgmt_vlans.add(mgmtdom.vlan)
-        managed_devices: List[Device] = \
-            session.query(Device).filter(Device.state == DeviceState.MANAGED).all()
-        for dev in managed_devices:
-            dev_settings, _ = get_settings(dev.hostname, dev.device_type)
-            devices_dict[dev.hostname] = dev_settings
-    check_vlan_collisions(devices_dict, mgmt_vlans, unique_vlans)
+        devices: Dict[int, Tuple[str, DeviceType, DeviceState]] = {}
+        for dev_id, hostname, device_type, state in session.query(
+                Device.id, Device.hostname, Device.device_type, Device.state):
+            devices[dev_id] = (hostname, device_type, state)
+        # Access switches connected to each dist, their vxlans are included
+        # in the settings of the dist switch
+        downstream: Dict[str, Set[str]] = {}
+        for device_a_id, device_b_id in session.query(
+                Linknet.device_a_id, Linknet.device_b_id):
+            for local_id, peer_id in [(device_a_id, device_b_id), (device_b_id, device_a_id)]:
+                if local_id not in devices or peer_id not in devices:
+                    continue
+                if devices[local_id][1] == DeviceType.DIST and \
+                        devices[peer_id][1] == DeviceType.ACCESS:
+                    downstream.setdefault(devices[local_id][0], set()).\
+                        add(devices[peer_id][0])
+
+    managed_devices: Dict[str, DeviceType] = {
+        hostname: device_type for hostname, device_type, state in devices.values()
+        if state == DeviceState.MANAGED
+    }
+    if affected_hostnames is None:
+        index.clear()
+        update_hostnames = set(managed_devices.keys())
+    else:
+        update_hostnames = affected_hostnames & set(managed_devices.keys())
+        # Dist switches include vxlans from downstream access switches
+        for dist_hostname, access_hostnames in downstream.items():
+            if access_hostnames & affected_hostnames:
+                update_hostnames.add(dist_hostname)
+        for hostname, device_type in managed_devices.items():
+            if index.device_types.get(hostname) != device_type:
+                update_hostnames.add(hostname)
+            elif device_type == DeviceType.DIST and \
+                    index.downstream.get(hostname, set()) != downstream.get(hostname, set()):
+                update_hostnames.add(hostname)
+        for hostname in list(index.device_entries.keys()):
+            if hostname not in managed_devices:
+                index.remove_device(hostname)
+    update_hostnames &= set(managed_devices.keys())
+    logger.debug("Checking VLAN collisions for {} of {} managed devices".format(
+        len(update_hostnames), len(managed_devices)))
+
+    index.built = False
+    try:
+        for hostname in sorted(update_hostnames):
+            device_type = managed_devices[hostname]
+            dev_settings, _ = get_settings(hostname, device_type)
+            index.update_device(hostname, dev_settings, device_type,
+                                downstream.get(hostname, set()))
+    except Exception as e:
+        index.clear()
+        raise e
+    index.mgmt_vlans = mgmt_vlans
+    index.commit = get_repo_commit(settings_cache.local_repo_path)
+    index.built = True
+    index.check(unique_vlans)
 
 
 def check_vlan_collisions(devices_dict: Dict[str, dict], mgmt_vlans: Set[int],
                           unique_vlans: bool = True):
-    logger = get_logger()
-    # save global VLAN IDs and their unique vxlan name
-    global_vlans: dict[int, str] = dict.fromkeys(mgmt_vlans, 'management')
-    global_vnis: dict[int, str] = {}
-    device_vlan_ids: dict[str, Set[int]] = {}  # save used VLAN IDs per device
-    device_vlan_names: dict[str, Set[str]] = {}  # save used VLAN names per device
     access_hostnames: List[str] = []
     with sqla_session() as session:
         access_devs = session.query(Device).filter(Device.device_type == DeviceType.ACCESS).all()
         for dev in access_devs:
             access_hostnames.append(dev.hostname)
 
+    index = VlanCollisionIndex()
+    index.mgmt_vlans = set(mgmt_vlans)
     for hostname, settings in devices_dict.items():
         if 'vxlans' not in settings:
             continue
-        for vxlan_name, vxlan_data in settings['vxlans'].items():
-            # VXLAN VNI checks
-            if 'vni' not in vxlan_data or not isinstance(vxlan_data['vni'], int):
-                logger.error("VXLAN {} is missing vni".format(vxlan_name))
-                continue
-            if vxlan_data['vni'] in global_vnis and \
-                    global_vnis[vxlan_data['vni']] != vxlan_name:
-                raise VlanConflictError(
-                    "VXLAN VNI {} used in VXLAN {} is already used elsewhere".format(
-                        vxlan_data['vni'], vxlan_name
-                    ))
-            elif vxlan_data['vni'] not in global_vnis:
-                global_vnis[vxlan_data['vni']] = vxlan_name
-            # VLAN id checks
-            if 'vlan_id' not in vxlan_data or not isinstance(vxlan_data['vlan_id'], int):
-                logger.error("VXLAN {} is missing vlan_id".format(vxlan_name))
-                continue
-            if unique_vlans and vxlan_data['vlan_id'] in global_vlans and \
-                    global_vlans[vxlan_data['vlan_id']] != vxlan_name:
-                raise VlanConflictError(
-                    "VLAN id {} used in VXLAN {} is already used elsewhere".format(
-                        vxlan_data['vlan_id'], vxlan_name
-                    ))
-            elif hostname in device_vlan_ids and \
-                    vxlan_data['vlan_id'] in device_vlan_ids[hostname]:
-                raise VlanConflictError("VLAN id {} used multiple times in device {}".format(
-                    vxlan_data['vlan_id'], hostname
-                ))
-            elif hostname in device_vlan_ids:
-                device_vlan_ids[hostname].add(vxlan_data['vlan_id'])
-            else:
-                device_vlan_ids[hostname] = {vxlan_data['vlan_id']}
-            global_vlans[vxlan_data['vlan_id']] = vxlan_name
-            # VLAN name checks
-            if 'vlan_name' not in vxlan_data or not isinstance(vxlan_data['vlan_name'], str):
-                logger.error("VXLAN {} is missing vlan_name".format(vxlan_name))
-                continue
-            if hostname in device_vlan_names and \
-                    vxlan_data['vlan_name'] in device_vlan_names[hostname] and \
-                    hostname in access_hostnames:  # only trigger for access switches
-                raise VlanConflictError("VLAN name {} used multiple times in device {}".format(
-                    vxlan_data['vlan_name'], hostname
-                ))
-            elif hostname in device_vlan_names:
-                device_vlan_names[hostname].add(vxlan_data['vlan_name'])
-            else:
-                device_vlan_names[hostname] = {vxlan_data['vlan_name']}
+        if hostname in access_hostnames:
+            device_type = DeviceType.ACCESS
+        else:
+            device_type = DeviceType.UNKNOWN
+        index.update_device(hostname, settings, device_type)
+    index.check(unique_vlans)
+
+
+class SettingsCache(object):
+    """In-process cache of parsed settings files, merged settings layers
+    and resolved settings. Everything cached is only valid for a single
+    commit of the settings repository, when HEAD moves the cache is emptied."""
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local_repo_path: Optional[str] = None
+        self.commit: Optional[str] = None
+        self.verified = False
+        self.files: Dict[str, Any] = {}
+        self.checked_files: Set[str] = set()
+        self.layers: Dict[Optional[DeviceType], Tuple[dict, dict]] = {}
+        self.settings: Dict[Tuple[Optional[str], Optional[DeviceType]], Tuple[dict, dict]] = {}
+        self.group_settings: Optional[Tuple[dict, dict]] = None
+        self.group_matcher: Optional[GroupMatcher] = None
+
+    @property
+    def local_repo_path(self) -> str:
+        if not self._local_repo_path:
+            with open('/etc/cnaas-nms/repository.yml', 'r') as repo_file:
+                repo_config = yaml.safe_load(repo_file)
+            self._local_repo_path = repo_config['settings_local']
+        return self._local_repo_path
+
+    def clear(self):
+        with self._lock:
+            self.commit = None
+            self.verified = False
+            self.files = {}
+            self.checked_files = set()
+            self.layers = {}
+            self.settings = {}
+            self.group_settings = None
+            self.group_matcher = None
+
+    def check_commit(self) -> Optional[str]:
+        """Make sure cached data belongs to the current settings repository
+        commit. Returns the current commit, or None if it can't be determined
+        in which case nothing will be cached."""
+        commit = get_repo_commit(self.local_repo_path)
+        # Nothing to do in the common case, so threads don't wait for the lock
+        if commit is not None and commit == self.commit:
+            return commit
+        with self._lock:
+            if commit is None or commit != self.commit:
+                self.clear()
+                self.commit = commit
+        return commit
+
+    @property
+    def enabled(self) -> bool:
+        return self.commit is not None
+
+
+settings_cache = SettingsCache()
+
+
+def get_settings_commit() -> Optional[str]:
+    """Get the settings repository commit that cached settings are valid for,
+    or None if it can't be determined."""
+    return settings_cache.check_commit()
+
+
+def clear_settings_cache():
+    """Clear settings cached in this process, call after the settings
+    repository has been updated."""
+    settings_cache.clear()
 
 
-@redis_lru_cache
 def read_settings_file(filename):
+    if settings_cache.enabled and filename in settings_cache.files:
+        return settings_cache.files[filename]
     with open(filename, 'r') as f:
-        return yaml.safe_load(f)
+        data = yaml.safe_load(f)
+    if settings_cache.enabled:
+        settings_cache.files[filename] = data
+    return data
 
 
 def read_settings(local_repo_path: str, path: List[str], origin: str,
@@ -347,8 +570,11 @@ def read_settings(local_repo_path: str, path: List[str], origin: str,
         return merged_settings, merged_settings_origin
     settings: dict = yamldata
     if groups or hostname:
-        syntax_dict, syntax_dict_origin = merge_dict_origin({}, settings, {}, origin)
-        check_settings_syntax(syntax_dict, syntax_dict_origin)
+        if not settings_cache.enabled or filename not in settings_cache.checked_files:
+            syntax_dict, syntax_dict_origin = merge_dict_origin({}, settings, {}, origin)
+            check_settings_syntax(syntax_dict, syntax_dict_origin)
+            if settings_cache.enabled:
+                settings_cache.checked_files.add(filename)
         settings = filter_yamldata(settings, groups, hostname)
     return merge_dict_origin(merged_settings, settings, merged_settings_origin, origin)
 
@@ -427,35 +653,47 @@ def get_downstream_dependencies(hostname: str, settings: dict) -> dict:
             return settings
         if dev.device_type != DeviceType.DIST:
             return settings
-        neighbor_devices = dev.get_neighbors(session)
+        neighbor_devices = get_topology(session).get_neighbors(hostname)
         # Downstream device hostnames
         ds_hostnames = []
         for neighbor_dev in neighbor_devices:
             if neighbor_dev.device_type == DeviceType.ACCESS:
                 ds_hostnames.append(neighbor_dev.hostname)
+        if not ds_hostnames:
+            return settings
+        # Don't modify vxlans in place, it might be shared with cached layers
+        vxlans = dict(settings['vxlans'])
         for ds_hostname in ds_hostnames:
             ds_settings, _ = get_settings(ds_hostname, DeviceType.ACCESS)
             for vxlan_name, vxlan_data in ds_settings['vxlans'].items():
-                if vxlan_name not in settings['vxlans'].keys():
-                    settings['vxlans'][vxlan_name] = vxlan_data
+                if vxlan_name not in vxlans.keys():
+                    vxlans[vxlan_name] = vxlan_data
+        settings['vxlans'] = vxlans
     return settings
 
 
-@redis_lru_cache
-def get_settings(hostname: Optional[str] = None, device_type: Optional[DeviceType] = None) -> \
-        Tuple[dict, dict]:
-    """Get settings to use for device matching hostname or global
-    settings if no hostname is specified."""
+def verify_settings_repo(local_repo_path: str):
+    """Verify settings repository directory structure, only done once per
+    commit when caching is possible."""
     logger = get_logger()
-    with open('/etc/cnaas-nms/repository.yml', 'r') as repo_file:
-        repo_config = yaml.safe_load(repo_file)
-
-    local_repo_path = repo_config['settings_local']
+    if settings_cache.enabled and settings_cache.verified:
+        return
     try:
         verify_dir_structure(local_repo_path, DIR_STRUCTURE)
     except VerifyPathException as e:
         logger.exception("Exception when verifying settings repository directory structure")
         raise e
+    if settings_cache.enabled:
+        settings_cache.verified = True
+
+
+def get_settings_layers(local_repo_path: str, device_type: Optional[DeviceType] = None) -> \
+        Tuple[dict, dict]:
+    """Get the merged settings layers that are common for all devices of a
+    device type: defaults, global, fabric and device type settings.
+    The returned dicts are shared with the cache and must not be modified."""
+    if settings_cache.enabled and device_type in settings_cache.layers:
+        return settings_cache.layers[device_type]
 
     # 1. Get CNaaS-NMS default settings
     data_dir = pkg_resources.resource_filename(__name__, 'data')
@@ -483,6 +721,20 @@ def get_settings(hostname: Optional[str] = None, device_type: Optional[DeviceTyp
             local_repo_path, [device_type.name.lower(), 'base_system.yml'],
             'devicetype->base_system.yml',
             settings, settings_origin)
+
+    if settings_cache.enabled:
+        settings_cache.layers[device_type] = (settings, settings_origin)
+    return settings, settings_origin
+
+
+def resolve_settings(local_repo_path: str, hostname: Optional[str] = None,
+                     device_type: Optional[DeviceType] = None) -> Tuple[dict, dict]:
+    """Compose and verify settings for a device, or global settings if no
+    hostname is specified."""
+    logger = get_logger()
+    verify_settings_repo(local_repo_path)
+    settings, settings_origin = get_settings_layers(local_repo_path, device_type)
+
     # 5. Get settings repo device specific settings
     if hostname:
         # Some settings parsing require knowledge of group memberships
@@ -527,45 +779,206 @@ def get_settings(hostname: Optional[str] = None, device_type: Optional[DeviceTyp
     return verified_settings, settings_origin
 
 
-@redis_lru_cache
-def get_group_settings():
+def get_shared_settings_key(commit: str, hostname: Optional[str],
+                            device_type: Optional[DeviceType]) -> str:
+    return 'settings:{}:{}:{}'.format(
+        commit, hostname or '', device_type.name if device_type else '')
+
+
+def get_settings(hostname: Optional[str] = None, device_type: Optional[DeviceType] = None) -> \
+        Tuple[dict, dict]:
+    """Get settings to use for device matching hostname or global
+    settings if no hostname is specified.
+
+    Resolved settings are cached in process memory per settings repository
+    commit, and optionally shared between processes using redis if
+    settings_shared_cache is enabled in db_config.yml."""
     logger = get_logger()
+    local_repo_path = settings_cache.local_repo_path
+    commit = settings_cache.check_commit()
+    key = (hostname, device_type)
+    if commit and key in settings_cache.settings:
+        return copy.deepcopy(settings_cache.settings[key])
+
+    ret = None
+    if commit and SETTINGS_SHARED_CACHE:
+        try:
+            shared_data = get_redis_client().get(
+                get_shared_settings_key(commit, hostname, device_type))
+            if shared_data:
+                ret = pickle.loads(shared_data)
+        except Exception as e:
+            logger.debug("Could not read settings from shared cache: {}".format(str(e)))
+    if not ret:
+        ret = resolve_settings(local_repo_path, hostname, device_type)
+        if commit and SETTINGS_SHARED_CACHE:
+            try:
+                get_redis_client().set(get_shared_settings_key(commit, hostname, device_type),
+                                       pickle.dumps(ret), ex=SETTINGS_SHARED_CACHE_TTL)
+            except Exception as e:
+                logger.debug("Could not save settings to shared cache: {}".format(str(e)))
+
+    if commit and commit == settings_cache.commit:
+        settings_cache.settings[key] = ret
+    return copy.deepcopy(ret)
+
+
+def _validate_settings_worker_init(commit: Optional[str],
+                                   layers: Dict[Optional[DeviceType], Tuple[dict, dict]],
+                                   group_settings: Optional[Tuple[dict, dict]]):
+    """Add settings layers parsed by the parent process to the settings cache
+    of a worker process, if the worker sees the same repository commit."""
+    if commit and settings_cache.check_commit() == commit:
+        settings_cache.verified = True
+        settings_cache.layers.update(layers)
+        settings_cache.group_settings = group_settings
+
+
+def _get_mp_context():
+    """Start validation workers from a forkserver. Settings are refreshed
+    from the API or scheduler process, forking those directly could copy
+    cache locks held by other threads and database or redis connections
+    in use by the parent into the workers."""
+    mp_context = multiprocessing.get_context('forkserver')
+    mp_context.set_forkserver_preload(['cnaas_nms.db.settings'])
+    return mp_context
+
+
+def _validate_device_settings(hostname: str, device_type: Optional[DeviceType]) -> \
+        Tuple[str, Optional[DeviceType], Optional[Tuple[dict, dict]], Optional[str]]:
+    try:
+        return hostname, device_type, get_settings(hostname, device_type), None
+    except SettingsSyntaxError as e:
+        return hostname, device_type, None, str(e)
+
+
+def validate_devices_settings(hostnames: List[str]):
+    """Validate settings for all specified devices, using a pool of worker
+    processes if there are many devices. Managed devices are validated using
+    their device type so that the results can be reused from the settings
+    cache by check_settings_collisions.
+
+    Call get_settings for global and device type settings before this, the
+    cached layers are then sent to the worker processes.
+
+    Raises:
+        SettingsSyntaxError: With errors for all devices that failed validation
+    """
+    logger = get_logger()
+    device_types: Dict[str, DeviceType] = {}
+    with sqla_session() as session:
+        for hostname, device_type in session.query(Device.hostname, Device.device_type).\
+                filter(Device.hostname.in_(hostnames)).\
+                filter(Device.state == DeviceState.MANAGED):
+            if device_type in [DeviceType.ACCESS, DeviceType.DIST, DeviceType.CORE]:
+                device_types[hostname] = device_type
+    args = [(hostname, device_types.get(hostname)) for hostname in hostnames]
+
+    commit = settings_cache.check_commit()
+    if len(args) < SETTINGS_VALIDATION_PARALLEL_MIN or SETTINGS_VALIDATION_WORKERS <= 1:
+        results = [_validate_device_settings(*arg) for arg in args]
+    else:
+        logger.debug("Validating settings for {} devices using {} processes".format(
+            len(args), SETTINGS_VALIDATION_WORKERS))
+        # Parse groups.yml once here instead of in every worker
+        get_group_settings()
+        with ProcessPoolExecutor(max_workers=SETTINGS_VALIDATION_WORKERS,
+                                 mp_context=_get_mp_context(),
+                                 initializer=_validate_settings_worker_init,
+                                 initargs=(commit, dict(settings_cache.layers),
+                                           settings_cache.group_settings)) as executor:
+            results = list(executor.map(
+                _validate_device_settings,
+                [hostname for hostname, _ in args],
+                [device_type for _, device_type in args],
+                chunksize=max(1, len(args) // (SETTINGS_VALIDATION_WORKERS * 4))
+            ))
+
+    errors = []
+    for hostname, device_type, ret, error in results:
+        if error:
+            errors.append("{}: {}".format(hostname, error))
+        elif commit and commit == settings_cache.commit:
+            settings_cache.settings[(hostname, device_type)] = ret
+    if errors:
+        raise SettingsSyntaxError(
+            "Settings for {} devices failed validation:\n{}".format(
+                len(errors), "\n".join(errors)))
+
+
+def get_group_settings():
     settings: dict = {}
     settings_origin: dict = {}
 
-    with open('/etc/cnaas-nms/repository.yml', 'r') as repo_file:
-        repo_config = yaml.safe_load(repo_file)
-    local_repo_path = repo_config['settings_local']
-    try:
-        verify_dir_structure(local_repo_path, DIR_STRUCTURE)
-    except VerifyPathException as e:
-        logger.exception("Exception when verifying settings repository directory structure")
-        raise e
+    local_repo_path = settings_cache.local_repo_path
+    commit = settings_cache.check_commit()
+    if commit and settings_cache.group_settings:
+        return settings_cache.group_settings
+    verify_settings_repo(local_repo_path)
     settings, settings_origin = read_settings(local_repo_path,
                                               ['global', 'groups.yml'],
                                               'global',
                                               settings,
                                               settings_origin)
     check_settings_syntax(settings, settings_origin)
-    return f_groups(**settings).dict(), settings_origin
+    ret = f_groups(**settings).dict(), settings_origin
+    if commit and commit == settings_cache.commit:
+        settings_cache.group_settings = ret
+    return ret
+
+
+class GroupMatcher(object):
+    """Match hostnames against the group regexes in groups.yml. Regexes are
+    compiled once and group memberships are remembered per hostname."""
+    def __init__(self, group_settings: Optional[dict]):
+        self._lock = threading.Lock()
+        self.groups: List[Tuple[str, re.Pattern]] = []
+        if group_settings and group_settings.get('groups'):
+            for group in group_settings['groups']:
+                if 'name' not in group['group']:
+                    continue
+                if 'regex' not in group['group']:
+                    continue
+                self.groups.append((group['group']['name'], re.compile(group['group']['regex'])))
+        self.group_names: List[str] = [name for name, _ in self.groups]
+        # hostname -> names of groups the hostname is a member of
+        self.memberships: Dict[str, List[str]] = {}
+
+    def get_groups(self, hostname: str = '') -> List[str]:
+        """Get names of all groups hostname is a member of, or all group
+        names if no hostname is specified."""
+        if not hostname:
+            return list(self.group_names)
+        with self._lock:
+            if hostname not in self.memberships:
+                self.memberships[hostname] = \
+                    [name for name, regex in self.groups if regex.match(hostname)]
+            return list(self.memberships[hostname])
+
+    def get_members(self, hostnames: List[str], group_name: Optional[str] = None) -> \
+            Dict[str, List[str]]:
+        """Get a mapping of group name to hostnames that are members of
+        that group, optionally only for a single group."""
+        ret: Dict[str, List[str]] = {}
+        for hostname in hostnames:
+            for group in self.get_groups(hostname):
+                if group_name and group != group_name:
+                    continue
+                ret.setdefault(group, []).append(hostname)
+        return ret
+
+
+def get_group_matcher() -> GroupMatcher:
+    """Get a group matcher for the current settings repository commit."""
+    commit = settings_cache.check_commit()
+    if commit and settings_cache.group_matcher:
+        return settings_cache.group_matcher
+    settings, _ = get_group_settings()
+    matcher = GroupMatcher(settings)
+    if commit and commit == settings_cache.commit:
+        settings_cache.group_matcher = matcher
+    return matcher
 
 
-@redis_lru_cache
 def get_groups(hostname=''):
-    groups = []
-    settings, origin = get_group_settings()
-    if settings is None:
-        return groups
-    if 'groups' not in settings:
-        return groups
-    if settings['groups'] is None:
-        return groups
-    for group in settings['groups']:
-        if 'name' not in group['group']:
-            continue
-        if 'regex' not in group['group']:
-            continue
-        if hostname and not re.match(group['group']['regex'], hostname):
-            continue
-        groups.append(group['group']['name'])
-    return groups
+    return get_group_matcher().get_groups(hostname)
@@ -73,6 +73,26 @@ class DeviceTests(unittest.TestCase):
                 self.assertIsInstance(nei, Device)
                 pprint.pprint(nei.as_dict())
 
+    def test_set_syncstatus(self):
+        hostname = self.testdata['query_neighbor_device']
+        with sqla_session() as session:
+            Device.set_syncstatus(session, [hostname], False)
+            self.assertEqual(Device.set_syncstatus(session, [hostname, 'nonexistent'], True), 1)
+            dev: Device = session.query(Device).filter(Device.hostname == hostname).one()
+            self.assertTrue(dev.synchronized)
+            epoch = dev.sync_epoch
+            self.assertIsNotNone(epoch)
+            # Status is already set, so no devices are changed and the epoch is kept
+            self.assertEqual(Device.set_syncstatus(session, [hostname], True), 0)
+            session.expire_all()
+            self.assertEqual(dev.sync_epoch, epoch)
+            self.assertEqual(Device.set_syncstatus(session, [hostname], False), 1)
+            session.expire_all()
+            self.assertGreater(dev.sync_epoch, epoch)
+            self.assertEqual(Device.get_existing_hostnames(session, [hostname, 'nonexistent']),
+                             {hostname})
+            session.rollback()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 
-from cnaas_nms.db.git import template_syncstatus
+from cnaas_nms.db.git import template_syncstatus, diff_settings_keys
 from cnaas_nms.db.device import DeviceType
 
 
@@ -12,6 +12,14 @@ class GitTests(unittest.TestCase):
             self.assertEqual(type(devtype[1]), str)
         self.assertTrue((DeviceType.ACCESS, 'eos') in devtypes)
 
+    def test_diff_settings_keys(self):
+        old = {'ntp_servers': [{'host': '10.0.0.1'}], 'snmp_servers': [], 'vxlans': {}}
+        new = {'ntp_servers': [{'host': '10.0.0.2'}], 'snmp_servers': [],
+               'radius_servers': []}
+        self.assertEqual(diff_settings_keys(old, new),
+                         {'ntp_servers', 'vxlans', 'radius_servers'})
+        self.assertEqual(diff_settings_keys(old, old), set())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -5,6 +5,8 @@ import pkg_resources
 import yaml
 import os
 
+from cnaas_nms.db.settings import GroupMatcher
+
 
 class GroupsTest(unittest.TestCase):
     def setUp(self):
@@ -12,3 +14,25 @@ class GroupsTest(unittest.TestCase):
         with open(os.path.join(data_dir, 'testdata.yml'), 'r') as f_testdata:
             self.testdata = yaml.safe_load(f_testdata)
 
+    def test_group_matcher(self):
+        matcher = GroupMatcher({'groups': [
+            {'group': {'name': 'ALL', 'regex': '.*'}},
+            {'group': {'name': 'DIST', 'regex': '^dist'}},
+            {'group': {'name': 'EAST', 'regex': '.*-east$'}},
+            {'group': {'name': 'NOREGEX'}}
+        ]})
+        self.assertEqual(matcher.get_groups(), ['ALL', 'DIST', 'EAST'])
+        self.assertEqual(matcher.get_groups('dist1-east'), ['ALL', 'DIST', 'EAST'])
+        self.assertEqual(matcher.get_groups('access1'), ['ALL'])
+        self.assertEqual(
+            matcher.get_members(['dist1-east', 'access1', 'access2-east']),
+            {'ALL': ['dist1-east', 'access1', 'access2-east'],
+             'DIST': ['dist1-east'],
+             'EAST': ['dist1-east', 'access2-east']})
+        self.assertEqual(
+            matcher.get_members(['dist1-east', 'access1'], 'DIST'),
+            {'DIST': ['dist1-east']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import unittest
+from ipaddress import IPv4Network
+
+from cnaas_nms.db.ipalloc import find_free_address, first_free_index
+
+
+class IpallocTests(unittest.TestCase):
+    def test_first_free_index(self):
+        self.assertEqual(first_free_index([], 5, 10), 5)
+        self.assertEqual(first_free_index([5, 6, 7, 9], 5, 10), 8)
+        self.assertEqual(first_free_index([1, 2, 5, 6, 7, 8, 9, 10, 20], 5, 10), None)
+        self.assertEqual(first_free_index([1, 2, 3], 5, 10), 5)
+        self.assertEqual(first_free_index([], 10, 5), None)
+
+    def test_find_free_mgmt_ip(self):
+        mgmt_net = IPv4Network('10.0.6.0/24')
+        # 5 first hosts are reserved
+        self.assertEqual(
+            find_free_address(mgmt_net, [], skip_first=5, hosts_only=True),
+            IPv4Network('10.0.6.6/32'))
+        self.assertEqual(
+            find_free_address(mgmt_net, ['10.0.6.6', '10.0.6.7', '10.0.6.9', '10.0.7.8'],
+                              skip_first=5, hosts_only=True),
+            IPv4Network('10.0.6.8/32'))
+        # Broadcast address is never allocated
+        self.assertIsNone(
+            find_free_address(IPv4Network('10.0.6.0/30'), ['10.0.6.1', '10.0.6.2'],
+                              hosts_only=True))
+
+    def test_find_free_loopback_ip(self):
+        self.assertEqual(
+            find_free_address(IPv4Network('10.199.0.0/30'),
+                              ['10.199.0.0', '10.199.0.1', '10.199.0.2']),
+            IPv4Network('10.199.0.3/32'))
+        self.assertIsNone(
+            find_free_address(IPv4Network('10.199.0.0/31'), ['10.199.0.0', '10.199.0.1']))
+
+    def test_find_free_linknet(self):
+        self.assertEqual(
+            find_free_address(IPv4Network('10.198.0.0/24'),
+                              ['10.198.0.0/31', '10.198.0.2/31', '10.198.0.6/31'],
+                              prefixlen=31),
+            IPv4Network('10.198.0.4/31'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from cnaas_nms.db.job import JobResultData
+
+
+class JobTests(unittest.TestCase):
+    def test_compact_result(self):
+        result = {
+            'devices': {
+                'eosdist': {
+                    'failed': False,
+                    'job_tasks': [
+                        {'task_name': 'Generate device config', 'failed': False,
+                         'result': 'hostname eosdist\n', 'diff': ''},
+                        {'task_name': 'Sync device config', 'failed': False,
+                         'result': None, 'diff': '+hostname eosdist\n'},
+                    ]
+                }
+            }
+        }
+        self.assertEqual(JobResultData.compact_result(result), {
+            'devices': {
+                'eosdist': {
+                    'failed': False,
+                    'job_tasks': [
+                        {'task_name': 'Generate device config', 'failed': False},
+                        {'task_name': 'Sync device config', 'failed': False},
+                    ]
+                }
+            }
+        })
+        # Results that are not from nornir are kept
+        self.assertEqual(JobResultData.compact_result({'message': 'test'}),
+                         {'message': 'test'})
+
+
+if __name__ == '__main__':
+    unittest.main()
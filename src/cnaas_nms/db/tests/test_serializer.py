@@ -0,0 +1,58 @@
+import datetime
+import ipaddress
+import json
+import unittest
+
+from cnaas_nms.db.device import Device, DeviceState, DeviceType, device_serializer
+from cnaas_nms.db.job import Job, JobStatus
+from cnaas_nms.db.serializer import dumps
+
+
+class SerializerTests(unittest.TestCase):
+    def setUp(self):
+        self.device = Device(
+            id=1,
+            hostname='eosaccess',
+            management_ip=ipaddress.IPv4Address('10.0.6.6'),
+            state=DeviceState.MANAGED,
+            device_type=DeviceType.ACCESS,
+            synchronized=True,
+            last_seen=datetime.datetime(2020, 1, 1, 12, 0)
+        )
+
+    def test_serialize_instance(self):
+        self.assertEqual(device_serializer.serialize(self.device), self.device.as_dict())
+        self.assertEqual(
+            device_serializer.serialize(self.device, ['hostname', 'state', 'management_ip']),
+            {'hostname': 'eosaccess', 'state': 'MANAGED', 'management_ip': '10.0.6.6'})
+
+    def test_row_converter(self):
+        fields = device_serializer.parse_fields('hostname,device_type,last_seen')
+        convert = device_serializer.row_converter(fields)
+        self.assertEqual(
+            convert((1, 'eosaccess', DeviceType.ACCESS, None)),
+            {'hostname': 'eosaccess', 'device_type': 'ACCESS', 'last_seen': None})
+
+    def test_parse_fields(self):
+        self.assertEqual(device_serializer.parse_fields(None), tuple(device_serializer.fields))
+        self.assertEqual(device_serializer.parse_fields('id, hostname'), ('id', 'hostname'))
+        with self.assertRaises(ValueError):
+            device_serializer.parse_fields('hostname,password')
+
+    def test_job_summary(self):
+        job = Job(id=5, status=JobStatus.FINISHED, function_name='sync_devices',
+                  finish_time=datetime.datetime(2020, 1, 1, 12, 0),
+                  exception={'message': 'test'})
+        d = job.as_dict(summary=True)
+        self.assertEqual(list(d.keys()), Job.SUMMARY_COLUMNS)
+        self.assertEqual(d['status'], 'FINISHED')
+        self.assertEqual(d['finish_time'], '2020-01-01T12:00:00')
+
+    def test_dumps(self):
+        data = {'devices': [device_serializer.serialize(self.device)]}
+        self.assertEqual(json.loads(dumps(data)), data)
+        self.assertEqual(json.loads(dumps({'big': 2 ** 70})), {'big': 2 ** 70})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,7 @@ import pkg_resources
 
 from cnaas_nms.db.settings import get_settings, verify_dir_structure, \
     DIR_STRUCTURE, VerifyPathException, \
-    check_vlan_collisions, VlanConflictError
+    check_vlan_collisions, VlanConflictError, VlanCollisionIndex
 from cnaas_nms.db.device import DeviceType
 
 class SettingsTests(unittest.TestCase):
@@ -150,6 +150,38 @@ class SettingsTests(unittest.TestCase):
         }
         self.assertIsNone(check_vlan_collisions(devices_dict, mgmt_vlans))
 
+    def test_vlan_collision_index_update(self):
+        index = VlanCollisionIndex()
+        index.mgmt_vlans = {100}
+        index.update_device('device1', {
+            'vxlans': {
+                'vxlan1': {'vni': 100200, 'vlan_id': 200, 'vlan_name': 'vlanname1'}
+            }
+        }, DeviceType.ACCESS)
+        index.update_device('device2', {
+            'vxlans': {
+                'vxlan2': {'vni': 100200, 'vlan_id': 201, 'vlan_name': 'vlanname2'}
+            }
+        }, DeviceType.ACCESS)
+        self.assertRaises(VlanConflictError, index.check)
+        # Updating only the changed device should resolve the conflict
+        index.update_device('device2', {
+            'vxlans': {
+                'vxlan2': {'vni': 100201, 'vlan_id': 201, 'vlan_name': 'vlanname2'}
+            }
+        }, DeviceType.ACCESS)
+        self.assertIsNone(index.check())
+        index.update_device('device2', {
+            'vxlans': {
+                'vxlan2': {'vni': 100201, 'vlan_id': 100, 'vlan_name': 'vlanname2'}
+            }
+        }, DeviceType.ACCESS)
+        self.assertRaises(VlanConflictError, index.check)
+        self.assertIsNone(index.check(unique_vlans=False))
+        index.remove_device('device2')
+        self.assertIsNone(index.check())
+        self.assertEqual(index.vni_names, {100200: {'vxlan1': 1}})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from ipaddress import IPv4Address
+
+from cnaas_nms.db.device import DeviceType
+from cnaas_nms.db.topology import Topology, TopologyDevice
+
+
+class TopologyTests(unittest.TestCase):
+    def setUp(self):
+        self.topology = Topology()
+        dist1 = TopologyDevice(id=1, hostname='eosdist1', device_type=DeviceType.DIST)
+        dist2 = TopologyDevice(id=2, hostname='eosdist2', device_type=DeviceType.DIST)
+        access = TopologyDevice(id=3, hostname='eosaccess', device_type=DeviceType.ACCESS)
+        for linknet_id, dist, dist_port, access_port in [(1, dist1, 'Ethernet2', 'Ethernet2'),
+                                                         (2, dist2, 'Ethernet2', 'Ethernet3')]:
+            self.topology.add_link(linknet_id, dist, access, dist_port, None, access_port,
+                                   None, None)
+            self.topology.add_link(linknet_id, access, dist, access_port, None, dist_port,
+                                   None, None)
+        self.topology.add_link(3, dist1, dist2, 'Ethernet1', IPv4Address('10.198.0.0'),
+                               'Ethernet1', IPv4Address('10.198.0.1'), 31)
+        self.topology.add_link(3, dist2, dist1, 'Ethernet1', IPv4Address('10.198.0.1'),
+                               'Ethernet1', IPv4Address('10.198.0.0'), 31)
+
+    def test_neighbors(self):
+        self.assertEqual([dev.hostname for dev in self.topology.get_neighbors('eosdist1')],
+                         ['eosaccess', 'eosdist2'])
+        self.assertEqual(self.topology.get_neighbors('unknown'), [])
+
+    def test_uplinks(self):
+        self.assertEqual(self.topology.get_uplinks('eosaccess'),
+                         ([{'ifname': 'Ethernet2'}, {'ifname': 'Ethernet3'}],
+                          ['eosdist1', 'eosdist2']))
+
+    def test_link_lookups(self):
+        self.assertEqual(self.topology.get_neighbor_local_ifname('eosaccess', 'eosdist2'),
+                         'Ethernet3')
+        self.assertEqual(self.topology.get_neighbor_local_ipif('eosdist2', 'eosdist1'),
+                         '10.198.0.1/31')
+        self.assertEqual(self.topology.get_neighbor_ip('eosdist2', 'eosdist1'),
+                         IPv4Address('10.198.0.0'))
+        self.assertIsNone(self.topology.get_neighbor_ip('eosaccess', 'unknown'))
+        self.assertEqual(self.topology.get_linknet_localif_mapping('eosdist1'),
+                         {'Ethernet2': 'eosaccess', 'Ethernet1': 'eosdist2'})
+
+
+if __name__ == '__main__':
+    unittest.main()
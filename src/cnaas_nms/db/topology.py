@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import ipaddress
+import threading
+from dataclasses import dataclass
+from ipaddress import IPv4Address
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, aliased
+
+from cnaas_nms.db.device import Device, DeviceType
+from cnaas_nms.db.linknet import Linknet
+from cnaas_nms.db.session import sqla_session, get_redis_client
+from cnaas_nms.tools.log import get_logger
+
+
+# Redis key incremented every time linknets are changed, so that all
+# processes know when to rebuild their topology graph
+TOPOLOGY_VERSION_KEY = 'topology:version'
+# Device attributes that are part of the topology graph
+TOPOLOGY_DEVICE_ATTRS = ('hostname', 'device_type')
+
+
+@dataclass(frozen=True)
+class TopologyDevice:
+    id: int
+    hostname: str
+    device_type: DeviceType
+
+
+@dataclass(frozen=True)
+class TopologyLink:
+    """One side of a linknet, as seen from the local device."""
+    linknet_id: int
+    peer: TopologyDevice
+    local_port: Optional[str]
+    local_ip: Optional[IPv4Address]
+    peer_port: Optional[str]
+    peer_ip: Optional[IPv4Address]
+    prefixlen: Optional[int]
+
+    @property
+    def local_ipif(self) -> Optional[str]:
+        """Local interface IP in ip/prefixlen format."""
+        if self.prefixlen is None:
+            return None
+        return "{}/{}".format(self.local_ip, self.prefixlen)
+
+
+class Topology(object):
+    """Graph of devices connected by linknets, built from a single query.
+    All lookups are dict lookups and don't use the database."""
+    def __init__(self):
+        self.devices: Dict[str, TopologyDevice] = {}
+        # hostname -> links from that device, in linknet id order
+        self.links: Dict[str, List[TopologyLink]] = {}
+        # (hostname, peer hostname) -> first link between the devices
+        self.link_index: Dict[Tuple[str, str], TopologyLink] = {}
+
+    def add_link(self, linknet_id: int, local: TopologyDevice, peer: TopologyDevice,
+                 local_port, local_ip, peer_port, peer_ip, prefixlen):
+        link = TopologyLink(linknet_id=linknet_id, peer=peer, local_port=local_port,
+                            local_ip=local_ip, peer_port=peer_port, peer_ip=peer_ip,
+                            prefixlen=prefixlen)
+        self.devices[local.hostname] = local
+        self.links.setdefault(local.hostname, []).append(link)
+        self.link_index.setdefault((local.hostname, peer.hostname), link)
+
+    @classmethod
+    def load(cls, session) -> Topology:
+        device_a = aliased(Device)
+        device_b = aliased(Device)
+        query = session.query(
+            Linknet.id, Linknet.ipv4_network,
+            Linknet.device_a_port, Linknet.device_a_ip,
+            Linknet.device_b_port, Linknet.device_b_ip,
+            device_a.id, device_a.hostname, device_a.device_type,
+            device_b.id, device_b.hostname, device_b.device_type
+        ).join(device_a, Linknet.device_a_id == device_a.id).\
+            join(device_b, Linknet.device_b_id == device_b.id).\
+            order_by(Linknet.id)
+        topology = cls()
+        for (linknet_id, ipv4_network, a_port, a_ip, b_port, b_ip,
+             a_id, a_hostname, a_type, b_id, b_hostname, b_type) in query:
+            dev_a = TopologyDevice(id=a_id, hostname=a_hostname, device_type=a_type)
+            dev_b = TopologyDevice(id=b_id, hostname=b_hostname, device_type=b_type)
+            prefixlen = None
+            if ipv4_network:
+                prefixlen = ipaddress.IPv4Network(ipv4_network).prefixlen
+            topology.add_link(linknet_id, dev_a, dev_b, a_port, a_ip, b_port, b_ip, prefixlen)
+            topology.add_link(linknet_id, dev_b, dev_a, b_port, b_ip, a_port, a_ip, prefixlen)
+        return topology
+
+    def get_links(self, hostname: str) -> List[TopologyLink]:
+        return self.links.get(hostname, [])
+
+    def get_neighbors(self, hostname: str) -> List[TopologyDevice]:
+        """Get devices connected to hostname, once per linknet."""
+        return [link.peer for link in self.get_links(hostname)]
+
+    def get_link_to(self, hostname: str, peer_hostname: str) -> Optional[TopologyLink]:
+        return self.link_index.get((hostname, peer_hostname))
+
+    def get_neighbor_local_ifname(self, hostname: str, peer_hostname: str) -> Optional[str]:
+        """Get the local interface name on hostname that links to peer_hostname."""
+        link = self.get_link_to(hostname, peer_hostname)
+        return link.local_port if link else None
+
+    def get_neighbor_local_ipif(self, hostname: str, peer_hostname: str) -> Optional[str]:
+        """Get the local interface IP on hostname that links to peer_hostname."""
+        link = self.get_link_to(hostname, peer_hostname)
+        return link.local_ipif if link else None
+
+    def get_neighbor_ip(self, hostname: str, peer_hostname: str) -> Optional[IPv4Address]:
+        """Get the remote peer IP address for the linknet going towards peer_hostname."""
+        link = self.get_link_to(hostname, peer_hostname)
+        return link.peer_ip if link else None
+
+    def get_linknet_localif_mapping(self, hostname: str) -> Dict[str, str]:
+        """Return a mapping with local interface name and what peer device hostname
+        that interface is connected to."""
+        return {link.local_port: link.peer.hostname for link in self.get_links(hostname)}
+
+    def get_uplinks(self, hostname: str) -> Tuple[List[dict], List[str]]:
+        """Get local interfaces and hostnames of dist switches connected to an
+        access switch."""
+        uplinks = []
+        neighbor_hostnames = []
+        for link in self.get_links(hostname):
+            if link.peer.device_type == DeviceType.DIST and link.local_port:
+                uplinks.append({'ifname': link.local_port})
+                neighbor_hostnames.append(link.peer.hostname)
+        return uplinks, neighbor_hostnames
+
+
+class TopologyCache(object):
+    """Topology graph kept between calls in each process. Commits that
+    change linknets, or hostname or type of devices, increment a version
+    counter in redis and every process rebuilds its graph when the counter
+    has moved. If redis can't be reached the graph is rebuilt every time."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topology: Optional[Topology] = None
+        self._version: Optional[int] = None
+
+    @staticmethod
+    def _get_shared_version() -> Optional[int]:
+        try:
+            return int(get_redis_client().get(TOPOLOGY_VERSION_KEY) or 0)
+        except Exception as e:
+            get_logger().debug("Could not get topology version: {}".format(str(e)))
+            return None
+
+    def invalidate(self):
+        with self._lock:
+            self._topology = None
+            self._version = None
+        try:
+            get_redis_client().incr(TOPOLOGY_VERSION_KEY)
+        except Exception as e:
+            get_logger().debug("Could not update topology version: {}".format(str(e)))
+
+    def get(self, session=None) -> Topology:
+        # Uncommitted changes are only visible in the session that made them
+        if session is not None and session.info.get('topology_changed'):
+            return Topology.load(session)
+        version = self._get_shared_version()
+        with self._lock:
+            if self._topology is not None and version is not None and \
+                    version == self._version:
+                return self._topology
+        if session is not None:
+            topology = Topology.load(session)
+        else:
+            with sqla_session() as new_session:
+                topology = Topology.load(new_session)
+        with self._lock:
+            self._topology = topology
+            self._version = version
+        return topology
+
+
+topology_cache = TopologyCache()
+
+
+def get_topology(session=None) -> Topology:
+    """Get the topology graph, only rebuilt from the database if linknets
+    have changed.
+
+    Args:
+        session: Optional session to load the graph with, changes made in this
+                 session that are not committed yet are included
+    """
+    return topology_cache.get(session)
+
+
+def _changes_topology(obj) -> bool:
+    if isinstance(obj, Linknet):
+        return True
+    if isinstance(obj, Device):
+        state = inspect(obj)
+        return any(state.attrs[attr].history.has_changes() for attr in TOPOLOGY_DEVICE_ATTRS)
+    return False
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    if session.info.get('topology_changed'):
+        return
+    if any(isinstance(obj, (Linknet, Device)) for obj in session.deleted) or \
+            any(isinstance(obj, Linknet) for obj in session.new) or \
+            any(_changes_topology(obj) for obj in session.dirty):
+        session.info['topology_changed'] = True
+
+
+@event.listens_for(Session, 'after_bulk_update')
+def _after_bulk_update(update_context):
+    if update_context.mapper.class_ is Linknet:
+        update_context.session.info['topology_changed'] = True
+    elif update_context.mapper.class_ is Device:
+        values = getattr(update_context, 'values', None) or {}
+        names = [getattr(key, 'key', str(key)) for key in values]
+        if any(attr in names for attr in TOPOLOGY_DEVICE_ATTRS):
+            update_context.session.info['topology_changed'] = True
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+def _after_bulk_delete(delete_context):
+    if delete_context.mapper.class_ in (Linknet, Device):
+        delete_context.session.info['topology_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    if session.info.pop('topology_changed', False):
+        topology_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('topology_changed', None)
@@ -0,0 +1,86 @@
+import json
+import threading
+from typing import List, Optional
+
+from redis import StrictRedis
+from sqlalchemy import text
+
+from cnaas_nms.db.session import sqla_session, get_redis_client
+from cnaas_nms.tools.log import get_logger, WebsocketHandler
+
+
+# Max number of finished devices to read from the stream in one call
+PROGRESS_BATCH_SIZE = 500
+# Milliseconds to block waiting for new progress entries
+PROGRESS_BLOCK_MS = 1000
+# Minimum seconds between database updates while job is running
+PROGRESS_MIN_INTERVAL = 0.5
+
+
+def get_progress_key(job_id: int) -> str:
+    return 'job_progress_{}'.format(job_id)
+
+
+def report_finished_device(job_id: int, hostname: str):
+    """Report that a job has finished working on a device."""
+    get_redis_client().xadd(get_progress_key(job_id), {'hostname': hostname})
+
+
+def save_finished_devices(job_id: int, hostnames: List[str]):
+    """Append hostnames to finished_devices of a job in the database,
+    without reading and rewriting the whole list from here."""
+    with sqla_session() as session:
+        res = session.execute(
+            text("UPDATE job SET finished_devices = "
+                 "COALESCE(finished_devices, '[]'::jsonb) || CAST(:hostnames AS jsonb) "
+                 "WHERE id = :job_id"),
+            {'hostnames': json.dumps(hostnames), 'job_id': job_id}
+        )
+        if res.rowcount != 1:
+            raise ValueError("Could not find Job with ID {}".format(job_id))
+    WebsocketHandler().socketio_emit(
+        "Job #{} finished devices: {}".format(job_id, ', '.join(hostnames)),
+        rooms=[str(job_id)]
+    )
+
+
+def update_device_progress(db: StrictRedis, job_id: int, last_id: bytes,
+                           block: Optional[int] = None) -> bytes:
+    """Read new entries from the progress stream of a job and save them.
+
+    Returns:
+        ID of the last stream entry read
+    """
+    hostnames = []
+    resp = db.xread({get_progress_key(job_id): last_id},
+                    count=PROGRESS_BATCH_SIZE, block=block)
+    for _, entries in resp or []:
+        for entry_id, fields in entries:
+            last_id = entry_id
+            hostnames.append(fields[b'hostname'].decode('utf-8'))
+    if hostnames:
+        save_finished_devices(job_id, hostnames)
+    return last_id
+
+
+def update_device_progress_thread(stop_event: threading.Event, job_id: int):
+    logger = get_logger()
+    db = get_redis_client()
+    last_id = b'0'
+    try:
+        while not stop_event.is_set():
+            prev_id = last_id
+            last_id = update_device_progress(db, job_id, last_id, block=PROGRESS_BLOCK_MS)
+            if last_id != prev_id:
+                # Let more devices finish before next database update
+                stop_event.wait(PROGRESS_MIN_INTERVAL)
+        # Read everything left in the stream before exiting thread
+        while True:
+            prev_id = last_id
+            last_id = update_device_progress(db, job_id, last_id)
+            if last_id == prev_id:
+                break
+    except Exception as e:
+        logger.exception("Error updating progress for job #{}: {}".format(job_id, str(e)))
+    finally:
+        db.delete(get_progress_key(job_id))
@@ -0,0 +1,194 @@
+import errno
+import selectors
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from cnaas_nms.scheduler.scheduler import Scheduler, SingletonType
+from cnaas_nms.tools.log import get_logger
+
+
+# TCP port used by NAPALM to manage each platform
+MANAGEMENT_PORTS = {
+    'eos': 443,
+    'junos': 830,
+}
+DEFAULT_MANAGEMENT_PORT = 22
+# Seconds between connect attempts to a device that doesn't answer
+PROBE_INTERVAL = 5
+# Seconds to wait for a TCP connect to finish
+PROBE_CONNECT_TIMEOUT = 3
+# Seconds to wait before first probe, gives devices time to apply config
+PROBE_MIN_DELAY = 10
+# Max seconds for the prober thread to sleep between checks
+PROBE_TICK = 1.0
+
+
+def get_management_port(platform: str, port: Optional[int] = None) -> int:
+    """Get TCP port to probe for a device, port is the optional port
+    override saved for the device."""
+    if port and isinstance(port, int):
+        return port
+    return MANAGEMENT_PORTS.get(platform, DEFAULT_MANAGEMENT_PORT)
+
+
+@dataclass
+class ProbeTarget:
+    job_id: int
+    deadline: float
+    next_probe: float
+    # Addresses that have not answered yet
+    waiting: List[Tuple[str, int]] = field(default_factory=list)
+    probing: int = 0
+
+
+class ReachabilityProber(object, metaclass=SingletonType):
+    """Start jobs that connect to devices using NAPALM as soon as the
+    devices answer on their management port.
+
+    The job is scheduled in the persistent jobstore to run when the timeout
+    expires, so that it still runs and can register the failure if the
+    devices never answer or the process is restarted. Non-blocking TCP
+    connects to all watched devices are multiplexed in a single thread, and
+    when all devices of a watch answer the job is moved forward to start
+    right away."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._targets: List[ProbeTarget] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, func: str, addresses: List[Tuple[str, int]], timeout: int,
+              scheduled_by: Optional[str], kwargs: dict,
+              min_delay: int = PROBE_MIN_DELAY) -> int:
+        """Schedule job func to start once all addresses accept TCP
+        connections, or when timeout expires.
+
+        Args:
+            func: The function to call, same as for Scheduler.add_onetime_job
+            addresses: List of (ip, port) tuples to wait for
+            timeout: Seconds until job is started even if devices don't answer
+            scheduled_by: Username to start the job as
+            kwargs: Arguments to pass through to called function
+            min_delay: Seconds to wait before first probe
+
+        Returns:
+            int: job_id of the job that will be started
+        """
+        timeout = max(timeout, min_delay)
+        job_id = Scheduler().add_onetime_job(func, when=timeout, scheduled_by=scheduled_by,
+                                             kwargs=kwargs)
+        now = time.monotonic()
+        target = ProbeTarget(
+            job_id=job_id,
+            deadline=now + timeout,
+            next_probe=now + min_delay,
+            waiting=list(set(addresses))
+        )
+        with self._lock:
+            self._targets.append(target)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name='reachability_prober',
+                                                daemon=True)
+                self._thread.start()
+        return job_id
+
+    def _finish_target(self, target: ProbeTarget):
+        logger = get_logger()
+        if target.waiting:
+            logger.info("Devices {} did not answer before timeout, job #{} starts as "
+                        "scheduled".format(target.waiting, target.job_id))
+            return
+        try:
+            if Scheduler().run_job_now(target.job_id):
+                logger.debug("Devices answered, starting job #{} now".format(target.job_id))
+        except Exception as e:
+            logger.exception("Could not start job #{} from prober: {}".format(
+                target.job_id, str(e)))
+
+    @staticmethod
+    def _connect(selector: selectors.BaseSelector, target: ProbeTarget,
+                 address: Tuple[str, int], now: float) -> bool:
+        """Start a non-blocking connect to address.
+
+        Returns:
+            False if connect failed immediately
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        err = sock.connect_ex(address)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            return False
+        selector.register(sock, selectors.EVENT_WRITE, (target, address, now))
+        target.probing += 1
+        return True
+
+    @staticmethod
+    def _finish_connect(selector: selectors.BaseSelector, sock: socket.socket) -> bool:
+        target, address, _ = selector.get_key(sock).data
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        selector.unregister(sock)
+        sock.close()
+        target.probing -= 1
+        if err == 0 and address in target.waiting:
+            target.waiting.remove(address)
+        return err == 0
+
+    def _run(self):
+        logger = get_logger()
+        selector = selectors.DefaultSelector()
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                if not self._targets and not selector.get_map():
+                    self._thread = None
+                    break
+                targets = list(self._targets)
+            # Start new connection attempts for targets that are due
+            for target in targets:
+                if target.probing or target.next_probe > now:
+                    continue
+                for address in list(target.waiting):
+                    if not self._connect(selector, target, address, now):
+                        logger.debug("Could not connect to {}".format(address))
+                target.next_probe = now + PROBE_INTERVAL
+
+            timeout = PROBE_TICK
+            if selector.get_map():
+                for key, _ in selector.select(timeout=timeout):
+                    self._finish_connect(selector, key.fileobj)
+            else:
+                time.sleep(timeout)
+
+            now = time.monotonic()
+            # Give up on connects that didn't finish in time
+            for key in list(selector.get_map().values()):
+                target, address, started = key.data
+                if now - started > PROBE_CONNECT_TIMEOUT:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    target.probing -= 1
+            # Start jobs for targets that are reachable, stop watching
+            # targets that are out of time
+            finished = []
+            with self._lock:
+                for target in list(self._targets):
+                    if target.probing:
+                        continue
+                    if not target.waiting or now >= target.deadline:
+                        self._targets.remove(target)
+                        finished.append(target)
+            for target in finished:
+                self._finish_target(target)
+        selector.close()
+
+
+def watch_devices(func: str, addresses: List[Tuple[str, int]], timeout: int,
+                  scheduled_by: Optional[str], kwargs: dict,
+                  min_delay: int = PROBE_MIN_DELAY) -> int:
+    """Start job func once all addresses accept TCP connections, see
+    ReachabilityProber.watch."""
+    return ReachabilityProber().watch(func, addresses, timeout, scheduled_by, kwargs,
+                                      min_delay=min_delay)
@@ -11,6 +11,7 @@ from apscheduler.schedulers.background import BackgroundScheduler, BlockingSched
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.base import JobLookupError
 
 from cnaas_nms.db.session import sqla_session, get_sqlalchemy_conn_str
 from cnaas_nms.db.job import Job, JobStatus
@@ -165,3 +166,19 @@ class Scheduler(object, metaclass=SingletonType):
                                     id=str(job_id),
                                     run_date=run_date)
             return job_id
+
+    def run_job_now(self, job_id: int) -> bool:
+        """Move the start time of a scheduled job that has not started yet
+        to now.
+
+        Returns:
+            False if the job was not found or can't be modified from this
+            process, it will then start at the time it was scheduled for
+        """
+        if not self._scheduler:
+            return False
+        try:
+            self._scheduler.modify_job(str(job_id), next_run_time=datetime.datetime.now(utc))
+        except JobLookupError:
+            return False
+        return True
@@ -0,0 +1,42 @@
+import unittest
+import selectors
+import socket
+import time
+
+from cnaas_nms.scheduler.prober import ReachabilityProber, ProbeTarget, get_management_port
+
+
+class ProberTests(unittest.TestCase):
+    def test_management_port(self):
+        self.assertEqual(get_management_port('eos'), 443)
+        self.assertEqual(get_management_port('junos'), 830)
+        self.assertEqual(get_management_port('ios'), 22)
+        self.assertEqual(get_management_port('eos', 8443), 8443)
+
+    def test_probe_listening_port(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        address = listener.getsockname()
+        # Find a port that is not listening by closing a bound socket
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(('127.0.0.1', 0))
+        closed_address = closed.getsockname()
+        closed.close()
+
+        now = time.monotonic()
+        target = ProbeTarget(job_id=1, deadline=now + 10, next_probe=now,
+                             waiting=[address, closed_address])
+        selector = selectors.DefaultSelector()
+        for addr in list(target.waiting):
+            ReachabilityProber._connect(selector, target, addr, now)
+        while target.probing:
+            for key, _ in selector.select(timeout=1):
+                ReachabilityProber._finish_connect(selector, key.fileobj)
+        selector.close()
+        listener.close()
+        self.assertEqual(target.waiting, [closed_address])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,9 +6,9 @@ from typing import Optional
 from cnaas_nms.db.job import Job
 from cnaas_nms.scheduler.jobresult import JobResult
 from cnaas_nms.tools.log import get_logger
-from cnaas_nms.db.session import redis_session
 from cnaas_nms.db.session import sqla_session
 from cnaas_nms.scheduler.thread_data import thread_data, set_thread_data
+from cnaas_nms.scheduler.jobprogress import update_device_progress_thread
 
 
 logger = get_logger()
@@ -26,28 +26,6 @@ def insert_job_id(result: JobResult, job_id: int) -> JobResult:
     return result
 
 
-def update_device_progress(job_id: int):
-    new_finished_devices = []
-    with redis_session() as db:
-        while db.llen('finished_devices_' + str(job_id)) != 0:
-            last_finished = db.lpop('finished_devices_' + str(job_id)).decode('utf-8')
-            new_finished_devices.append(last_finished)
-
-    if new_finished_devices:
-        with sqla_session() as session:
-            job = session.query(Job).filter(Job.id == job_id).one_or_none()
-            if not job:
-                raise ValueError("Could not find Job with ID {}".format(job_id))
-            finished_devices = job.finished_devices + new_finished_devices
-            job.finished_devices = finished_devices
-
-
-def update_device_progress_thread(stop_event: threading.Event, job_id: int):
-    while not stop_event.wait(2):
-        update_device_progress(job_id)
-    update_device_progress(job_id)  # update one last time before exiting thread
-
-
 def job_wrapper(func):
     """Decorator to save job status in job tracker database."""
     def wrapper(job_id: int, scheduled_by: str, *args, **kwargs):
@@ -105,5 +83,7 @@ def job_wrapper(func):
                     raise ValueError(errmsg)
                 job.finish_success(res, find_nextjob(res))
                 session.commit()
+            with sqla_session() as session:
+                Job.maintain_results(session)
             return res
     return wrapper
@@ -0,0 +1,52 @@
+import os
+from typing import Optional
+
+from git import Repo
+from git import InvalidGitRepositoryError, NoSuchPathError
+
+
+def _read_ref(git_dir: str, ref: str) -> Optional[str]:
+    try:
+        with open(os.path.join(git_dir, ref), 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        pass
+    # Refs can be moved to packed-refs by git gc
+    try:
+        with open(os.path.join(git_dir, 'packed-refs'), 'r') as f:
+            for line in f:
+                if line.startswith('#') or line.startswith('^'):
+                    continue
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def get_repo_commit(local_repo_path: str) -> Optional[str]:
+    """Return hexsha of the currently checked out commit in a local
+    repository, or None if the repository is not cloned yet.
+
+    HEAD is read directly from the files in the .git directory, this is
+    called for every cache lookup so it must not start any git processes."""
+    git_dir = os.path.join(local_repo_path, '.git')
+    if not os.path.isdir(git_dir):
+        if not os.path.exists(git_dir):
+            return None
+        # .git is a file pointing to the real git directory, let GitPython
+        # handle the uncommon repository layouts
+        try:
+            return Repo(local_repo_path).head.commit.hexsha
+        except (InvalidGitRepositoryError, NoSuchPathError, ValueError):
+            return None
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+            head = f.read().strip()
+    except FileNotFoundError:
+        return None
+    if head.startswith('ref:'):
+        return _read_ref(git_dir, head[4:].strip())
+    # Detached HEAD
+    return head or None